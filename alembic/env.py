@@ -12,6 +12,13 @@ from app.db.base_class import Base
 from app.models.receipt import Receipt
 from app.models.user import User
 from app.models.product import Product
+from app.models.ingest_job import IngestJob
+from app.models.idempotency_key import IdempotencyKey
+from app.models.receipt_counter import ReceiptCounter
+from app.models.receipt_daily_stat import ReceiptDailyStat
+from app.models.product_daily_tally import ProductDailyTally
+from app.models.archived_receipt import ArchivedReceipt
+from app.models.receipt_render import ReceiptRender
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -67,6 +74,17 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # Callers such as tests may hand over an open connection via Config.attributes.
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(
+            connection=connection, target_metadata=target_metadata
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
@@ -0,0 +1,46 @@
+"""Archived receipts
+
+Revision ID: 0c6e9b3d7a21
+Revises: 5f8a2c7e13d9
+Create Date: 2026-10-18 19:40:03.517822
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c6e9b3d7a21'
+down_revision: Union[str, None] = '5f8a2c7e13d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('archived_receipts',
+    sa.Column('receipt_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('segment', sa.String(), nullable=False),
+    sa.Column('offset', sa.BigInteger(), nullable=False),
+    sa.Column('length', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('receipt_id')
+    )
+    op.create_index(op.f('ix_archived_receipts_user_id'), 'archived_receipts', ['user_id'], unique=False)
+
+    # Archiving deletes receipts from the top of the id range too; without AUTOINCREMENT SQLite
+    # would reuse those ids for new receipts. Postgres sequences never do.
+    if op.get_bind().dialect.name == "sqlite":
+        with op.batch_alter_table('receipts', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        with op.batch_alter_table('receipts', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
+    op.drop_index(op.f('ix_archived_receipts_user_id'), table_name='archived_receipts')
+    op.drop_table('archived_receipts')
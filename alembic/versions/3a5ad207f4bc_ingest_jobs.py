@@ -0,0 +1,38 @@
+"""Ingest jobs
+
+Revision ID: 3a5ad207f4bc
+Revises: be55a0098851
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a5ad207f4bc'
+down_revision: Union[str, None] = 'be55a0098851'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ingest_jobs',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('lines_committed', sa.Integer(), nullable=True),
+    sa.Column('receipts_inserted', sa.Integer(), nullable=True),
+    sa.Column('receipts_failed', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ingest_jobs_id'), 'ingest_jobs', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ingest_jobs_id'), table_name='ingest_jobs')
+    op.drop_table('ingest_jobs')
@@ -0,0 +1,38 @@
+"""Receipt counters
+
+Revision ID: 4c1845fe9325
+Revises: 679104abafc8
+Create Date: 2026-10-18 12:41:09.552170
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1845fe9325'
+down_revision: Union[str, None] = '679104abafc8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('receipt_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('payment_type', sa.String(), nullable=False),
+    sa.Column('receipt_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'payment_type')
+    )
+    op.execute(
+        "INSERT INTO receipt_counters (user_id, payment_type, receipt_count) "
+        "SELECT user_id, payment_type, count(*) FROM receipts "
+        "WHERE user_id IS NOT NULL AND payment_type IS NOT NULL "
+        "GROUP BY user_id, payment_type"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('receipt_counters')
@@ -0,0 +1,191 @@
+"""Partition receipts and products by month
+
+Revision ID: 5f8a2c7e13d9
+Revises: e41a7c5d92b8
+Create Date: 2026-10-18 18:12:50.271934
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.db.partitions import add_months, ensure_partitions, month_start
+from app.main.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f8a2c7e13d9'
+down_revision: Union[str, None] = 'e41a7c5d92b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Indexes of the unpartitioned tables, recreated on the partitioned parents.
+RECEIPT_INDEXES = [
+    ('ix_receipts_id', ['id']),
+    ('ix_receipts_user_id_created_at', ['user_id', 'created_at', 'id']),
+    ('ix_receipts_user_id_total', ['user_id', 'total', 'id']),
+    ('ix_receipts_user_id_payment_type', ['user_id', 'payment_type', 'created_at', 'id']),
+]
+PRODUCT_INDEXES = [
+    ('ix_products_id', ['id']),
+    ('ix_products_name', ['name']),
+    ('ix_products_receipt_id', ['receipt_id']),
+]
+
+RECEIPT_COLUMNS = "id, user_id, created_at, total, payment_type, payment_amount, rest"
+PRODUCT_COLUMNS = "id, name, price, quantity, receipt_id, receipt_created_at"
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('receipt_created_at', sa.DateTime(), nullable=True))
+    op.execute(
+        "UPDATE products SET receipt_created_at = "
+        "(SELECT receipts.created_at FROM receipts WHERE receipts.id = products.receipt_id)"
+    )
+
+    # Only Postgres supports declarative partitioning; other databases just gain the column,
+    # NOT NULL like on the partitioned table.
+    if op.get_bind().dialect.name != "postgresql":
+        op.get_bind().execute(
+            sa.text("UPDATE products SET receipt_created_at = :now WHERE receipt_created_at IS NULL"),
+            {"now": datetime.utcnow()}
+        )
+        with op.batch_alter_table('products') as batch_op:
+            batch_op.alter_column('receipt_created_at', existing_type=sa.DateTime(), nullable=False)
+        return
+
+    # The partition key cannot be NULL outside the default partition; such rows only come from
+    # inserts that bypassed the application.
+    op.execute("UPDATE receipts SET created_at = now() AT TIME ZONE 'utc' WHERE created_at IS NULL")
+    op.execute(
+        "UPDATE products SET receipt_created_at = coalesce("
+        "(SELECT receipts.created_at FROM receipts WHERE receipts.id = products.receipt_id), "
+        "now() AT TIME ZONE 'utc') WHERE receipt_created_at IS NULL"
+    )
+
+    # Foreign keys must reference the whole (id, created_at) key of a partitioned table.
+    op.drop_constraint('idempotency_keys_receipt_id_fkey', 'idempotency_keys', type_='foreignkey')
+    op.drop_constraint('products_receipt_id_fkey', 'products', type_='foreignkey')
+
+    _detach_unpartitioned()
+
+    op.execute(
+        "CREATE TABLE receipts ("
+        "id INTEGER NOT NULL DEFAULT nextval('receipts_id_seq'), "
+        "user_id INTEGER, "
+        "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "total DOUBLE PRECISION, "
+        "payment_type VARCHAR, "
+        "payment_amount DOUBLE PRECISION, "
+        "rest DOUBLE PRECISION, "
+        "CONSTRAINT receipts_pkey PRIMARY KEY (id, created_at), "
+        "CONSTRAINT receipts_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id)"
+        ") PARTITION BY RANGE (created_at)"
+    )
+    op.execute(
+        "CREATE TABLE products ("
+        "id INTEGER NOT NULL DEFAULT nextval('products_id_seq'), "
+        "name VARCHAR, "
+        "price DOUBLE PRECISION, "
+        "quantity INTEGER, "
+        "receipt_id INTEGER, "
+        "receipt_created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "CONSTRAINT products_pkey PRIMARY KEY (id, receipt_created_at)"
+        ") PARTITION BY RANGE (receipt_created_at)"
+    )
+    op.execute("CREATE TABLE receipts_default PARTITION OF receipts DEFAULT")
+    op.execute("CREATE TABLE products_default PARTITION OF products DEFAULT")
+
+    bind = op.get_bind()
+    current = month_start(datetime.utcnow().date())
+    first = bind.execute(sa.text("SELECT min(created_at) FROM receipts_unpartitioned")).scalar()
+    ensure_partitions(
+        bind, month_start(first.date()) if first else current, add_months(current, settings.PARTITION_MONTHS_AHEAD)
+    )
+
+    op.execute(f"INSERT INTO receipts ({RECEIPT_COLUMNS}) SELECT {RECEIPT_COLUMNS} FROM receipts_unpartitioned")
+    op.execute(f"INSERT INTO products ({PRODUCT_COLUMNS}) SELECT {PRODUCT_COLUMNS} FROM products_unpartitioned")
+
+    # Indexes on the parents cascade to every current and future partition.
+    for name, columns in RECEIPT_INDEXES:
+        op.create_index(name, 'receipts', columns, unique=False)
+    for name, columns in PRODUCT_INDEXES:
+        op.create_index(name, 'products', columns, unique=False)
+    op.create_index('ix_products_name_trgm', 'products', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+    op.create_foreign_key(
+        'products_receipt_id_fkey', 'products', 'receipts',
+        ['receipt_id', 'receipt_created_at'], ['id', 'created_at']
+    )
+    op.execute("ALTER SEQUENCE receipts_id_seq OWNED BY receipts.id")
+    op.execute("ALTER SEQUENCE products_id_seq OWNED BY products.id")
+
+    op.drop_table('products_unpartitioned')
+    op.drop_table('receipts_unpartitioned')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        op.drop_column('products', 'receipt_created_at')
+        return
+
+    op.drop_constraint('products_receipt_id_fkey', 'products', type_='foreignkey')
+    _detach_unpartitioned()
+
+    op.create_table('receipts',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('receipts_id_seq')"), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('total', sa.Float(), nullable=True),
+    sa.Column('payment_type', sa.String(), nullable=True),
+    sa.Column('payment_amount', sa.Float(), nullable=True),
+    sa.Column('rest', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='receipts_user_id_fkey'),
+    sa.PrimaryKeyConstraint('id', name='receipts_pkey')
+    )
+    op.create_table('products',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('products_id_seq')"), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('price', sa.Float(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=True),
+    sa.Column('receipt_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['receipt_id'], ['receipts.id'], name='products_receipt_id_fkey'),
+    sa.PrimaryKeyConstraint('id', name='products_pkey')
+    )
+
+    op.execute(f"INSERT INTO receipts ({RECEIPT_COLUMNS}) SELECT {RECEIPT_COLUMNS} FROM receipts_unpartitioned")
+    op.execute(
+        "INSERT INTO products (id, name, price, quantity, receipt_id) "
+        "SELECT id, name, price, quantity, receipt_id FROM products_unpartitioned"
+    )
+
+    for name, columns in RECEIPT_INDEXES:
+        op.create_index(name, 'receipts', columns, unique=False)
+    for name, columns in PRODUCT_INDEXES:
+        op.create_index(name, 'products', columns, unique=False)
+    op.create_index('ix_products_name_trgm', 'products', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+    op.create_foreign_key('idempotency_keys_receipt_id_fkey', 'idempotency_keys', 'receipts', ['receipt_id'], ['id'])
+    op.execute("ALTER SEQUENCE receipts_id_seq OWNED BY receipts.id")
+    op.execute("ALTER SEQUENCE products_id_seq OWNED BY products.id")
+
+    # Dropping the partitioned parents drops their partitions too.
+    op.drop_table('products_unpartitioned')
+    op.drop_table('receipts_unpartitioned')
+
+
+def _detach_unpartitioned() -> None:
+    """Rename the current tables out of the way, freeing their index, constraint and sequence names."""
+    for table in ('receipts', 'products'):
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+        op.execute(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey")
+    for name, _ in RECEIPT_INDEXES:
+        op.drop_index(name, table_name='receipts_unpartitioned', if_exists=True)
+    for name, _ in PRODUCT_INDEXES + [('ix_products_name_trgm', None)]:
+        op.drop_index(name, table_name='products_unpartitioned', if_exists=True)
@@ -0,0 +1,40 @@
+"""Receipt query indexes
+
+Revision ID: 679104abafc8
+Revises: 40a990046477
+Create Date: 2026-10-18 11:26:52.317904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '679104abafc8'
+down_revision: Union[str, None] = '40a990046477'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_receipts_user_id_created_at', 'receipts', ['user_id', 'created_at', 'id']),
+    ('ix_receipts_user_id_total', 'receipts', ['user_id', 'total', 'id']),
+    ('ix_receipts_user_id_payment_type', 'receipts', ['user_id', 'payment_type', 'created_at', 'id']),
+    ('ix_products_receipt_id', 'products', ['receipt_id']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
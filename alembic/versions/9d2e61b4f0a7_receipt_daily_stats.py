@@ -0,0 +1,40 @@
+"""Receipt daily stats
+
+Revision ID: 9d2e61b4f0a7
+Revises: 4c1845fe9325
+Create Date: 2026-10-18 15:02:37.118406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2e61b4f0a7'
+down_revision: Union[str, None] = '4c1845fe9325'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('receipt_daily_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('payment_type', sa.String(), nullable=False),
+    sa.Column('receipt_count', sa.Integer(), nullable=False),
+    sa.Column('total_sum', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'payment_type')
+    )
+    op.execute(
+        "INSERT INTO receipt_daily_stats (user_id, day, payment_type, receipt_count, total_sum) "
+        "SELECT user_id, date(created_at), payment_type, count(*), coalesce(sum(total), 0) FROM receipts "
+        "WHERE user_id IS NOT NULL AND payment_type IS NOT NULL AND created_at IS NOT NULL "
+        "GROUP BY user_id, date(created_at), payment_type"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('receipt_daily_stats')
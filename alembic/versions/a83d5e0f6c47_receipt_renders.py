@@ -0,0 +1,30 @@
+"""Receipt renders
+
+Revision ID: a83d5e0f6c47
+Revises: 0c6e9b3d7a21
+Create Date: 2026-10-18 20:21:36.104857
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a83d5e0f6c47'
+down_revision: Union[str, None] = '0c6e9b3d7a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('receipt_renders',
+    sa.Column('receipt_id', sa.Integer(), nullable=False),
+    sa.Column('compressed_text', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('receipt_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('receipt_renders')
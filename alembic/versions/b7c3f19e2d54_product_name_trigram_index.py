@@ -0,0 +1,40 @@
+"""Product name trigram index
+
+Revision ID: b7c3f19e2d54
+Revises: 9d2e61b4f0a7
+Create Date: 2026-10-18 16:20:44.905311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c3f19e2d54'
+down_revision: Union[str, None] = '9d2e61b4f0a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite has no trigram index; its product_name search falls back to the receipt_id index.
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_products_name_trgm', 'products', ['name'], unique=False, if_not_exists=True,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_products_name_trgm', table_name='products', if_exists=True,
+                      postgresql_concurrently=True)
@@ -0,0 +1,37 @@
+"""Product daily tallies
+
+Revision ID: e41a7c5d92b8
+Revises: b7c3f19e2d54
+Create Date: 2026-10-18 17:05:12.640218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41a7c5d92b8'
+down_revision: Union[str, None] = 'b7c3f19e2d54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Product names are normalized in Python, so existing receipts are backfilled with
+    # `python -m app.main.cli rebuild-product-tallies` rather than in SQL here.
+    op.create_table('product_daily_tallies',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_key', sa.String(), nullable=False),
+    sa.Column('product_name', sa.String(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'product_key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('product_daily_tallies')
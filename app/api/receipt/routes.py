@@ -1,14 +1,27 @@
-from fastapi import APIRouter, Depends
+from functools import partial
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 
-from app.main.utils import get_current_auth_user
+from app.main.encoders import FastJSONResponse
+from app.main.utils import get_current_auth_user, get_user_read_db, receipt_etag, etag_matches
+from app.main.config import settings
+from app.main.render import DEFAULT_LINE_LENGTH, LAYOUTS, RENDER_VERSION
+from app.main.snapshots import Snapshot
 from app.models.user import User
-from app.schemas.receipt import (ReceiptCreate, ReceiptCreatingResponse, ReceiptResponse, ReceiptFilterParams,
-                                 PaginationParams)
-from app.db.session import get_db
-from typing import List
-from fastapi.responses import PlainTextResponse
+from app.schemas.receipt import (ReceiptCreate, ReceiptCreatingResponse, ReceiptPartialResponse, ReceiptFilterParams,
+                                 PaginationParams, ReceiptBatchItemResult, CursorParams, ReceiptFieldsParams,
+                                 ReceiptRenderRequest)
+from app.db.session import get_db, get_read_db, get_replica_router, ReplicaRouter
+from typing import Any, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from app.crud.receipt import crud_receipt
+from app.crud.ingest import crud_ingest
+from app.crud.idempotency import crud_idempotency
+from app.crud.receipt_stats import crud_receipt_stats
+from app.schemas.ingest import IngestSummary
+from app.schemas.receipt_stats import ReceiptStatsParams, ReceiptStatsBucket, TopProductsParams, TopProduct
 
 
 router = APIRouter()
@@ -17,31 +30,201 @@ router = APIRouter()
 @router.post("/", response_model=ReceiptCreatingResponse)
 def create_receipt(
     receipt_id: ReceiptCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_auth_user)
+    user: User = Depends(get_current_auth_user),
+    replica_router: ReplicaRouter = Depends(get_replica_router)
 ):
-    return crud_receipt.create_receipt(db, receipt_id, user.id)
+    if idempotency_key:
+        replay = crud_idempotency.replay(db, user.id, idempotency_key, receipt_id)
+        if replay:
+            return FastJSONResponse(replay, headers={"Idempotent-Replayed": "true"})
+    receipt = crud_receipt.create_receipt(db, receipt_id, user.id, idempotency_key)
+    response = FastJSONResponse(receipt)
+    replica_router.record_write(user.id, response)
+    return response
 
 
-@router.get("/", response_model=List[ReceiptResponse])
-def get_receipts(
+@router.post("/batch", response_model=List[ReceiptBatchItemResult])
+def create_receipts_batch(
+    response: Response,
+    receipts: List[Any] = Body(..., description="List of ReceiptCreate payloads"),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_auth_user),
+    replica_router: ReplicaRouter = Depends(get_replica_router)
+):
+    results = crud_receipt.create_receipts_batch(db, receipts, user.id)
+    replica_router.record_write(user.id, response)
+    return results
+
+
+@router.post("/ingest", response_model=IngestSummary)
+async def ingest_receipts(
+    request: Request,
+    response: Response,
+    job_id: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_auth_user),
+    replica_router: ReplicaRouter = Depends(get_replica_router)
+):
+    """Stream newline-delimited ReceiptCreate JSON; pass `job_id` to resume an interrupted upload."""
+    run = await run_in_threadpool(crud_ingest.start, db, user.id, job_id, chunk_size)
+    try:
+        return await crud_ingest.ingest_stream(db, run, request.stream())
+    finally:
+        replica_router.record_write(user.id, response)
+
+
+@router.post("/render")
+def render_receipts(
+    render_in: ReceiptRenderRequest,
+    db: Session = Depends(get_user_read_db),
+    user: User = Depends(get_current_auth_user),
+):
+    """Render many of the user's receipts for printing, as one text document (pages split by form feeds) or a zip."""
+    rendered = crud_receipt.render_public_receipts(db, user, render_in.receipt_ids, render_in.line_length)
+    extension = "txt" if render_in.output == "text" else render_in.output
+    return StreamingResponse(
+        crud_receipt.render_document(rendered, render_in.output),
+        media_type=crud_receipt.RENDER_OUTPUTS[render_in.output],
+        headers={"Content-Disposition": f"attachment; filename=receipts.{extension}"}
+    )
+
+
+@router.get("/", response_model=List[ReceiptPartialResponse], response_model_exclude_unset=True)
+def get_receipts(
+    db: Session = Depends(get_user_read_db),
+    user: User = Depends(get_current_auth_user),
     filters: ReceiptFilterParams = Depends(),
     pagination: PaginationParams = Depends(),
+    cursor_params: CursorParams = Depends(),
+    fields: ReceiptFieldsParams = Depends(),
+):
+    receipts, next_cursor = crud_receipt.get_receipts(db, user.id, filters, pagination, cursor_params, fields)
+
+    headers = {"X-Has-More": "true" if next_cursor else "false"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+
+    if pagination.with_count:
+        total_count, exact = crud_receipt.count_receipts(db, user.id, filters)
+        headers["X-Total-Count"] = str(total_count)
+        headers["X-Total-Count-Exact"] = "true" if exact else "false"
+    return FastJSONResponse(receipts, headers=headers)
+
+
+@router.get("/stats", response_model=List[ReceiptStatsBucket])
+def get_receipt_stats(
+    db: Session = Depends(get_user_read_db),
+    user: User = Depends(get_current_auth_user),
+    params: ReceiptStatsParams = Depends(),
+):
+    """Receipt count, totals and average basket per day/week/month, split by payment type."""
+    return crud_receipt_stats.get_stats(db, user.id, params)
+
+
+@router.get("/top-products", response_model=List[TopProduct])
+def get_top_products(
+    db: Session = Depends(get_user_read_db),
+    user: User = Depends(get_current_auth_user),
+    params: TopProductsParams = Depends(),
 ):
-    return crud_receipt.get_receipts(db, user.id, filters, pagination)
+    """Best-selling products by quantity or revenue; names are grouped case- and whitespace-insensitively."""
+    return crud_receipt_stats.top_products(db, user.id, params)
+
+
+@router.get("/export")
+def export_receipts(
+    export_format: str = Query("csv", alias="format"),
+    user: User = Depends(get_current_auth_user),
+    filters: ReceiptFilterParams = Depends(),
+    replica_router: ReplicaRouter = Depends(get_replica_router),
+):
+    media_type = crud_receipt.EXPORT_FORMATS.get(export_format)
+    if media_type is None:
+        raise HTTPException(status_code=400, detail="Export format must be 'csv' or 'ndjson'")
+
+    return StreamingResponse(
+        crud_receipt.export_receipts(partial(replica_router.read_session, user.id), user.id, filters, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=receipts.{export_format}"}
+    )
 
 
-@router.get("/{receipt_id}", response_model=ReceiptResponse)
+@router.get("/{receipt_id}", response_model=ReceiptPartialResponse, response_model_exclude_unset=True)
 def get_receipt_by_id(
     receipt_id: int,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_auth_user)
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_user_read_db),
+    user: User = Depends(get_current_auth_user),
+    fields: ReceiptFieldsParams = Depends(),
 ):
-    return crud_receipt.get_receipt_by_id(db, receipt_id, user.id)
+    version = crud_receipt.get_receipt_version(db, receipt_id)
+    if version is None or version.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Receipt not found")
+
+    headers = {
+        "ETag": receipt_etag(receipt_id, version.created_at, fields.variant),
+        "Cache-Control": "private, no-cache",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    return FastJSONResponse(crud_receipt.get_receipt_by_id(db, receipt_id, user.id, fields), headers=headers)
 
 
 @router.get("/public/{receipt_id}")
-def get_public_receipt(receipt_id: int, line_length: int = 40, db: Session = Depends(get_db)):
-    return PlainTextResponse(content=crud_receipt.get_public_receipt(db, receipt_id, line_length))
+def get_public_receipt(
+    receipt_id: int,
+    line_length: int = DEFAULT_LINE_LENGTH,
+    output_format: str = Query("text", alias="format"),
+    stream: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+    primary_db: Session = Depends(get_db),
+    replica_router: ReplicaRouter = Depends(get_replica_router)
+):
+    """The receipt as fixed-width text, ESC/POS printer bytes, HTML or PDF.
+
+    With `stream=true` the body is sent while the products are read, so very large receipts
+    start arriving at once and never sit in memory whole. With RECEIPT_SNAPSHOT_DIR set, other
+    renders are written to disk once and served from the file.
+    """
+    crud_receipt.validate_line_length(line_length)
+    layout = LAYOUTS.get(output_format)
+    if layout is None:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(LAYOUTS)}")
+    if stream and layout.encode is None:
+        raise HTTPException(status_code=400, detail=f"Format '{output_format}' cannot be streamed")
+    version = crud_receipt.get_receipt_version(db, receipt_id)
+    if version is None:
+        # The replica may lag behind a receipt created moments ago.
+        db = primary_db
+        version = crud_receipt.get_receipt_version(db, receipt_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Receipt not found")
+
+    headers = {
+        "ETag": receipt_etag(receipt_id, version.created_at, f"{output_format}:{line_length}:{RENDER_VERSION}"),
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if stream:
+        session_factory = replica_router.write_session if db is primary_db else replica_router.read_session
+        return StreamingResponse(
+            crud_receipt.stream_public_receipt(db, session_factory, receipt_id, line_length, output_format),
+            media_type=layout.media_type,
+            headers=headers
+        )
+
+    if settings.RECEIPT_SNAPSHOT_DIR is not None:
+        content = crud_receipt.get_public_snapshot(db, receipt_id, line_length, output_format)
+        if isinstance(content, Snapshot):
+            return FileResponse(content.path, media_type=layout.media_type, headers=headers, stat_result=content.stat)
+    else:
+        content = crud_receipt.get_public_receipt(db, receipt_id, line_length, output_format)
+
+    return Response(content=content, media_type=layout.media_type, headers=headers)
@@ -0,0 +1,173 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+import orjson
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.db.partitions import drop_empty_partitions, month_start
+from app.main.config import settings
+from app.main.segments import SegmentStore
+from app.models.archived_receipt import ArchivedReceipt
+from app.models.product import Product
+from app.models.receipt import Receipt
+from app.models.receipt_counter import ReceiptCounter
+
+
+class CRUDArchive:
+    """Moves old receipts and their products from the hot tables into compressed segment files.
+
+    Each receipt becomes one record in an append-only segment under ARCHIVE_DIR,
+    and archived_receipts maps its id to (segment, offset, length), so reading
+    an archived receipt costs one indexed lookup and one positioned file read.
+    Listings, counts and exports only cover the hot tables; single-receipt
+    reads fall back to the archive. The daily stats and product tallies keep
+    counting archived receipts, and rebuilding them leaves archived days alone
+    (see first_rebuilt_day).
+    """
+    BATCH_SIZE = 1000
+
+    @property
+    def store(self) -> SegmentStore:
+        return SegmentStore(settings.ARCHIVE_DIR, settings.ARCHIVE_SEGMENT_MAX_BYTES)
+
+    def cutoff(self, older_than_days: Optional[int] = None) -> datetime:
+        if older_than_days is None:
+            older_than_days = settings.ARCHIVE_AFTER_DAYS
+        return datetime.utcnow() - timedelta(days=older_than_days)
+
+    def archive_receipts(self, db: Session, older_than: datetime, batch_size: Optional[int] = None) -> int:
+        """Archive every receipt created before `older_than`; returns how many were archived.
+
+        Each batch is written and fsynced to its segment before the transaction
+        that indexes it and deletes the hot rows commits, so a crash leaves at
+        worst unreferenced bytes in a segment, never a lost receipt.
+        """
+        batch_size = batch_size or self.BATCH_SIZE
+        archived = 0
+
+        while True:
+            receipts = db.execute(
+                select(Receipt.id, Receipt.user_id, Receipt.created_at, Receipt.total, Receipt.payment_type,
+                       Receipt.payment_amount, Receipt.rest)
+                .where(Receipt.created_at < older_than)
+                .order_by(Receipt.created_at, Receipt.id)
+                .limit(batch_size)
+            ).all()
+            if not receipts:
+                break
+
+            ids = [receipt.id for receipt in receipts]
+            # Bounding the partition key as well keeps these statements on the batch's partitions.
+            in_batch = Product.receipt_id.in_(ids), \
+                Product.receipt_created_at.between(receipts[0].created_at, receipts[-1].created_at)
+
+            products = {receipt_id: [] for receipt_id in ids}
+            for receipt_id, name, price, quantity in db.execute(
+                select(Product.receipt_id, Product.name, Product.price, Product.quantity)
+                .where(*in_batch)
+                .order_by(Product.receipt_id, Product.id)
+            ):
+                products[receipt_id].append([name, price, quantity])
+
+            locations = self.store.append([self._encode(receipt, products[receipt.id]) for receipt in receipts])
+
+            db.execute(insert(ArchivedReceipt), [
+                {"receipt_id": receipt.id, "user_id": receipt.user_id, "created_at": receipt.created_at,
+                 "segment": segment, "offset": offset, "length": length}
+                for receipt, (segment, offset, length) in zip(receipts, locations)
+            ])
+            db.execute(delete(Product).where(*in_batch))
+            db.execute(delete(Receipt).where(
+                Receipt.id.in_(ids), Receipt.created_at.between(receipts[0].created_at, receipts[-1].created_at)
+            ))
+            self._decrement_counters(db, receipts)
+            db.commit()
+            archived += len(receipts)
+
+        # Whole months that are now empty are dropped, which shrinks the hot tables right away.
+        drop_empty_partitions(db.connection(), month_start(older_than.date()))
+        db.commit()
+        return archived
+
+    def get_version(self, db: Session, receipt_id: int):
+        return db.execute(
+            select(ArchivedReceipt.user_id, ArchivedReceipt.created_at).where(ArchivedReceipt.receipt_id == receipt_id)
+        ).first()
+
+    def get_receipt(self, db: Session, receipt_id: int, user_id: Optional[int] = None) -> Optional[dict]:
+        """The archived receipt as a dict of its columns plus `products` ([name, price, quantity] lists)."""
+        query = select(ArchivedReceipt.segment, ArchivedReceipt.offset, ArchivedReceipt.length) \
+            .where(ArchivedReceipt.receipt_id == receipt_id)
+        if user_id is not None:
+            query = query.where(ArchivedReceipt.user_id == user_id)
+
+        location = db.execute(query).first()
+        if location is None:
+            return None
+        return self._decode(self.store.read(*location))
+
+    def get_receipts(self, db: Session, receipt_ids: List[int], user_id: Optional[int] = None) -> List[dict]:
+        """Like get_receipt for many ids, with a single index lookup; ids that are not archived are skipped."""
+        query = select(ArchivedReceipt.segment, ArchivedReceipt.offset, ArchivedReceipt.length) \
+            .where(ArchivedReceipt.receipt_id.in_(receipt_ids)) \
+            .order_by(ArchivedReceipt.segment, ArchivedReceipt.offset)
+        if user_id is not None:
+            query = query.where(ArchivedReceipt.user_id == user_id)
+
+        return [self._decode(self.store.read(*location)) for location in db.execute(query).all()]
+
+    def get_user_receipts(self, db: Session, user_id: int, created_from: datetime) -> List[dict]:
+        """The user's archived receipts created at or after `created_from`, like get_receipt."""
+        return [
+            self._decode(self.store.read(*location))
+            for location in db.execute(
+                select(ArchivedReceipt.segment, ArchivedReceipt.offset, ArchivedReceipt.length)
+                .where(ArchivedReceipt.user_id == user_id, ArchivedReceipt.created_at >= created_from)
+                .order_by(ArchivedReceipt.segment, ArchivedReceipt.offset)
+            ).all()
+        ]
+
+    def first_rebuilt_day(self, db: Session, user_id: int) -> Optional[date]:
+        """The first day whose rollups can be recomputed for a user, or None when nothing of theirs is archived.
+
+        Days before the user's oldest receipt in the hot tables only hold
+        archived receipts, so their rollups are kept as they are; later days
+        are rebuilt from the hot tables plus the few archived receipts that
+        share a day with them. date.max when every receipt is archived.
+        """
+        archived = db.execute(select(ArchivedReceipt.receipt_id).where(ArchivedReceipt.user_id == user_id).limit(1))
+        if archived.first() is None:
+            return None
+        first_hot = db.execute(select(func.min(Receipt.created_at)).where(Receipt.user_id == user_id)).scalar()
+        return date.max if first_hot is None else first_hot.date()
+
+    def _decode(self, payload: bytes) -> dict:
+        record = orjson.loads(payload)
+        record["created_at"] = datetime.fromisoformat(record["created_at"])
+        return record
+
+    def _encode(self, receipt, products: List[list]) -> bytes:
+        return orjson.dumps({
+            "id": receipt.id,
+            "user_id": receipt.user_id,
+            "created_at": receipt.created_at.isoformat(),
+            "total": receipt.total,
+            "payment_type": receipt.payment_type,
+            "payment_amount": receipt.payment_amount,
+            "rest": receipt.rest,
+            "products": products,
+        })
+
+    def _decrement_counters(self, db: Session, receipts):
+        decrements = Counter((receipt.user_id, receipt.payment_type) for receipt in receipts)
+        for (user_id, payment_type), count in decrements.items():
+            db.execute(
+                update(ReceiptCounter)
+                .where(ReceiptCounter.user_id == user_id, ReceiptCounter.payment_type == payment_type)
+                .values(receipt_count=ReceiptCounter.receipt_count - count)
+            )
+
+
+crud_archive = CRUDArchive()
@@ -0,0 +1,102 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.main.cache import LRUCache
+from app.main.config import settings
+from app.models.idempotency_key import IdempotencyKey
+from app.schemas.receipt import ReceiptCreate, ReceiptCreatingResponse
+
+
+class CRUDIdempotency:
+    MAX_KEY_LENGTH = 255
+
+    def __init__(self):
+        self.cache = LRUCache(settings.IDEMPOTENCY_CACHE_SIZE)
+
+    @property
+    def ttl(self) -> timedelta:
+        return timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+    def request_hash(self, receipt_in: ReceiptCreate) -> str:
+        return hashlib.sha256(receipt_in.model_dump_json().encode()).hexdigest()
+
+    def validate_key(self, key: str):
+        if not (1 <= len(key) <= self.MAX_KEY_LENGTH):
+            raise HTTPException(
+                status_code=400, detail=f"Idempotency-Key length must be between 1 and {self.MAX_KEY_LENGTH} characters"
+            )
+
+    def replay(
+        self, db: Session, user_id: int, key: str, receipt_in: ReceiptCreate
+    ) -> Optional[ReceiptCreatingResponse]:
+        self.validate_key(key)
+        return self.lookup(db, user_id, key, self.request_hash(receipt_in))
+
+    def lookup(
+        self, db: Session, user_id: int, key: str, request_hash: str
+    ) -> Optional[ReceiptCreatingResponse]:
+        """Return the stored response for a replayed key, answering hot retries from the LRU."""
+        cached = self.cache.get((user_id, key))
+        if cached is None:
+            stored = db.query(IdempotencyKey.request_hash, IdempotencyKey.response, IdempotencyKey.created_at) \
+                .filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key) \
+                .first()
+            if not stored or stored.created_at <= datetime.utcnow() - self.ttl:
+                return None
+            cached = self._remember(user_id, key, stored.request_hash,
+                                    ReceiptCreatingResponse.model_validate_json(stored.response), stored.created_at)
+
+        stored_hash, response = cached
+        if stored_hash != request_hash:
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key was already used with a different request payload"
+            )
+        return response
+
+    def record(
+        self, db: Session, user_id: int, key: str, request_hash: str, response: ReceiptCreatingResponse
+    ):
+        """Add the key to the current transaction; it is committed together with the receipt.
+
+        An expired row for the same key that the sweep has not removed yet is
+        replaced, so reusing a key after its TTL does not hit the unique constraint.
+        """
+        db.execute(delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id, IdempotencyKey.key == key,
+            IdempotencyKey.created_at <= datetime.utcnow() - self.ttl
+        ))
+        db.add(IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            receipt_id=response.id,
+            response=response.model_dump_json(),
+            created_at=datetime.utcnow()
+        ))
+
+    def remember(self, user_id: int, key: str, request_hash: str, response: ReceiptCreatingResponse):
+        self._remember(user_id, key, request_hash, response, datetime.utcnow())
+
+    def sweep_expired(self, db: Session) -> int:
+        """Delete expired keys; run by the API's background sweeper and the sweep-idempotency-keys command."""
+        result = db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.created_at <= datetime.utcnow() - self.ttl)
+        )
+        db.commit()
+        return result.rowcount
+
+    def _remember(
+        self, user_id: int, key: str, request_hash: str, response: ReceiptCreatingResponse, created_at: datetime
+    ) -> tuple:
+        remaining = (created_at + self.ttl - datetime.utcnow()).total_seconds()
+        value = (request_hash, response)
+        self.cache.set((user_id, key), value, ttl=max(remaining, 0))
+        return value
+
+
+crud_idempotency = CRUDIdempotency()
@@ -0,0 +1,228 @@
+import logging
+import time
+import uuid
+from functools import partial
+from typing import AsyncIterable, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.crud.receipt import crud_receipt
+from app.main.config import settings
+from app.main.utils import format_validation_error
+from app.models.ingest_job import IngestJob
+from app.schemas.ingest import IngestError, IngestSummary
+from app.schemas.receipt import ReceiptCreate
+
+
+logger = logging.getLogger(__name__)
+
+# (line number, parsed receipt, prepared receipt row, error)
+Record = Tuple[int, Optional[ReceiptCreate], Optional[dict], Optional[str]]
+
+
+class LineSplitter:
+    """Splits arbitrary byte chunks into complete lines, holding back at most one partial line.
+
+    A line longer than `max_line_bytes` is dropped as soon as it crosses the
+    limit and comes out as None, so a file without newlines never piles up.
+    """
+
+    def __init__(self, max_line_bytes: Optional[int] = None):
+        self.max_line_bytes = max_line_bytes or settings.INGEST_MAX_LINE_BYTES
+        self._buffer = bytearray()
+        self._too_long = False
+
+    def feed(self, chunk: bytes) -> List[Optional[bytes]]:
+        *complete, rest = chunk.split(b"\n")
+        lines = []
+        for piece in complete:
+            self._append(piece)
+            lines.append(self._take())
+        self._append(rest)
+        return lines
+
+    def close(self) -> List[Optional[bytes]]:
+        if not self._buffer and not self._too_long:
+            return []
+        return [self._take()]
+
+    def _append(self, piece: bytes):
+        if self._too_long:
+            return
+        if len(self._buffer) + len(piece) > self.max_line_bytes:
+            self._too_long = True
+            self._buffer.clear()
+        else:
+            self._buffer += piece
+
+    def _take(self) -> Optional[bytes]:
+        line = None if self._too_long else bytes(self._buffer)
+        self._buffer.clear()
+        self._too_long = False
+        return line
+
+
+class IngestRun:
+    """Progress of one ingest run over a job; only the current chunk is ever held in memory."""
+
+    def __init__(self, job: IngestJob, chunk_size: int, on_progress: Optional[Callable[["IngestRun"], None]]):
+        self.job = job
+        self.job_id = job.id
+        self.user_id = job.user_id
+        self.resume_after = job.lines_committed
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self.started_at = time.perf_counter()
+        self.line_no = 0
+        self.lines_processed = 0
+        self.receipts_inserted = 0
+        self.receipts_failed = 0
+        self.errors: List[IngestError] = []
+        self.chunk: List[Record] = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @property
+    def receipts_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.receipts_inserted / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> IngestSummary:
+        return IngestSummary(
+            job_id=self.job.id,
+            lines_processed=self.lines_processed,
+            lines_committed=self.job.lines_committed,
+            receipts_inserted=self.receipts_inserted,
+            receipts_failed=self.receipts_failed,
+            errors=self.errors,
+            elapsed_seconds=round(self.elapsed, 3),
+            receipts_per_second=round(self.receipts_per_second, 1)
+        )
+
+
+class CRUDIngest:
+    MAX_CHUNK_SIZE = 10000
+    MAX_REPORTED_ERRORS = 100
+
+    def get_or_create_job(self, db: Session, user_id: int, job_id: Optional[str] = None) -> IngestJob:
+        if job_id:
+            job = db.query(IngestJob).filter(IngestJob.id == job_id, IngestJob.user_id == user_id).first()
+            if not job:
+                raise HTTPException(status_code=404, detail="Ingest job not found")
+            return job
+
+        job = IngestJob(id=uuid.uuid4().hex, user_id=user_id, lines_committed=0, receipts_inserted=0,
+                        receipts_failed=0)
+        db.add(job)
+        db.commit()
+        return job
+
+    def start(
+        self, db: Session, user_id: int, job_id: Optional[str] = None, chunk_size: Optional[int] = None,
+        on_progress: Optional[Callable[[IngestRun], None]] = None
+    ) -> IngestRun:
+        chunk_size = chunk_size or settings.INGEST_CHUNK_SIZE
+        if not (1 <= chunk_size <= self.MAX_CHUNK_SIZE):
+            raise HTTPException(
+                status_code=400, detail=f"Chunk size must be between 1 and {self.MAX_CHUNK_SIZE}"
+            )
+
+        job = self.get_or_create_job(db, user_id, job_id)
+        return IngestRun(job, chunk_size, on_progress)
+
+    def ingest(self, db: Session, run: IngestRun, chunks: Iterable[bytes]) -> IngestSummary:
+        """Synchronous pipeline used by the CLI: byte chunks -> lines -> records -> chunked flushes."""
+        for chunk in self._chunked(run, self._records(run, self._lines(chunks))):
+            self._flush(db, run, chunk)
+        return run.summary()
+
+    async def ingest_stream(self, db: Session, run: IngestRun, stream: AsyncIterable[bytes]) -> IngestSummary:
+        """Asynchronous variant for request bodies; parsing, validation and flushes run in the threadpool."""
+        splitter = LineSplitter()
+        async for data in stream:
+            await run_in_threadpool(self._ingest_lines, db, run, partial(splitter.feed, data), False)
+        await run_in_threadpool(self._ingest_lines, db, run, splitter.close, True)
+        return run.summary()
+
+    def _ingest_lines(self, db: Session, run: IngestRun, split: Callable[[], List[Optional[bytes]]], final: bool):
+        for chunk in self._chunked(run, self._records(run, split()), final=final):
+            self._flush(db, run, chunk)
+
+    def _lines(self, chunks: Iterable[bytes]) -> Iterator[Optional[bytes]]:
+        splitter = LineSplitter()
+        for data in chunks:
+            yield from splitter.feed(data)
+        yield from splitter.close()
+
+    def _records(self, run: IngestRun, lines: Iterable[Optional[bytes]]) -> Iterator[Record]:
+        for line in lines:
+            run.line_no += 1
+            # Lines up to the checkpoint were committed by an earlier run of this job.
+            if run.line_no <= run.resume_after:
+                continue
+            if line is None:
+                yield run.line_no, None, None, f"Line is longer than {settings.INGEST_MAX_LINE_BYTES} bytes"
+                continue
+            if not line.strip():
+                continue
+
+            try:
+                receipt_in = ReceiptCreate.model_validate_json(line)
+                receipt_row = crud_receipt.prepare_receipt(receipt_in, run.user_id)
+            except ValidationError as e:
+                yield run.line_no, None, None, format_validation_error(e)
+                continue
+            except HTTPException as e:
+                yield run.line_no, None, None, e.detail
+                continue
+            yield run.line_no, receipt_in, receipt_row, None
+
+    def _chunked(self, run: IngestRun, records: Iterable[Record], final: bool = True) -> Iterator[List[Record]]:
+        for record in records:
+            run.chunk.append(record)
+            if len(run.chunk) >= run.chunk_size:
+                yield self._take_chunk(run)
+        if final and run.chunk:
+            yield self._take_chunk(run)
+
+    def _take_chunk(self, run: IngestRun) -> List[Record]:
+        chunk, run.chunk = run.chunk, []
+        return chunk
+
+    def _flush(self, db: Session, run: IngestRun, chunk: List[Record]):
+        valid = [(receipt_in, receipt_row) for _, receipt_in, receipt_row, error in chunk if error is None]
+        failed = [(line_no, error) for line_no, _, _, error in chunk if error is not None]
+
+        if valid:
+            crud_receipt.insert_receipts(
+                db, [receipt_row for _, receipt_row in valid], [receipt_in for receipt_in, _ in valid]
+            )
+
+        # The checkpoint is committed together with the chunk it covers, so a
+        # resumed job never inserts the same line twice.
+        job = run.job
+        job.lines_committed = chunk[-1][0]
+        job.receipts_inserted += len(valid)
+        job.receipts_failed += len(failed)
+        db.commit()
+
+        run.lines_processed += len(chunk)
+        run.receipts_inserted += len(valid)
+        run.receipts_failed += len(failed)
+        for line_no, error in failed[:self.MAX_REPORTED_ERRORS - len(run.errors)]:
+            run.errors.append(IngestError(line=line_no, error=error))
+
+        logger.info(
+            "Ingest job %s: committed through line %d, %d receipts inserted, %.1f receipts/s",
+            job.id, job.lines_committed, run.receipts_inserted, run.receipts_per_second
+        )
+        if run.on_progress:
+            run.on_progress(run)
+
+
+crud_ingest = CRUDIngest()
@@ -1,140 +1,720 @@
-from sqlalchemy.orm import Session, joinedload
+import csv
+import io
+import json
+import zipfile
+from collections import Counter
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy import Double, and_, cast, func, insert, select, tuple_, Row
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from app.models.user import User
 from app.models.receipt import Receipt
 from app.models.product import Product
-from app.schemas.receipt import ReceiptResponse, ReceiptCreate, ReceiptFilterParams, PaginationParams
-from app.main.utils import validate_receipt_data, wrap_text
-from typing import List
+from app.models.receipt_counter import ReceiptCounter
+from app.main.config import settings
+from app.schemas.receipt import (ReceiptCreate, ReceiptCreatingResponse, ReceiptFilterParams,
+                                 PaginationParams, ReceiptBatchItemResult, CursorParams, ReceiptFieldsParams,
+                                 RECEIPT_FIELDS)
+from app.crud.archive import crud_archive
+from app.crud.idempotency import crud_idempotency
+from app.crud.receipt_render import crud_receipt_render
+from app.crud.receipt_stats import crud_receipt_stats
+from app.main.cache import LRUCache
+from app.main import render_pool
+from app.main.snapshots import Snapshot, SnapshotStore
+from app.main.render import RENDER_VERSION, ProductFields, ReceiptFields, render_receipt, stream_receipt
+from app.main.utils import (validate_receipt_data, format_validation_error, encode_cursor,
+                            decode_cursor, dialect_insert, StreamBuffer)
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+
+class ProductRow:
+    """Read-only product record used by the Core read paths instead of ORM instances."""
+    __slots__ = ("name", "price", "quantity")
+
+    def __init__(self, name: str, price: float, quantity: int):
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "price": self.price, "quantity": self.quantity}
+
+
+class ReceiptRow:
+    """Read-only receipt record; slots left unset are fields that were not selected."""
+    __slots__ = ("id", "created_at", "total", "payment_type", "payment_amount", "rest", "products")
+
+    @classmethod
+    def from_values(cls, columns: List[str], values) -> "ReceiptRow":
+        receipt = cls()
+        for name, value in zip(columns, values):
+            setattr(receipt, name, value)
+        return receipt
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+
+    @classmethod
+    def from_archive(cls, record: dict, columns: List[str], with_products: bool) -> "ReceiptRow":
+        receipt = cls.from_values(columns, [record[name] for name in columns])
+        if with_products:
+            receipt.products = [ProductRow(*product) for product in record["products"]]
+        return receipt
 
 
 class CRUDReceipt:
     MIN_LINE_LENGTH = 30
+    # Public renders are unauthenticated; the cap bounds what one request can make the server build and cache.
+    MAX_LINE_LENGTH = 200
+    MAX_BATCH_SIZE = 5000
+    BATCH_CHUNK_SIZE = 500
+    ORDER_COLUMNS = {"created_at": Receipt.created_at, "total": Receipt.total}
+    EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+    EXPORT_CHUNK_SIZE = 1000
+    MAX_RENDER_BATCH_SIZE = 1000
+    RENDER_OUTPUTS = {"text": "text/plain; charset=utf-8", "zip": "application/zip"}
+    # Receipts in a rendered text document are separated by a form feed, i.e. a page break.
+    RENDER_SEPARATOR = "\f"
+    EXPORT_CSV_HEADER = [
+        "receipt_id", "created_at", "total", "payment_type", "payment_amount", "rest",
+        "product_name", "product_price", "product_quantity"
+    ]
+
+    def __init__(self):
+        self.version_cache = LRUCache(settings.RECEIPT_VERSION_CACHE_SIZE)
+        # Receipts never change once created, so rendered texts can be kept until evicted.
+        self.render_cache = LRUCache(
+            settings.RECEIPT_RENDER_CACHE_SIZE, maxweight=settings.RECEIPT_RENDER_CACHE_MAX_CHARS
+        )
+        self._snapshot_store: Optional[SnapshotStore] = None
+
+    @property
+    def snapshot_store(self) -> SnapshotStore:
+        store = self._snapshot_store
+        if store is None or (store.directory, store.max_bytes) != \
+                (settings.RECEIPT_SNAPSHOT_DIR, settings.RECEIPT_SNAPSHOT_MAX_BYTES):
+            store = self._snapshot_store = SnapshotStore(
+                settings.RECEIPT_SNAPSHOT_DIR, settings.RECEIPT_SNAPSHOT_MAX_BYTES
+            )
+        return store
+
+    def create_receipt(
+        self, db: Session, receipt_in: ReceiptCreate, user_id: int, idempotency_key: Optional[str] = None
+    ) -> ReceiptCreatingResponse:
+        receipt_row = self.prepare_receipt(receipt_in, user_id)
+
+        # The receipt and all of its products are written in one transaction:
+        # one INSERT ... RETURNING for the receipt and one multi-row INSERT
+        # for the products, so no refresh SELECTs are needed afterwards.
+        db_receipt = self.insert_receipts(db, [receipt_row], [receipt_in])[0]
+        response = self._creating_response(receipt_in, receipt_row, db_receipt)
+
+        if not idempotency_key:
+            db.commit()
+            return response
+
+        request_hash = crud_idempotency.request_hash(receipt_in)
+        crud_idempotency.record(db, user_id, idempotency_key, request_hash, response)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent retry with the same key committed first; roll back
+            # this receipt and return the one that was stored.
+            db.rollback()
+            replay = crud_idempotency.lookup(db, user_id, idempotency_key, request_hash)
+            if replay is None:
+                raise
+            return replay
+
+        crud_idempotency.remember(user_id, idempotency_key, request_hash, response)
+        return response
+
+    def create_receipts_batch(
+        self, db: Session, receipts_in: List[Any], user_id: int
+    ) -> List[ReceiptBatchItemResult]:
+        if not (1 <= len(receipts_in) <= self.MAX_BATCH_SIZE):
+            raise HTTPException(
+                status_code=400, detail=f"Batch must contain between 1 and {self.MAX_BATCH_SIZE} receipts"
+            )
 
-    def create_receipt(self, db: Session, receipt_in: ReceiptCreate, user_id: int) -> Receipt:
+        results: List[ReceiptBatchItemResult | None] = [None] * len(receipts_in)
+        valid = []
+
+        for index, receipt_data in enumerate(receipts_in):
+            try:
+                receipt_in = ReceiptCreate.model_validate(receipt_data)
+                receipt_row = self.prepare_receipt(receipt_in, user_id)
+            except ValidationError as e:
+                results[index] = ReceiptBatchItemResult(index=index, error=format_validation_error(e))
+                continue
+            except HTTPException as e:
+                results[index] = ReceiptBatchItemResult(index=index, error=e.detail)
+                continue
+            valid.append((index, receipt_in, receipt_row))
+
+        for start in range(0, len(valid), self.BATCH_CHUNK_SIZE):
+            chunk = valid[start:start + self.BATCH_CHUNK_SIZE]
+            try:
+                created = self.insert_receipts(
+                    db, [receipt_row for _, _, receipt_row in chunk], [receipt_in for _, receipt_in, _ in chunk]
+                )
+                db.commit()
+            except SQLAlchemyError:
+                # Earlier chunks are committed already, so report this one's items instead of failing the batch.
+                db.rollback()
+                for index, _, _ in chunk:
+                    results[index] = ReceiptBatchItemResult(index=index, error="Receipt could not be stored")
+                continue
+
+            for (index, _, _), db_receipt in zip(chunk, created):
+                results[index] = ReceiptBatchItemResult(index=index, id=db_receipt.id)
+
+        return results
+
+    def prepare_receipt(self, receipt_in: ReceiptCreate, user_id: int) -> dict:
         total = sum(product.price * product.quantity for product in receipt_in.products)
         rest = receipt_in.payment_amount - total
 
         validate_receipt_data(receipt_in, rest)
 
-        db_receipt = Receipt(
-            user_id=user_id,
-            total=total,
-            payment_type=receipt_in.payment_type,
-            payment_amount=receipt_in.payment_amount,
-            rest=rest
+        return {
+            "user_id": user_id,
+            "total": total,
+            "payment_type": receipt_in.payment_type,
+            "payment_amount": receipt_in.payment_amount,
+            "rest": rest
+        }
+
+    def insert_receipts(self, db: Session, receipt_rows: List[dict], receipts_in: List[ReceiptCreate]) -> List[Row]:
+        """Bulk-insert validated receipts and their products in the current transaction.
+
+        Returns the (id, created_at) rows in the same order as `receipt_rows`.
+        """
+        created = db.execute(
+            insert(Receipt).returning(Receipt.id, Receipt.created_at, sort_by_parameter_order=True),
+            receipt_rows
+        ).all()
+
+        db.execute(
+            insert(Product),
+            [
+                {
+                    "name": product_data.name,
+                    "price": product_data.price,
+                    "quantity": product_data.quantity,
+                    "receipt_id": db_receipt.id,
+                    "receipt_created_at": db_receipt.created_at
+                }
+                for receipt_in, db_receipt in zip(receipts_in, created)
+                for product_data in receipt_in.products
+            ]
         )
 
-        db.add(db_receipt)
-        db.commit()
-        db.refresh(db_receipt)
+        self._increment_counters(db, receipt_rows)
+        crud_receipt_stats.increment(db, receipt_rows, created)
+        crud_receipt_stats.increment_products(db, receipt_rows, created, receipts_in)
+        if settings.RECEIPT_PRERENDER:
+            crud_receipt_render.render_created(db, receipt_rows, created, receipts_in)
 
-        for product_data in receipt_in.products:
-            db_product = Product(
-                name=product_data.name,
-                price=product_data.price,
-                quantity=product_data.quantity,
-                receipt_id=db_receipt.id
-            )
-            db.add(db_product)
+        return created
 
-        db.commit()
-        db.refresh(db_receipt)
+    def count_receipts(self, db: Session, user_id: int, filters: ReceiptFilterParams) -> Tuple[int, bool]:
+        """Return (count, is_exact) for a listing without scanning every row of a large user.
 
-        return db_receipt
+        Unfiltered and payment_type-only listings are answered from the per-user
+        counters. Other filters are counted exactly while the user has at most
+        RECEIPT_COUNT_EXACT_THRESHOLD receipts, and estimated above that.
+        """
+        counters = select(func.coalesce(func.sum(ReceiptCounter.receipt_count), 0)) \
+            .where(ReceiptCounter.user_id == user_id)
+        if filters.payment_type:
+            counters = counters.where(ReceiptCounter.payment_type == filters.payment_type)
+        counted = db.execute(counters).scalar_one()
+
+        if not (filters.created_from or filters.created_to or filters.min_total or filters.max_total
+                or filters.product_name):
+            return counted, True
+
+        threshold = settings.RECEIPT_COUNT_EXACT_THRESHOLD
+        matching = select(Receipt.id).where(*self._filter_clauses(user_id, filters))
+
+        if counted <= threshold:
+            return db.execute(select(func.count()).select_from(matching.subquery())).scalar_one(), True
+
+        if db.get_bind().dialect.name == "postgresql":
+            compiled = matching.compile(dialect=db.get_bind().dialect)
+            plan = db.connection().exec_driver_sql(
+                "EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params
+            ).scalar_one()
+            return min(int(plan[0]["Plan"]["Plan Rows"]), counted), False
+
+        # Without a planner estimate, count at most threshold + 1 matching rows.
+        bounded = db.execute(
+            select(func.count()).select_from(matching.limit(threshold + 1).subquery())
+        ).scalar_one()
+        return bounded, bounded <= threshold
+
+    def _increment_counters(self, db: Session, receipt_rows: List[dict]):
+        increments = Counter((row["user_id"], row["payment_type"]) for row in receipt_rows)
+        upsert = dialect_insert(db)(ReceiptCounter)
+        db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[ReceiptCounter.user_id, ReceiptCounter.payment_type],
+                set_={"receipt_count": ReceiptCounter.receipt_count + upsert.excluded.receipt_count}
+            ),
+            [
+                {"user_id": user_id, "payment_type": payment_type, "receipt_count": count}
+                # Key order, so that concurrent batches lock the counters in the same order and cannot deadlock.
+                for (user_id, payment_type), count in sorted(increments.items())
+            ]
+        )
+
+    def _creating_response(self, receipt_in: ReceiptCreate, receipt_row: dict, db_receipt: Row) -> ReceiptCreatingResponse:
+        return ReceiptCreatingResponse(
+            id=db_receipt.id,
+            products=receipt_in.products,
+            payment_type=receipt_row["payment_type"],
+            payment_amount=receipt_row["payment_amount"],
+            total=receipt_row["total"],
+            rest=receipt_row["rest"],
+            created_at=db_receipt.created_at
+        )
 
     def get_receipts(
-        self, db: Session, user_id: int, filters: ReceiptFilterParams, pagination: PaginationParams
-    ) -> List[ReceiptResponse]:
-        query = db.query(Receipt).filter(Receipt.user_id == user_id)
+        self, db: Session, user_id: int, filters: ReceiptFilterParams, pagination: PaginationParams,
+        cursor_params: CursorParams = CursorParams(), fields: ReceiptFieldsParams = ReceiptFieldsParams()
+    ) -> Tuple[List[ReceiptRow], Optional[str]]:
+        """Return one page of receipts and the opaque cursor of the next page, if there is one.
+
+        Rows are always ordered by (order_by column, id); "relevance" orders a
+        product_name search by the trigram distance of the best matching
+        product, closest first. With a cursor the page
+        starts right after the cursor's row (keyset pagination), otherwise the
+        legacy page/page_size offset is used. Only the requested columns are
+        selected, and products are loaded only when requested. Rows are
+        returned as slotted ReceiptRow records rather than ORM instances.
+        """
+        order_column = self._order_column(db, cursor_params.order_by, filters)
+        query = select(
+            *self._columns(fields.columns), order_column.label("sort_key"), Receipt.created_at.label("partition_key")
+        ) \
+            .where(*self._filter_clauses(user_id, filters)) \
+            .order_by(order_column, Receipt.id)
+
+        if cursor_params.cursor:
+            if pagination.page != 1:
+                raise HTTPException(status_code=400, detail="'page' cannot be combined with 'cursor'")
+            value, last_id = decode_cursor(cursor_params.cursor, cursor_params.order_by)
+            query = query.where(tuple_(order_column, Receipt.id) > tuple_(value, last_id))
+        else:
+            query = query.offset((pagination.page - 1) * pagination.page_size)
+
+        # One extra row tells whether another page exists without counting.
+        rows = db.execute(query.limit(pagination.page_size + 1)).all()
+
+        next_cursor = None
+        if len(rows) > pagination.page_size:
+            rows = rows[:pagination.page_size]
+            last = rows[-1]
+            next_cursor = encode_cursor(cursor_params.order_by, last.sort_key, last.id)
+
+        receipts = [ReceiptRow.from_values(fields.columns, row) for row in rows]
+        if fields.with_products:
+            self._attach_products(db, receipts, [row.partition_key for row in rows])
+
+        return receipts, next_cursor
+
+    def get_receipt_version(self, db: Session, receipt_id: int) -> Optional[Row]:
+        """Return (user_id, created_at) of a receipt, or None; cached since receipts are immutable."""
+        version = self.version_cache.get(receipt_id)
+        if version is None:
+            version = db.execute(
+                select(Receipt.user_id, Receipt.created_at).where(Receipt.id == receipt_id)
+            ).first() or crud_archive.get_version(db, receipt_id)
+            if version is None:
+                return None
+            self.version_cache.set(receipt_id, version)
+        return version
+
+    def get_receipt_by_id(
+        self, db: Session, receipt_id: int, user_id: int, fields: ReceiptFieldsParams = ReceiptFieldsParams()
+    ) -> ReceiptRow:
+        row = db.execute(
+            select(*self._columns(fields.columns), Receipt.created_at.label("partition_key"))
+            .where(Receipt.id == receipt_id, Receipt.user_id == user_id)
+        ).first()
+
+        if not row:
+            record = crud_archive.get_receipt(db, receipt_id, user_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail="Receipt not found")
+            return ReceiptRow.from_archive(record, fields.columns, fields.with_products)
+
+        receipt = ReceiptRow.from_values(fields.columns, row)
+        if fields.with_products:
+            self._attach_products(db, [receipt], [row.partition_key])
+
+        return receipt
+
+    def export_receipts(
+        self, session_factory: Callable[[], Session], user_id: int, filters: ReceiptFilterParams, export_format: str
+    ) -> Iterator[str]:
+        """Stream receipt+product rows as CSV or NDJSON through a server-side cursor.
+
+        The generator owns its session because it runs after the request's
+        dependencies have been closed. Only one partition of rows is held in
+        memory at a time.
+        """
+        if export_format == "csv":
+            yield self._csv_line(self.EXPORT_CSV_HEADER)
+
+        query = select(
+            Receipt.id, Receipt.created_at, Receipt.total, Receipt.payment_type, Receipt.payment_amount, Receipt.rest,
+            Product.name, Product.price, Product.quantity
+        ) \
+            .outerjoin(Product, self._products_of_receipt()) \
+            .where(*self._filter_clauses(user_id, filters)) \
+            .order_by(Receipt.created_at, Receipt.id, Product.id) \
+            .execution_options(yield_per=self.EXPORT_CHUNK_SIZE)
+
+        with session_factory() as db:
+            result = db.execute(query)
+
+            if export_format == "csv":
+                for rows in result.partitions():
+                    buffer = io.StringIO()
+                    csv.writer(buffer, lineterminator="\n").writerows(
+                        (row[0], row[1].isoformat(), *row[2:]) for row in rows
+                    )
+                    yield buffer.getvalue()
+                return
+
+            receipt = None
+            for rows in result.partitions():
+                lines = []
+                for receipt_id, created_at, total, payment_type, payment_amount, rest, name, price, quantity in rows:
+                    if receipt is None or receipt["id"] != receipt_id:
+                        if receipt is not None:
+                            lines.append(json.dumps(receipt) + "\n")
+                        receipt = {
+                            "id": receipt_id,
+                            "created_at": created_at.isoformat(),
+                            "total": total,
+                            "payment_type": payment_type,
+                            "payment_amount": payment_amount,
+                            "rest": rest,
+                            "products": []
+                        }
+                    if name is not None:
+                        receipt["products"].append({"name": name, "price": price, "quantity": quantity})
+                if lines:
+                    yield "".join(lines)
+            if receipt is not None:
+                yield json.dumps(receipt) + "\n"
+
+    def _csv_line(self, values) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerow(values)
+        return buffer.getvalue()
+
+    def _columns(self, names: List[str]) -> list:
+        return [getattr(Receipt, name) for name in dict.fromkeys(names)]
+
+    def _filter_clauses(self, user_id: int, filters: ReceiptFilterParams) -> list:
+        clauses = [Receipt.user_id == user_id]
 
         if filters.created_from:
-            query = query.filter(Receipt.created_at >= filters.created_from)
+            clauses.append(Receipt.created_at >= filters.created_from)
         if filters.created_to:
-            query = query.filter(Receipt.created_at <= filters.created_to)
+            clauses.append(Receipt.created_at <= filters.created_to)
         if filters.min_total:
-            query = query.filter(Receipt.total >= filters.min_total)
+            clauses.append(Receipt.total >= filters.min_total)
         if filters.max_total:
-            query = query.filter(Receipt.total <= filters.max_total)
+            clauses.append(Receipt.total <= filters.max_total)
         if filters.payment_type:
-            query = query.filter(Receipt.payment_type == filters.payment_type)
-
-        receipts = query.options(joinedload(Receipt.products)) \
-            .offset((pagination.page - 1) * pagination.page_size) \
-            .limit(pagination.page_size) \
-            .all()
-
-        return receipts
-
-    def get_receipt_by_id(
-        self, db: Session, receipt_id: int, user_id: int
-    ) -> ReceiptResponse:
-        receipt = db.query(Receipt).filter(
-            Receipt.id == receipt_id,
-            Receipt.user_id == user_id
-        ).options(joinedload(Receipt.products)).first()
-
-        if not receipt:
-            raise HTTPException(status_code=404, detail="Receipt not found")
+            clauses.append(Receipt.payment_type == filters.payment_type)
+        if filters.product_name:
+            clauses.append(
+                select(Product.id).where(self._products_of_receipt(), self._product_name_match(filters)).exists()
+            )
 
-        return receipt
+        return clauses
+
+    @staticmethod
+    def _products_of_receipt():
+        """Join condition including the partition key, so Postgres prunes the products partitions."""
+        return and_(Product.receipt_id == Receipt.id, Product.receipt_created_at == Receipt.created_at)
+
+    def _product_name_match(self, filters: ReceiptFilterParams):
+        """Case-insensitive substring match; ILIKE '%term%' is served by the pg_trgm index on Postgres."""
+        escaped = filters.product_name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return Product.name.ilike(f"%{escaped}%", escape="\\")
+
+    def _order_column(self, db: Session, order_by: str, filters: ReceiptFilterParams):
+        if order_by != "relevance":
+            return self.ORDER_COLUMNS[order_by]
+
+        if not filters.product_name:
+            raise HTTPException(status_code=400, detail="'order_by=relevance' requires 'product_name'")
+
+        if db.get_bind().dialect.name == "postgresql":
+            # similarity() is float4; as float8 the cursor's JSON float compares exactly with the sort key.
+            distance = 1 - cast(func.similarity(Product.name, filters.product_name), Double)
+        else:
+            # Portable fallback: the share of the product name not covered by the search term.
+            distance = 1 - func.length(filters.product_name) * 1.0 / func.length(Product.name)
+
+        return select(func.min(distance)) \
+            .where(self._products_of_receipt(), self._product_name_match(filters)) \
+            .scalar_subquery()
+
+    def _attach_products(self, db: Session, receipts: List[ReceiptRow], created_ats: List[datetime]):
+        """Load the products of all given receipts with one IN query instead of a row-multiplying join.
+
+        `created_ats` are the receipts' created_at values; their range bounds the
+        partition key so that only the partitions of the page's months are read.
+        """
+        by_id = {}
+        for receipt in receipts:
+            receipt.products = []
+            by_id[receipt.id] = receipt.products
+
+        if not by_id:
+            return
+
+        products = db.execute(
+            select(Product.receipt_id, Product.name, Product.price, Product.quantity)
+            .where(
+                Product.receipt_id.in_(by_id),
+                Product.receipt_created_at.between(min(created_ats), max(created_ats))
+            )
+            .order_by(Product.receipt_id, Product.id)
+        )
+        for receipt_id, name, price, quantity in products:
+            by_id[receipt_id].append(ProductRow(name, price, quantity))
 
-    def get_public_receipt(self, db: Session, receipt_id: int, line_length: int) -> str:
+    def validate_line_length(self, line_length: int):
         if line_length < self.MIN_LINE_LENGTH:
             raise HTTPException(status_code=404, detail=f"Line length should be at least {self.MIN_LINE_LENGTH} characters")
+        if line_length > self.MAX_LINE_LENGTH:
+            raise HTTPException(
+                status_code=404, detail=f"Line length should be at most {self.MAX_LINE_LENGTH} characters"
+            )
 
-        receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
-        if not receipt:
-            raise HTTPException(status_code=404, detail="Receipt not found")
-
-        user = db.query(User).filter(User.id == receipt.user_id).first()
-        if not user:
+    def get_public_receipt(
+        self, db: Session, receipt_id: int, line_length: int, output_format: str = "text"
+    ) -> Union[str, bytes]:
+        """The receipt rendered in one of the render.LAYOUTS; cached per (receipt_id, line_length, output_format)."""
+        self.validate_line_length(line_length)
+
+        cache_key = (receipt_id, line_length, output_format)
+        rendered = self.render_cache.get(cache_key)
+        if rendered is not None:
+            return rendered
+
+        if (settings.RECEIPT_PRERENDER and output_format == "text"
+                and line_length == crud_receipt_render.LINE_LENGTH):
+            rendered = crud_receipt_render.get_text(db, receipt_id)
+            if rendered is not None:
+                self.render_cache.set(cache_key, rendered)
+                return rendered
+
+        # One statement fetches the receipt totals, the owner's name and the products, with
+        # only the columns the renderer reads; each row repeats the receipt part.
+        rows = db.execute(
+            select(Receipt.total, Receipt.payment_type, Receipt.payment_amount, Receipt.rest, Receipt.created_at,
+                   User.name.label("username"), Product.id.label("product_id"),
+                   Product.name.label("product_name"), Product.price, Product.quantity)
+            .outerjoin(User, User.id == Receipt.user_id)
+            .outerjoin(Product, self._products_of_receipt())
+            .where(Receipt.id == receipt_id)
+            .order_by(Product.id)
+        ).all()
+
+        if rows:
+            receipt, username = rows[0], rows[0].username
+            products = [
+                ProductRow(row.product_name, row.price, row.quantity) for row in rows if row.product_id is not None
+            ]
+        else:
+            # Not in the hot tables: read through to the cold-storage archive.
+            record = crud_archive.get_receipt(db, receipt_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail="Receipt not found")
+            receipt = ReceiptRow.from_archive(record, RECEIPT_FIELDS, with_products=True)
+            products = receipt.products
+            username = db.execute(select(User.name).where(User.id == record["user_id"])).scalar()
+
+        if username is None:
             raise HTTPException(status_code=404, detail="User not found")
 
-        receipts_products = receipt.products
-
-        username = user.name
-        username_padding = (line_length - len(username)) // 2
-        receipt_text = " " * username_padding + username + "\n"
-        receipt_text += "=" * line_length + "\n"
-
-        for i, product in enumerate(receipts_products):
-            total = product.quantity * product.price
-            name = product.name
-
-            receipt_text += f"{product.quantity:.2f} x {product.price:.2f}\n"
-
-            if len(name) > line_length // 2:
-                name_lines = wrap_text(name, line_length // 2)
-            else:
-                name_lines = [name]
-
-            for j, name_line in enumerate(name_lines):
-                if j == len(name_lines) - 1:
-                    line = f"{name_line}" + " " * (line_length - len(name_line) - len(f"{total:.2f}")) + f"{total:.2f}"
-                else:
-                    line = f"{name_line}" + " " * (line_length - len(name_line))
-
-                receipt_text += line + "\n"
-
-            if i != len(receipts_products) - 1:
-                receipt_text += "-" * line_length + "\n"
-        receipt_text += "=" * line_length + "\n"
-        receipt_text += "Total:" + (line_length - 6 - len(f"{receipt.total:.2f}")) * " " + f"{receipt.total:.2f}\n"
-        receipt_text += "Payment type:" + (line_length - 13 - len(f"{receipt.payment_type}")) * " " + f"{receipt.payment_type}\n"
-        receipt_text += "Payment amount:" + (line_length - 15 - len(f"{receipt.payment_amount}")) * " " + f"{receipt.payment_amount}\n"
-        receipt_text += "Rest:" + (line_length - 5 - len(f"{receipt.rest:.2f}")) * " " + f"{receipt.rest:.2f}\n"
-        receipt_text += "=" * line_length + "\n"
-
-        date_str = receipt.created_at.strftime('%d.%m.%Y %H:%M')
-        date_padding = (line_length - len(date_str)) // 2
-        receipt_text += " " * date_padding + date_str + "\n"
-
-        thank_you_message = "Thank you for your purchase!"
-        thank_you_padding = (line_length - len(thank_you_message)) // 2
-        receipt_text += " " * thank_you_padding + thank_you_message + "\n"
-
-        return receipt_text
+        rendered = render_receipt(output_format, username, receipt, products, line_length)
+        self.render_cache.set(cache_key, rendered)
+        return rendered
+
+    def get_public_snapshot(
+        self, db: Session, receipt_id: int, line_length: int, output_format: str = "text"
+    ) -> Union[Snapshot, str, bytes]:
+        """The rendered receipt's file in the snapshot store, written on first request.
+
+        A hit costs one stat and reads neither the database nor the render
+        cache. Only the widths in RECEIPT_SNAPSHOT_LINE_LENGTHS are stored, so
+        requests for arbitrary widths cannot churn the store; other widths and
+        receipts too large for the store are returned rendered instead.
+        """
+        self.validate_line_length(line_length)
+        if line_length not in settings.RECEIPT_SNAPSHOT_LINE_LENGTHS:
+            return self.get_public_receipt(db, receipt_id, line_length, output_format)
+
+        key = f"{RENDER_VERSION}:{receipt_id}:{line_length}:{output_format}"
+        snapshot = self.snapshot_store.get(key)
+        if snapshot is not None:
+            return snapshot
+
+        rendered = self.get_public_receipt(db, receipt_id, line_length, output_format)
+        data = rendered if isinstance(rendered, bytes) else rendered.encode()
+        return self.snapshot_store.put(key, data) or rendered
+
+    def stream_public_receipt(
+        self, db: Session, session_factory: Callable[[], Session], receipt_id: int, line_length: int,
+        output_format: str = "text"
+    ) -> Iterator[bytes]:
+        """Like get_public_receipt, but streamed while the products are read from a server-side cursor.
+
+        The receipt and its owner are looked up right away, so a missing receipt
+        is still a 404; the returned generator opens its own session for the
+        products because it runs after the request's dependencies have been
+        closed. Streamed renders bypass the render cache.
+        """
+        self.validate_line_length(line_length)
+
+        receipt = db.execute(
+            select(Receipt.total, Receipt.payment_type, Receipt.payment_amount, Receipt.rest, Receipt.created_at,
+                   User.name.label("username"))
+            .outerjoin(User, User.id == Receipt.user_id)
+            .where(Receipt.id == receipt_id)
+        ).first()
+
+        if receipt is None:
+            record = crud_archive.get_receipt(db, receipt_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail="Receipt not found")
+            archived = ReceiptRow.from_archive(record, RECEIPT_FIELDS, with_products=True)
+            username = db.execute(select(User.name).where(User.id == record["user_id"])).scalar()
+            if username is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            return stream_receipt(output_format, username, archived, archived.products, line_length)
+
+        if receipt.username is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return self._stream_products(session_factory, receipt_id, receipt, line_length, output_format)
+
+    def _stream_products(
+        self, session_factory: Callable[[], Session], receipt_id: int, receipt: Row, line_length: int,
+        output_format: str
+    ) -> Iterator[bytes]:
+        with session_factory() as db:
+            products = db.execute(
+                select(Product.name, Product.price, Product.quantity)
+                .where(Product.receipt_id == receipt_id, Product.receipt_created_at == receipt.created_at)
+                .order_by(Product.id)
+                .execution_options(yield_per=self.EXPORT_CHUNK_SIZE)
+            )
+            yield from stream_receipt(output_format, receipt.username, receipt, products, line_length)
+
+    def render_public_receipts(
+        self, db: Session, user: User, receipt_ids: List[int], line_length: int
+    ) -> Iterator[Tuple[int, str]]:
+        """Render several of the user's receipts; yields (receipt_id, text) in the order of `receipt_ids`.
+
+        Everything is loaded up front in a constant number of statements (the
+        receipts, the archive index for ids not in the hot tables, stored
+        renders and the products), so the returned iterator only renders and
+        can run after the session is closed.
+        """
+        self.validate_line_length(line_length)
+        if not (1 <= len(receipt_ids) <= self.MAX_RENDER_BATCH_SIZE):
+            raise HTTPException(
+                status_code=400, detail=f"Batch must contain between 1 and {self.MAX_RENDER_BATCH_SIZE} receipts"
+            )
+        receipt_ids = list(dict.fromkeys(receipt_ids))
+
+        receipts: Dict[int, ReceiptFields] = {}
+        for receipt_id, *fields in db.execute(
+            select(Receipt.id, Receipt.total, Receipt.payment_type, Receipt.payment_amount, Receipt.rest,
+                   Receipt.created_at)
+            .where(Receipt.id.in_(receipt_ids), Receipt.user_id == user.id)
+        ):
+            receipts[receipt_id] = ReceiptFields(*fields)
+
+        products: Dict[int, List[ProductFields]] = {}
+        not_hot = [receipt_id for receipt_id in receipt_ids if receipt_id not in receipts]
+        if not_hot:
+            for record in crud_archive.get_receipts(db, not_hot, user.id):
+                receipts[record["id"]] = ReceiptFields(*(record[name] for name in ReceiptFields._fields))
+                products[record["id"]] = [ProductFields(*product) for product in record["products"]]
+
+        missing = [receipt_id for receipt_id in receipt_ids if receipt_id not in receipts]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Receipts not found: {', '.join(map(str, missing))}")
+
+        texts = {}
+        for receipt_id in receipt_ids:
+            receipt_text = self.render_cache.get((receipt_id, line_length, "text"))
+            if receipt_text is not None:
+                texts[receipt_id] = receipt_text
+        if settings.RECEIPT_PRERENDER and line_length == crud_receipt_render.LINE_LENGTH:
+            texts.update(crud_receipt_render.get_texts(
+                db, [receipt_id for receipt_id in receipt_ids if receipt_id not in texts]
+            ))
+
+        to_render = [receipt_id for receipt_id in receipt_ids if receipt_id not in texts]
+        to_load = [receipt_id for receipt_id in to_render if receipt_id not in products]
+        if to_load:
+            products.update({receipt_id: [] for receipt_id in to_load})
+            created_ats = [receipts[receipt_id].created_at for receipt_id in to_load]
+            for receipt_id, *fields in db.execute(
+                select(Product.receipt_id, Product.name, Product.price, Product.quantity)
+                .where(Product.receipt_id.in_(to_load),
+                       Product.receipt_created_at.between(min(created_ats), max(created_ats)))
+                .order_by(Product.receipt_id, Product.id)
+            ):
+                products[receipt_id].append(ProductFields(*fields))
+
+        return self._render_batch(user.name, receipt_ids, texts, [
+            (receipt_id, (receipts[receipt_id], products[receipt_id])) for receipt_id in to_render
+        ], line_length)
+
+    def _render_batch(self, username: str, receipt_ids: List[int], texts: Dict[int, str],
+                      to_render: List[tuple], line_length: int) -> Iterator[Tuple[int, str]]:
+        rendered = zip(
+            (receipt_id for receipt_id, _ in to_render),
+            render_pool.render_many(username, [receipt for _, receipt in to_render], line_length)
+        )
+        for receipt_id in receipt_ids:
+            if receipt_id not in texts:
+                rendered_id, receipt_text = next(rendered)
+                self.render_cache.set((rendered_id, line_length, "text"), receipt_text)
+                texts[rendered_id] = receipt_text
+            yield receipt_id, texts[receipt_id]
+
+    def render_document(self, rendered: Iterator[Tuple[int, str]], output: str) -> Iterator[bytes]:
+        """Stream rendered receipts as one text document or as a zip archive with one file per receipt."""
+        if output == "text":
+            for index, (_, receipt_text) in enumerate(rendered):
+                yield ((self.RENDER_SEPARATOR if index else "") + receipt_text).encode()
+            return
+
+        buffer = StreamBuffer()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for receipt_id, receipt_text in rendered:
+                archive.writestr(f"receipt-{receipt_id}.txt", receipt_text)
+                yield buffer.drain()
+        yield buffer.drain()
 
 
 crud_receipt = CRUDReceipt()
@@ -0,0 +1,108 @@
+import zlib
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Row, select
+from sqlalchemy.orm import Session
+
+from app.main.render import DEFAULT_LINE_LENGTH, render_receipt_text
+from app.main.utils import dialect_insert
+from app.models.product import Product
+from app.models.receipt import Receipt
+from app.models.receipt_render import ReceiptRender
+from app.models.user import User
+from app.schemas.receipt import ReceiptCreate
+
+
+class CRUDReceiptRender:
+    """Public receipt texts at the default line length, rendered once and stored compressed.
+
+    With RECEIPT_PRERENDER enabled, receipts are rendered inside the transaction
+    that creates them and the public endpoint serves the stored text for the
+    default width with a single primary-key lookup, without reading products.
+    Other widths are still rendered live. Stored texts outlive archiving.
+    """
+    LINE_LENGTH = DEFAULT_LINE_LENGTH
+    BATCH_SIZE = 1000
+
+    def render_created(self, db: Session, receipt_rows: List[dict], created: List[Row],
+                       receipts_in: List[ReceiptCreate]):
+        """Store the texts of receipts being inserted, from the values at hand rather than the database."""
+        user_ids = {row["user_id"] for row in receipt_rows}
+        usernames = dict(db.execute(select(User.id, User.name).where(User.id.in_(user_ids))).all())
+
+        self._store(db, [
+            (db_receipt.id, render_receipt_text(
+                usernames[row["user_id"]], SimpleNamespace(**row, created_at=db_receipt.created_at),
+                receipt_in.products, self.LINE_LENGTH
+            ))
+            for row, db_receipt, receipt_in in zip(receipt_rows, created, receipts_in)
+        ])
+
+    def get_text(self, db: Session, receipt_id: int) -> Optional[str]:
+        compressed = db.execute(
+            select(ReceiptRender.compressed_text).where(ReceiptRender.receipt_id == receipt_id)
+        ).scalar()
+        return None if compressed is None else zlib.decompress(compressed).decode()
+
+    def get_texts(self, db: Session, receipt_ids: List[int]) -> Dict[int, str]:
+        return {
+            receipt_id: zlib.decompress(compressed).decode()
+            for receipt_id, compressed in db.execute(
+                select(ReceiptRender.receipt_id, ReceiptRender.compressed_text)
+                .where(ReceiptRender.receipt_id.in_(receipt_ids))
+            )
+        }
+
+    def backfill(self, db: Session, batch_size: Optional[int] = None) -> int:
+        """Render and store every receipt in the hot tables that has no stored text yet; returns how many."""
+        batch_size = batch_size or self.BATCH_SIZE
+        rendered = 0
+        last_id = 0
+
+        while True:
+            receipts = db.execute(
+                select(Receipt.id, Receipt.created_at, Receipt.total, Receipt.payment_type, Receipt.payment_amount,
+                       Receipt.rest, User.name.label("username"))
+                .join(User, User.id == Receipt.user_id)
+                .where(
+                    Receipt.id > last_id,
+                    ~select(ReceiptRender.receipt_id).where(ReceiptRender.receipt_id == Receipt.id).exists()
+                )
+                .order_by(Receipt.id)
+                .limit(batch_size)
+            ).all()
+            if not receipts:
+                break
+
+            products: Dict[int, list] = {receipt.id: [] for receipt in receipts}
+            created_ats = [receipt.created_at for receipt in receipts]
+            for product in db.execute(
+                select(Product.receipt_id, Product.name, Product.price, Product.quantity)
+                .where(Product.receipt_id.in_(products),
+                       Product.receipt_created_at.between(min(created_ats), max(created_ats)))
+                .order_by(Product.receipt_id, Product.id)
+            ):
+                products[product.receipt_id].append(product)
+
+            self._store(db, [
+                (receipt.id, render_receipt_text(receipt.username, receipt, products[receipt.id], self.LINE_LENGTH))
+                for receipt in receipts
+            ])
+            db.commit()
+            rendered += len(receipts)
+            last_id = receipts[-1].id
+
+        return rendered
+
+    def _store(self, db: Session, renders: List[Tuple[int, str]]):
+        db.execute(
+            dialect_insert(db)(ReceiptRender).on_conflict_do_nothing(index_elements=[ReceiptRender.receipt_id]),
+            [
+                {"receipt_id": receipt_id, "compressed_text": zlib.compress(text.encode())}
+                for receipt_id, text in renders
+            ]
+        )
+
+
+crud_receipt_render = CRUDReceiptRender()
@@ -0,0 +1,336 @@
+import heapq
+import math
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Row, and_, delete, desc, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.crud.archive import crud_archive
+from app.main.utils import dialect_insert
+from app.models.product import Product
+from app.models.product_daily_tally import ProductDailyTally
+from app.models.receipt import Receipt
+from app.models.receipt_daily_stat import ReceiptDailyStat
+from app.schemas.receipt import ReceiptCreate
+from app.schemas.receipt_stats import (ReceiptStatsParams, ReceiptStatsBucket, PaymentTypeStats, TopProductsParams,
+                                       TopProduct, ProductTallyMismatch)
+
+
+def normalize_product_name(name: str) -> str:
+    """Key under which spellings like "Espresso " and "espresso" are tallied together."""
+    return " ".join(name.split()).casefold()
+
+
+class CRUDReceiptStats:
+    """Per-user daily rollups of receipts (by payment type) and of products (by normalized name).
+
+    The increments run inside the transaction that inserts the receipts, so the
+    rollups never drift from the raw tables; the read endpoints scan one row per
+    day (and payment type or product) in the requested range instead of receipts.
+    """
+    REBUILD_CHUNK_SIZE = 1000
+
+    def increment(self, db: Session, receipt_rows: List[dict], created: Sequence[Row]):
+        self._upsert_stats(db, [
+            (receipt_row["user_id"], db_receipt.created_at.date(), receipt_row["payment_type"], receipt_row["total"])
+            for receipt_row, db_receipt in zip(receipt_rows, created)
+        ])
+
+    def get_stats(self, db: Session, user_id: int, params: ReceiptStatsParams) -> List[ReceiptStatsBucket]:
+        query = select(
+            ReceiptDailyStat.day, ReceiptDailyStat.payment_type,
+            ReceiptDailyStat.receipt_count, ReceiptDailyStat.total_sum
+        ).where(ReceiptDailyStat.user_id == user_id).order_by(ReceiptDailyStat.day)
+
+        if params.date_from:
+            query = query.where(ReceiptDailyStat.day >= params.date_from)
+        if params.date_to:
+            query = query.where(ReceiptDailyStat.day <= params.date_to)
+
+        buckets: Dict[date, Dict[str, List[float]]] = {}
+        for day, payment_type, receipt_count, total_sum in db.execute(query):
+            split = buckets.setdefault(self.period_start(day, params.bucket), {})
+            counted = split.setdefault(payment_type, [0, 0.0])
+            counted[0] += receipt_count
+            counted[1] += total_sum
+
+        return [self._bucket(period_start, split) for period_start, split in buckets.items()]
+
+    def rebuild(self, db: Session, user_id: Optional[int] = None) -> int:
+        """Recompute the rollups from the receipts table; returns the number of rollup rows written.
+
+        Days that only hold archived receipts are left as they are (see CRUDArchive.first_rebuilt_day).
+        """
+        written = 0
+        for stats_user_id in self._stats_user_ids(db, user_id):
+            first_day = crud_archive.first_rebuilt_day(db, stats_user_id)
+            rebuilt = self._rebuilt_rows(ReceiptDailyStat, stats_user_id, first_day)
+
+            day = func.date(Receipt.created_at)
+            db.execute(delete(ReceiptDailyStat).where(rebuilt))
+            db.execute(insert(ReceiptDailyStat).from_select(
+                ["user_id", "day", "payment_type", "receipt_count", "total_sum"],
+                select(
+                    Receipt.user_id, day, Receipt.payment_type, func.count(), func.coalesce(func.sum(Receipt.total), 0)
+                ).where(
+                    Receipt.user_id == stats_user_id, Receipt.payment_type.is_not(None),
+                    Receipt.created_at.is_not(None)
+                ).group_by(Receipt.user_id, day, Receipt.payment_type)
+            ))
+            if first_day is not None and first_day != date.max:
+                self._upsert_stats(db, [
+                    (stats_user_id, record["created_at"].date(), record["payment_type"], record["total"])
+                    for record in crud_archive.get_user_receipts(db, stats_user_id, self.day_start(first_day))
+                ])
+            written += db.execute(select(func.count()).select_from(ReceiptDailyStat).where(rebuilt)).scalar()
+            db.commit()
+        return written
+
+    def increment_products(
+        self, db: Session, receipt_rows: List[dict], created: Sequence[Row], receipts_in: List[ReceiptCreate]
+    ):
+        tallies: Dict[tuple, list] = {}
+        for receipt_row, db_receipt, receipt_in in zip(receipt_rows, created, receipts_in):
+            day = db_receipt.created_at.date()
+            for product in receipt_in.products:
+                key = (receipt_row["user_id"], day, normalize_product_name(product.name))
+                tally = tallies.setdefault(key, [product.name, 0, 0.0])
+                tally[1] += product.quantity
+                tally[2] += product.price * product.quantity
+
+        if tallies:
+            self._upsert_product_tallies(db, tallies)
+
+    def top_products(self, db: Session, user_id: int, params: TopProductsParams) -> List[TopProduct]:
+        quantity = func.sum(ProductDailyTally.quantity)
+        revenue = func.sum(ProductDailyTally.revenue)
+        query = select(func.min(ProductDailyTally.product_name), quantity, revenue) \
+            .where(ProductDailyTally.user_id == user_id) \
+            .group_by(ProductDailyTally.product_key) \
+            .order_by(desc(quantity if params.order_by == "quantity" else revenue), ProductDailyTally.product_key) \
+            .limit(params.limit)
+
+        if params.date_from:
+            query = query.where(ProductDailyTally.day >= params.date_from)
+        if params.date_to:
+            query = query.where(ProductDailyTally.day <= params.date_to)
+
+        return [TopProduct(name=name, quantity=quantity, revenue=revenue) for name, quantity, revenue in db.execute(query)]
+
+    def rebuild_product_tallies(self, db: Session, user_id: Optional[int] = None) -> int:
+        """Recompute the product tallies from receipts and products; returns the number of rows written.
+
+        The aggregate is streamed a day at a time and upserted every
+        REBUILD_CHUNK_SIZE rows, so memory does not grow with a user's history.
+        """
+        written = 0
+        for tally_user_id in self._tally_user_ids(db, user_id):
+            first_day = crud_archive.first_rebuilt_day(db, tally_user_id)
+            rebuilt = self._rebuilt_rows(ProductDailyTally, tally_user_id, first_day)
+            db.execute(delete(ProductDailyTally).where(rebuilt))
+            chunk: Dict[tuple, list] = {}
+            for day_tallies in self._aggregate_products_by_day(db, tally_user_id, first_day):
+                chunk.update(day_tallies)
+                if len(chunk) >= self.REBUILD_CHUNK_SIZE:
+                    self._upsert_product_tallies(db, chunk)
+                    written += len(chunk)
+                    chunk = {}
+            if chunk:
+                self._upsert_product_tallies(db, chunk)
+                written += len(chunk)
+            db.commit()
+        return written
+
+    def check_product_tallies(self, db: Session, user_id: Optional[int] = None) -> List[ProductTallyMismatch]:
+        """Compare the product tallies with an aggregate of the raw tables, user by user.
+
+        Days that only hold archived receipts are not checked (see CRUDArchive.first_rebuilt_day).
+        """
+        mismatches = []
+        for tally_user_id in self._tally_user_ids(db, user_id):
+            first_day = crud_archive.first_rebuilt_day(db, tally_user_id)
+            expected = self._aggregate_products(db, tally_user_id, first_day)
+            actual = {
+                (row.user_id, self.as_date(row.day), row.product_key): (row.quantity, row.revenue)
+                for row in db.execute(
+                    select(ProductDailyTally.user_id, ProductDailyTally.day, ProductDailyTally.product_key,
+                           ProductDailyTally.quantity, ProductDailyTally.revenue)
+                    .where(self._rebuilt_rows(ProductDailyTally, tally_user_id, first_day))
+                )
+            }
+            for key in sorted(expected.keys() | actual.keys()):
+                _, expected_quantity, expected_revenue = expected.get(key, (None, 0, 0.0))
+                actual_quantity, actual_revenue = actual.get(key, (0, 0.0))
+                if expected_quantity != actual_quantity or not math.isclose(
+                    expected_revenue, actual_revenue, rel_tol=1e-9, abs_tol=1e-6
+                ):
+                    mismatches.append(ProductTallyMismatch(
+                        user_id=key[0], day=key[1], product_key=key[2],
+                        expected_quantity=expected_quantity, expected_revenue=expected_revenue,
+                        actual_quantity=actual_quantity, actual_revenue=actual_revenue
+                    ))
+        return mismatches
+
+    def _stats_user_ids(self, db: Session, user_id: Optional[int]) -> Iterator[int]:
+        if user_id is not None:
+            return iter([user_id])
+        users = select(Receipt.user_id).where(Receipt.user_id.is_not(None)).distinct() \
+            .union(select(ReceiptDailyStat.user_id).distinct())
+        return iter(db.execute(users).scalars().all())
+
+    def _tally_user_ids(self, db: Session, user_id: Optional[int]) -> Iterator[int]:
+        if user_id is not None:
+            return iter([user_id])
+        users = select(Receipt.user_id).where(Receipt.user_id.is_not(None)).distinct() \
+            .union(select(ProductDailyTally.user_id).distinct())
+        return iter(db.execute(users).scalars().all())
+
+    def _aggregate_products(self, db: Session, user_id: int, first_day: Optional[date] = None) -> Dict[tuple, list]:
+        """Tallies of one user computed from the raw tables, keyed like ProductDailyTally.
+
+        With `first_day`, only days from then on, archived receipts on those days included.
+        """
+        tallies: Dict[tuple, list] = {}
+        for day_tallies in self._aggregate_products_by_day(db, user_id, first_day):
+            tallies.update(day_tallies)
+        return tallies
+
+    def _aggregate_products_by_day(
+        self, db: Session, user_id: int, first_day: Optional[date] = None
+    ) -> Iterator[Dict[tuple, list]]:
+        """_aggregate_products one day at a time, read from a server-side cursor in day order."""
+        if first_day == date.max:
+            return
+        day = func.date(Receipt.created_at)
+        grouped = select(
+            day, Product.name, func.sum(Product.quantity), func.sum(Product.price * Product.quantity)
+        ).join(
+            Receipt, and_(Product.receipt_id == Receipt.id, Product.receipt_created_at == Receipt.created_at)
+        ).where(
+            Receipt.user_id == user_id, Receipt.created_at.is_not(None), Product.name.is_not(None)
+        ).group_by(day, Product.name).order_by(day, Product.name).execution_options(yield_per=self.REBUILD_CHUNK_SIZE)
+
+        # Only the days from `first_day` that also hold hot receipts have archived ones, so these stay few.
+        archived = []
+        if first_day is not None:
+            archived = sorted(
+                ((record["created_at"].date(), name, quantity, price * quantity)
+                 for record in crud_archive.get_user_receipts(db, user_id, self.day_start(first_day))
+                 for name, price, quantity in record["products"]),
+                key=itemgetter(0)
+            )
+
+        rows = heapq.merge(
+            ((self.as_date(receipt_day), name, quantity, revenue)
+             for receipt_day, name, quantity, revenue in db.execute(grouped)),
+            archived,
+            key=itemgetter(0)
+        )
+        for receipt_day, day_rows in groupby(rows, key=itemgetter(0)):
+            tallies: Dict[tuple, list] = {}
+            for _, name, quantity, revenue in day_rows:
+                key = (user_id, receipt_day, normalize_product_name(name))
+                tally = tallies.setdefault(key, [name, 0, 0.0])
+                tally[1] += quantity or 0
+                tally[2] += revenue or 0.0
+            yield tallies
+
+    @staticmethod
+    def _rebuilt_rows(model, user_id: int, first_day: Optional[date]):
+        """Rollup rows of a user that a rebuild replaces: all of them, or those from `first_day` on."""
+        if first_day is None:
+            return model.user_id == user_id
+        return and_(model.user_id == user_id, model.day >= first_day)
+
+    def _upsert_stats(self, db: Session, receipts: List[Tuple[int, date, str, float]]):
+        """Add (user_id, day, payment_type, total) of receipts to the rollups."""
+        increments: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0])
+        for user_id, day, payment_type, total in receipts:
+            increments[(user_id, day, payment_type)][0] += 1
+            increments[(user_id, day, payment_type)][1] += total
+        if not increments:
+            return
+
+        upsert = dialect_insert(db)(ReceiptDailyStat)
+        db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[ReceiptDailyStat.user_id, ReceiptDailyStat.day, ReceiptDailyStat.payment_type],
+                set_={
+                    "receipt_count": ReceiptDailyStat.receipt_count + upsert.excluded.receipt_count,
+                    "total_sum": ReceiptDailyStat.total_sum + upsert.excluded.total_sum,
+                }
+            ),
+            [
+                {"user_id": user_id, "day": day, "payment_type": payment_type,
+                 "receipt_count": count, "total_sum": total_sum}
+                # Key order, so that concurrent writers lock shared rows in the same order and cannot deadlock.
+                for (user_id, day, payment_type), (count, total_sum) in sorted(increments.items())
+            ]
+        )
+
+    def _upsert_product_tallies(self, db: Session, tallies: Dict[tuple, list]):
+        upsert = dialect_insert(db)(ProductDailyTally)
+        db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[ProductDailyTally.user_id, ProductDailyTally.day, ProductDailyTally.product_key],
+                set_={
+                    "quantity": ProductDailyTally.quantity + upsert.excluded.quantity,
+                    "revenue": ProductDailyTally.revenue + upsert.excluded.revenue,
+                }
+            ),
+            [
+                {"user_id": user_id, "day": day, "product_key": product_key,
+                 "product_name": name, "quantity": quantity, "revenue": revenue}
+                # Key order rather than the client's product order; see _upsert_stats.
+                for (user_id, day, product_key), (name, quantity, revenue) in sorted(tallies.items())
+            ]
+        )
+
+    @staticmethod
+    def as_date(value) -> date:
+        # func.date() returns an ISO string on SQLite and a date on Postgres.
+        if isinstance(value, str):
+            return date.fromisoformat(value)
+        if isinstance(value, datetime):
+            return value.date()
+        return value
+
+    @staticmethod
+    def day_start(day: date) -> datetime:
+        return datetime.combine(day, time.min)
+
+    @staticmethod
+    def period_start(day: date, bucket: str) -> date:
+        if isinstance(day, datetime):
+            day = day.date()
+        if bucket == "week":
+            return day - timedelta(days=day.weekday())
+        if bucket == "month":
+            return day.replace(day=1)
+        return day
+
+    @staticmethod
+    def _bucket(period_start: date, split: Dict[str, List[float]]) -> ReceiptStatsBucket:
+        receipt_count = sum(count for count, _ in split.values())
+        total_sum = sum(total_sum for _, total_sum in split.values())
+        return ReceiptStatsBucket(
+            period_start=period_start,
+            receipt_count=receipt_count,
+            total_sum=total_sum,
+            average_basket=total_sum / receipt_count if receipt_count else 0.0,
+            payment_types={
+                payment_type: PaymentTypeStats(
+                    receipt_count=count,
+                    total_sum=payment_total,
+                    average_basket=payment_total / count if count else 0.0
+                )
+                for payment_type, (count, payment_total) in sorted(split.items())
+            }
+        )
+
+
+crud_receipt_stats = CRUDReceiptStats()
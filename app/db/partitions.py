@@ -0,0 +1,121 @@
+"""Monthly range partitions of the receipts and products tables (Postgres only).
+
+The partitioned tables themselves are created by the
+`partition_receipts_by_month` migration; these helpers add the monthly
+partitions ahead of time. Rows outside every monthly partition land in the
+`<table>_default` partition, and a monthly partition can no longer be created
+once the default partition holds rows for that month, so partitions are kept
+PARTITION_MONTHS_AHEAD months ahead of the current one.
+"""
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import Connection, text
+
+from app.main.config import settings
+
+
+# Partitioned table -> partition key column.
+PARTITIONED_TABLES = {"receipts": "created_at", "products": "receipt_created_at"}
+
+# Arbitrary key serializing concurrent partition creation, e.g. by several API workers starting at once.
+PARTITION_LOCK_KEY = 7_204_117
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def parse_partition_month(table: str, name: str) -> Optional[date]:
+    match = re.fullmatch(rf"{table}_p(\d{{4}})_(\d{{2}})", name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(text(
+        "SELECT count(*) FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = ANY(:tables) AND pg_table_is_visible(c.oid)"
+    ), {"tables": list(PARTITIONED_TABLES)}).scalar_one() == len(PARTITIONED_TABLES)
+
+
+def ensure_partitions(connection: Connection, first_month: date, last_month: date) -> List[str]:
+    """Create the missing monthly partitions from first_month through last_month; returns their names.
+
+    Does nothing unless the tables are partitioned, so it is safe on SQLite
+    and on databases built with Base.metadata.create_all.
+    """
+    if not is_partitioned(connection):
+        return []
+
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    existing = set(existing_partitions(connection))
+
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        for table in PARTITIONED_TABLES:
+            name = partition_name(table, month)
+            if name not in existing:
+                connection.exec_driver_sql(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                )
+                created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_future_partitions(
+    connection: Connection, months_ahead: Optional[int] = None, today: Optional[date] = None
+) -> List[str]:
+    """Make sure the current month and the next `months_ahead` months have partitions."""
+    if months_ahead is None:
+        months_ahead = settings.PARTITION_MONTHS_AHEAD
+    current = month_start(today or datetime.utcnow().date())
+    return ensure_partitions(connection, current, add_months(current, months_ahead))
+
+
+def existing_partitions(connection: Connection) -> List[str]:
+    return connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = ANY(:tables)"
+    ), {"tables": list(PARTITIONED_TABLES)}).scalars().all()
+
+
+def drop_empty_partitions(connection: Connection, before: date) -> List[str]:
+    """Drop the empty monthly partitions of months ending on or before `before`; returns their names.
+
+    Used after archiving, so that the space of archived months is given back
+    at once instead of waiting for VACUUM. Products partitions go first since
+    they reference the receipts partitions.
+    """
+    if not is_partitioned(connection):
+        return []
+
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    existing = set(existing_partitions(connection))
+
+    dropped = []
+    for table in reversed(list(PARTITIONED_TABLES)):
+        for name in sorted(existing):
+            month = parse_partition_month(table, name)
+            if month is None or add_months(month, 1) > before:
+                continue
+            if connection.exec_driver_sql(f"SELECT EXISTS (SELECT 1 FROM {name})").scalar():
+                continue
+            connection.exec_driver_sql(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            connection.exec_driver_sql(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
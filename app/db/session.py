@@ -1,12 +1,127 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import itertools
+import math
+import threading
+import time
+from typing import Dict, Hashable, List, Optional
+
+from fastapi import Depends, Response
+from sqlalchemy import Engine, create_engine, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from app.main.cache import LRUCache
 from app.main.config import settings
 
 SQLALCHEMY_DATABASE_URL = settings.SQLALCHEMY_DATABASE_URL
 
+
+def check_supported_dialect(url: str):
+    """Refuse to start on a database outside SUPPORTED_DIALECTS rather than fail on the first receipt insert."""
+    dialect = make_url(url).get_backend_name()
+    if dialect not in settings.SUPPORTED_DIALECTS:
+        raise RuntimeError(
+            f"Unsupported database '{dialect}': use one of {', '.join(settings.SUPPORTED_DIALECTS)}"
+        )
+
+
+check_supported_dialect(SQLALCHEMY_DATABASE_URL)
 engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+READ_AFTER_WRITE_COOKIE = "read_after_write"
+
+
+class ReplicaRouter:
+    """Routes read sessions to replicas round-robin, falling back to the primary.
+
+    A replica that fails to hand out a connection is ejected for
+    REPLICA_RETRY_SECONDS. Keys recorded with `record_write` (user ids) read
+    from the primary for REPLICA_READ_AFTER_WRITE_SECONDS, so a client always
+    sees its own writes despite replication lag. The write time travels back
+    to the client in the read_after_write cookie, which pins its reads on
+    whichever worker serves them; the cookie is unsigned, so a claimed write
+    time is never taken as later than now. Clients that drop cookies are only
+    pinned on the worker that took the write, which remembers the last
+    REPLICA_PIN_CACHE_SIZE writers.
+    """
+
+    def __init__(self, primary: Engine, replicas: List[Engine], session_factory: sessionmaker = SessionLocal):
+        self.primary = primary
+        self.replicas = replicas
+        self.session_factory = session_factory
+        self._counter = itertools.count()
+        self._ejected_until: Dict[Engine, float] = {}
+        self._written_at = LRUCache(settings.REPLICA_PIN_CACHE_SIZE)
+        self._lock = threading.Lock()
+
+    def record_write(self, key: Hashable, response: Optional[Response] = None):
+        """Pin `key` to the primary; with a response, also hand the pin to the client as a cookie."""
+        written_at = time.time()
+        self._written_at.set(key, written_at)
+        if response is not None:
+            response.set_cookie(
+                READ_AFTER_WRITE_COOKIE, f"{key}:{written_at:.3f}",
+                max_age=settings.REPLICA_READ_AFTER_WRITE_SECONDS, httponly=True, samesite="lax"
+            )
+
+    def is_pinned(self, key: Optional[Hashable], pin: Optional[str] = None) -> bool:
+        """Whether `key` wrote recently, going by this process's record and the client's cookie value `pin`."""
+        if key is None:
+            return False
+        now = time.time()
+        written_at = self._written_at.get(key) or 0.0
+        if pin:
+            pinned_key, _, pinned_at = pin.rpartition(":")
+            if pinned_key == str(key):
+                try:
+                    pinned_at = float(pinned_at)
+                except ValueError:
+                    pinned_at = math.nan
+                # The cookie comes from the client, so a far-future (or infinite) write time is ignored
+                # rather than pinning reads forever; a slightly future one is clock skew between hosts.
+                if math.isfinite(pinned_at) and pinned_at <= now + settings.REPLICA_READ_AFTER_WRITE_SECONDS:
+                    written_at = max(written_at, min(pinned_at, now))
+        return now - written_at < settings.REPLICA_READ_AFTER_WRITE_SECONDS
+
+    def eject(self, replica: Engine):
+        with self._lock:
+            self._ejected_until[replica] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+    def healthy_replicas(self) -> List[Engine]:
+        """Healthy replicas, rotated so that consecutive calls start at the next one."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [replica for replica in self.replicas if self._ejected_until.get(replica, 0) <= now]
+        if not healthy:
+            return []
+        start = next(self._counter) % len(healthy)
+        return healthy[start:] + healthy[:start]
+
+    def write_session(self) -> Session:
+        return self.session_factory(bind=self.primary)
+
+    def read_session(self, pin_key: Optional[Hashable] = None, pin: Optional[str] = None) -> Session:
+        if self.is_pinned(pin_key, pin):
+            return self.write_session()
+
+        for replica in self.healthy_replicas():
+            session = self.session_factory(bind=replica)
+            try:
+                # Check a connection out now, so that an unreachable replica is
+                # ejected here instead of failing the request later.
+                session.connection()
+                return session
+            except OperationalError:
+                session.close()
+                self.eject(replica)
+
+        return self.write_session()
+
+
+replica_router = ReplicaRouter(
+    engine,
+    [create_engine(url, pool_pre_ping=True) for url in settings.SQLALCHEMY_REPLICA_URLS]
+)
+
 
 def get_db():
     db = SessionLocal()
@@ -14,3 +129,15 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_replica_router() -> ReplicaRouter:
+    return replica_router
+
+
+def get_read_db(router: ReplicaRouter = Depends(get_replica_router)):
+    db = router.read_session()
+    try:
+        yield db
+    finally:
+        db.close()
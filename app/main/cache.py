@@ -0,0 +1,76 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+_caches = weakref.WeakSet()
+
+
+def clear_all_caches():
+    """Empty every in-process cache, e.g. after the database has been reset."""
+    for cache in list(_caches):
+        cache.clear()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with optional per-entry expiry.
+
+    With `maxweight` the cache is also bounded by the summed `weigh(value)` of
+    its entries, e.g. their length; a value heavier than that is not cached.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None,
+                 maxweight: Optional[int] = None, weigh: Callable[[Any], int] = len):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at, weight = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.weight -= weight
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        weight = self.weigh(value) if self.maxweight is not None else 0
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.weight -= previous[2]
+            if self.maxweight is not None and weight > self.maxweight:
+                return
+            self._data[key] = (value, expires_at, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                self.weight -= self._data.popitem(last=False)[1][2]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.weight -= entry[2]
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,170 @@
+"""Command line tools for maintenance jobs.
+
+Usage:
+    python -m app.main.cli ingest receipts.ndjson --username cashier [--job-id ID] [--chunk-size N]
+    python -m app.main.cli sweep-idempotency-keys
+    python -m app.main.cli rebuild-stats [--username cashier]
+    python -m app.main.cli rebuild-product-tallies [--username cashier]
+    python -m app.main.cli check-product-tallies [--username cashier]
+    python -m app.main.cli ensure-partitions [--months-ahead N]
+    python -m app.main.cli archive-receipts [--older-than-days N] [--batch-size N]
+    python -m app.main.cli backfill-receipt-renders [--batch-size N]
+"""
+import argparse
+import sys
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app.crud.archive import crud_archive
+from app.crud.ingest import crud_ingest
+from app.crud.idempotency import crud_idempotency
+from app.crud.receipt_render import crud_receipt_render
+from app.crud.receipt_stats import crud_receipt_stats
+from app.db.partitions import ensure_future_partitions
+from app.db.session import SessionLocal, engine
+from app.main.utils import get_user_by_username
+
+
+def ingest(args: argparse.Namespace):
+    def report(run):
+        print(
+            f"job {run.job_id}: line {run.line_no}, {run.receipts_inserted} inserted, "
+            f"{run.receipts_failed} failed, {run.receipts_per_second:.1f} receipts/s",
+            file=sys.stderr
+        )
+
+    with SessionLocal() as db:
+        user = get_user_by_username(db, args.username)
+        if not user:
+            raise SystemExit(f"User '{args.username}' not found")
+
+        run = crud_ingest.start(db, user.id, args.job_id, args.chunk_size, on_progress=report)
+        print(f"Ingest job id: {run.job_id} (pass --job-id to resume)", file=sys.stderr)
+
+        source = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+        with source:
+            summary = crud_ingest.ingest(db, run, iter(lambda: source.read(1 << 16), b""))
+
+    for error in summary.errors:
+        print(f"line {error.line}: {error.error}", file=sys.stderr)
+    print(summary.model_dump_json())
+
+
+def sweep_idempotency_keys(args: argparse.Namespace):
+    with SessionLocal() as db:
+        deleted = crud_idempotency.sweep_expired(db)
+    print(f"Deleted {deleted} expired idempotency keys")
+
+
+def find_user_id(db, username: Optional[str]) -> Optional[int]:
+    if not username:
+        return None
+    user = get_user_by_username(db, username)
+    if not user:
+        raise SystemExit(f"User '{username}' not found")
+    return user.id
+
+
+def rebuild_stats(args: argparse.Namespace):
+    with SessionLocal() as db:
+        written = crud_receipt_stats.rebuild(db, find_user_id(db, args.username))
+    print(f"Rebuilt {written} daily receipt stats rows")
+
+
+def rebuild_product_tallies(args: argparse.Namespace):
+    with SessionLocal() as db:
+        written = crud_receipt_stats.rebuild_product_tallies(db, find_user_id(db, args.username))
+    print(f"Rebuilt {written} daily product tally rows")
+
+
+def check_product_tallies(args: argparse.Namespace):
+    with SessionLocal() as db:
+        mismatches = crud_receipt_stats.check_product_tallies(db, find_user_id(db, args.username))
+
+    for mismatch in mismatches:
+        print(mismatch.model_dump_json())
+    if mismatches:
+        raise SystemExit(f"{len(mismatches)} product tally rows differ from receipts")
+    print("Product tallies match receipts")
+
+
+def ensure_partitions(args: argparse.Namespace):
+    with engine.begin() as connection:
+        created = ensure_future_partitions(connection, args.months_ahead)
+    print(f"Created {len(created)} partitions" + (f": {', '.join(created)}" if created else ""))
+
+
+def archive_receipts(args: argparse.Namespace):
+    cutoff = crud_archive.cutoff(args.older_than_days)
+    with SessionLocal() as db:
+        archived = crud_archive.archive_receipts(db, cutoff, args.batch_size)
+    print(f"Archived {archived} receipts created before {cutoff.isoformat()}")
+
+
+def backfill_receipt_renders(args: argparse.Namespace):
+    with SessionLocal() as db:
+        rendered = crud_receipt_render.backfill(db, args.batch_size)
+    print(f"Stored {rendered} pre-rendered receipts")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.main.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Load newline-delimited ReceiptCreate JSON")
+    ingest_parser.add_argument("path", help="NDJSON file, or '-' for stdin")
+    ingest_parser.add_argument("--username", required=True, help="Owner of the ingested receipts")
+    ingest_parser.add_argument("--job-id", help="Resume an earlier job from its last committed chunk")
+    ingest_parser.add_argument("--chunk-size", type=int, help="Receipts per transaction")
+    ingest_parser.set_defaults(handler=ingest)
+
+    sweep_parser = subparsers.add_parser(
+        "sweep-idempotency-keys", help="Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS"
+    )
+    sweep_parser.set_defaults(handler=sweep_idempotency_keys)
+
+    stats_parser = subparsers.add_parser("rebuild-stats", help="Recompute daily receipt stats from the receipts table")
+    stats_parser.add_argument("--username", help="Only rebuild this user's stats")
+    stats_parser.set_defaults(handler=rebuild_stats)
+
+    tallies_parser = subparsers.add_parser(
+        "rebuild-product-tallies", help="Recompute daily product tallies from receipts and products"
+    )
+    tallies_parser.add_argument("--username", help="Only rebuild this user's tallies")
+    tallies_parser.set_defaults(handler=rebuild_product_tallies)
+
+    check_parser = subparsers.add_parser(
+        "check-product-tallies", help="Report product tallies that differ from receipts and products"
+    )
+    check_parser.add_argument("--username", help="Only check this user's tallies")
+    check_parser.set_defaults(handler=check_product_tallies)
+
+    partitions_parser = subparsers.add_parser(
+        "ensure-partitions", help="Create the monthly receipts/products partitions of the coming months"
+    )
+    partitions_parser.add_argument("--months-ahead", type=int, help="Defaults to PARTITION_MONTHS_AHEAD")
+    partitions_parser.set_defaults(handler=ensure_partitions)
+
+    archive_parser = subparsers.add_parser(
+        "archive-receipts", help="Move old receipts from the database into the ARCHIVE_DIR segment files"
+    )
+    archive_parser.add_argument("--older-than-days", type=int, help="Defaults to ARCHIVE_AFTER_DAYS")
+    archive_parser.add_argument("--batch-size", type=int, help="Receipts per transaction")
+    archive_parser.set_defaults(handler=archive_receipts)
+
+    renders_parser = subparsers.add_parser(
+        "backfill-receipt-renders", help="Store the default-width text of receipts created without one"
+    )
+    renders_parser.add_argument("--batch-size", type=int, help="Receipts per transaction")
+    renders_parser.set_defaults(handler=backfill_receipt_renders)
+
+    args = parser.parse_args(argv)
+    try:
+        args.handler(args)
+    except HTTPException as e:
+        raise SystemExit(e.detail)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import List, Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -20,8 +21,39 @@ class Settings:
     API_STR = "/api"
     auth_jwt = AuthJWT()
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Receipts, counters and rollups are written with ON CONFLICT upserts, which only these dialects offer.
+    SUPPORTED_DIALECTS: List[str] = ["postgresql", "sqlite"]
     SQLALCHEMY_DATABASE_URL: str = os.getenv("SQLALCHEMY_DATABASE_URL")
     SQLALCHEMY_TEST_DATABASE_URL: str = os.getenv("SQLALCHEMY_TEST_DATABASE_URL")
+    SQLALCHEMY_REPLICA_URLS: List[str] = [
+        url.strip() for url in os.getenv("SQLALCHEMY_REPLICA_URLS", "").split(",") if url.strip()
+    ]
+    REPLICA_RETRY_SECONDS: int = int(os.getenv("REPLICA_RETRY_SECONDS", 30))
+    REPLICA_READ_AFTER_WRITE_SECONDS: int = int(os.getenv("REPLICA_READ_AFTER_WRITE_SECONDS", 5))
+    REPLICA_PIN_CACHE_SIZE: int = int(os.getenv("REPLICA_PIN_CACHE_SIZE", 100000))
+    INGEST_CHUNK_SIZE: int = int(os.getenv("INGEST_CHUNK_SIZE", 1000))
+    INGEST_MAX_LINE_BYTES: int = int(os.getenv("INGEST_MAX_LINE_BYTES", 1024 * 1024))
+    IDEMPOTENCY_KEY_TTL_HOURS: int = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", 24))
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+    IDEMPOTENCY_SWEEP_INTERVAL_SECONDS: int = int(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL_SECONDS", 300))
+    RECEIPT_VERSION_CACHE_SIZE: int = int(os.getenv("RECEIPT_VERSION_CACHE_SIZE", 100000))
+    RECEIPT_RENDER_CACHE_SIZE: int = int(os.getenv("RECEIPT_RENDER_CACHE_SIZE", 10000))
+    RECEIPT_RENDER_CACHE_MAX_CHARS: int = int(os.getenv("RECEIPT_RENDER_CACHE_MAX_CHARS", 64 * 1024 * 1024))
+    RENDER_POOL_WORKERS: int = int(os.getenv("RENDER_POOL_WORKERS", os.cpu_count() or 1))
+    RENDER_POOL_MIN_BATCH: int = int(os.getenv("RENDER_POOL_MIN_BATCH", 200))
+    RENDER_POOL_CHUNK_SIZE: int = int(os.getenv("RENDER_POOL_CHUNK_SIZE", 50))
+    RECEIPT_PRERENDER: bool = os.getenv("RECEIPT_PRERENDER", "false").lower() in ("1", "true", "yes")
+    RECEIPT_SNAPSHOT_DIR: Optional[Path] = Path(os.environ["RECEIPT_SNAPSHOT_DIR"]) \
+        if os.getenv("RECEIPT_SNAPSHOT_DIR") else None
+    RECEIPT_SNAPSHOT_MAX_BYTES: int = int(os.getenv("RECEIPT_SNAPSHOT_MAX_BYTES", 1024 * 1024 * 1024))
+    RECEIPT_SNAPSHOT_LINE_LENGTHS: List[int] = [
+        int(width) for width in os.getenv("RECEIPT_SNAPSHOT_LINE_LENGTHS", "40").split(",") if width.strip()
+    ]
+    RECEIPT_COUNT_EXACT_THRESHOLD: int = int(os.getenv("RECEIPT_COUNT_EXACT_THRESHOLD", 10000))
+    PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+    ARCHIVE_DIR: Path = Path(os.getenv("ARCHIVE_DIR", BASE_DIR / "archive"))
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", 730))
+    ARCHIVE_SEGMENT_MAX_BYTES: int = int(os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", 64 * 1024 * 1024))
 
 
 settings = Settings()
@@ -0,0 +1,29 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+
+def encode_default(value: Any) -> Any:
+    """orjson fallback for the slotted read-path records (ReceiptRow, ProductRow)."""
+    as_dict = getattr(value, "as_dict", None)
+    if as_dict is None:
+        raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+    return as_dict()
+
+
+class FastJSONResponse(Response):
+    """JSON response that encodes payloads straight to bytes.
+
+    Returning it from a route skips FastAPI's response_model round trip
+    (validate -> jsonable_encoder -> json.dumps). The CRUD read paths already
+    build records in the response model's field order, so orjson produces
+    the same JSON; pydantic models use their compiled core serializer.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return orjson.dumps(content, default=encode_default)
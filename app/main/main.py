@@ -1,12 +1,51 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 
 from app.api.routers import api_router
+from app.crud.idempotency import crud_idempotency
+from app.db.partitions import ensure_future_partitions
+from app.db.session import SessionLocal, engine
+from app.main import render_pool
 from app.main.config import settings
 
 
+logger = logging.getLogger(__name__)
+
+
+def sweep_idempotency_keys():
+    with SessionLocal() as db:
+        crud_idempotency.sweep_expired(db)
+
+
+async def sweep_idempotency_keys_periodically():
+    """Expire idempotency keys off the request path, every IDEMPOTENCY_SWEEP_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(settings.IDEMPOTENCY_SWEEP_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(sweep_idempotency_keys)
+        except Exception:
+            logger.exception("Sweeping expired idempotency keys failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep monthly receipt partitions ahead of time; also run `ensure-partitions` from cron
+    # for deployments that restart rarely.
+    with engine.begin() as connection:
+        ensure_future_partitions(connection)
+    sweeper = asyncio.create_task(sweep_idempotency_keys_periodically())
+    yield
+    sweeper.cancel()
+    render_pool.shutdown()
+
+
 app = FastAPI(
-    title=settings.PROJECT_NAME, openapi_url=f"{settings.API_STR}/openapi.json"
+    title=settings.PROJECT_NAME, openapi_url=f"{settings.API_STR}/openapi.json", lifespan=lifespan
 )
 
 
@@ -0,0 +1,333 @@
+import html
+import re
+import string
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+
+DEFAULT_LINE_LENGTH = 40
+STREAM_CHUNK_CHARS = 64 * 1024
+THANK_YOU_MESSAGE = "Thank you for your purchase!"
+# Bump whenever a layout renders differently, so that stored renders (snapshots) and the ETags
+# clients cached them under are not reused across the change.
+RENDER_VERSION = 1
+
+
+class ReceiptFields(NamedTuple):
+    """The receipt columns a render needs, in a form that is cheap to send to a worker process."""
+    total: float
+    payment_type: str
+    payment_amount: float
+    rest: float
+    created_at: datetime
+
+
+class ProductFields(NamedTuple):
+    name: str
+    price: float
+    quantity: int
+
+
+# The elements of a receipt and the values each one's template may use. `pad` is the run of
+# spaces that aligns the element in a fixed-width layout; `rule` and `separator` span the line.
+ELEMENT_FIELDS = {
+    "start": set(),
+    "title": {"text", "pad"},
+    "rule": {"rule"},
+    "item": {"quantity", "price", "name", "total"},
+    "name_line": {"name", "pad"},
+    "name_last": {"name", "pad", "total"},
+    "separator": {"separator"},
+    "field": {"label", "value", "pad"},
+    "footer": {"text", "pad"},
+    "end": set(),
+}
+
+# The generator every layout is compiled into; $-placeholders are filled with the layout's
+# elements as f-string expressions and with its escape function.
+RENDER_FUNCTION = string.Template('''
+def fragments(username, receipt, products, line_length):
+    name_width = line_length // 2
+    rule = "=" * line_length
+    separator = "-" * line_length
+    rule_fragment = $rule
+    separator_fragment = $separator
+    text, pad = $escape(username), " " * ((line_length - len(username)) // 2)
+    yield $start
+    yield $title
+    yield rule_fragment
+
+    first = True
+    for product in products:
+        if first:
+            first = False
+        else:
+            yield separator_fragment
+        quantity, price, full_name = product.quantity, product.price, product.name
+        total = f"{quantity * price:.2f}"
+        name = $escape(full_name)
+        yield $item
+$name_lines
+    yield rule_fragment
+    # The payment amount has always been printed as-is rather than with two decimals.
+    for label, value in (("Total:", f"{receipt.total:.2f}"), ("Payment type:", f"{receipt.payment_type}"),
+                         ("Payment amount:", f"{receipt.payment_amount}"), ("Rest:", f"{receipt.rest:.2f}")):
+        pad = " " * (line_length - len(label) - len(value))
+        value = $escape(value)
+        yield $field
+    yield rule_fragment
+
+    for text in (receipt.created_at.strftime('%d.%m.%Y %H:%M'), THANK_YOU_MESSAGE):
+        pad = " " * ((line_length - len(text)) // 2)
+        text = $escape(text)
+        yield $footer
+    yield $end
+''')
+NAME_LINES = string.Template('''
+        if len(full_name) > name_width:
+            *leading, last = wrap_lines(full_name, name_width)
+            for line in leading:
+                pad = " " * (line_length - len(line))
+                name = $escape(line)
+                yield $name_line
+        else:
+            last = full_name
+        pad = " " * (line_length - len(last) - len(total))
+        name = $escape(last)
+        yield $name_last
+''')
+
+
+class Layout(NamedTuple):
+    name: str
+    media_type: str
+    fragments: Callable[[str, object, Iterable, int], Iterator[str]]
+    finish: Callable[[str, int], Union[str, bytes]]
+    # Encodes one piece of a streamed document; None for formats that can only be built whole.
+    encode: Optional[Callable[[str], bytes]]
+
+    def render(self, username: str, receipt, products: Iterable, line_length: int) -> Union[str, bytes]:
+        return self.finish("".join(self.fragments(username, receipt, products, line_length)), line_length)
+
+
+def compile_layout(
+    name: str, media_type: str, template: Dict[str, str], fixed_width: bool = True,
+    escape: Optional[Callable[[str], str]] = None,
+    finish: Callable[[str, int], Union[str, bytes]] = lambda text, _: text,
+    encode: Optional[Callable[[str], bytes]] = str.encode
+) -> Layout:
+    """Compile a layout template, a `str.format` fragment per element, into one render generator.
+
+    The fragments become f-strings inlined into a single-pass loop that yields
+    the document piece by piece, so rendering makes no per-line format calls.
+    Fixed-width layouts print product names wrapped into `name_line` and
+    `name_last` lines after the `item` line; the others get the whole name in
+    `item`. Values are escaped before they are substituted; paddings are
+    computed from the unescaped text. `finish` turns the joined document into
+    the response body, `encode` a piece of a streamed one.
+    """
+    if set(template) != set(ELEMENT_FIELDS):
+        raise ValueError(f"Layout '{name}' must define exactly: {', '.join(ELEMENT_FIELDS)}")
+
+    expressions = {}
+    for element, fragment in template.items():
+        for _, field, spec, _ in string.Formatter().parse(fragment):
+            if field is not None and (field not in ELEMENT_FIELDS[element] or "{" in (spec or "")):
+                raise ValueError(f"Layout '{name}' element '{element}' cannot use '{{{field}}}'")
+        expressions[element] = "f" + repr(fragment) if fragment else '""'
+
+    escape_call = "escape" if escape else ""
+    source = RENDER_FUNCTION.substitute(
+        expressions, escape=escape_call,
+        name_lines=NAME_LINES.substitute(expressions, escape=escape_call) if fixed_width else ""
+    )
+    namespace = {"escape": escape, "wrap_lines": wrap_lines, "THANK_YOU_MESSAGE": THANK_YOU_MESSAGE}
+    exec(compile(source, f"<layout {name}>", "exec"), namespace)
+    return Layout(name, media_type, namespace["fragments"], finish, encode)
+
+
+def wrap_lines(text: str, width: int) -> Iterator[str]:
+    """Same lines as `utils.wrap_text`, found by moving an index instead of re-slicing the rest of the text."""
+    start, end = 0, len(text)
+    while end - start > width:
+        split_point = text.rfind(' ', start, start + width)
+        if split_point == -1:
+            split_point = start + width
+        yield text[start:split_point]
+        start = split_point
+        while start < end and text[start].isspace():
+            start += 1
+    yield text[start:]
+
+
+def render_receipt(layout_name: str, username: str, receipt, products: Iterable, line_length: int) -> Union[str, bytes]:
+    """Render a receipt in one of the LAYOUTS, in a single pass over its products.
+
+    `receipt` needs total, payment_type, payment_amount, rest and created_at;
+    every product needs name, price and quantity. Fragments are collected in
+    a list and joined once, so the cost is linear in the size of the output.
+    """
+    return LAYOUTS[layout_name].render(username, receipt, products, line_length)
+
+
+def stream_receipt(
+    layout_name: str, username: str, receipt, products: Iterable, line_length: int,
+    chunk_chars: Optional[int] = None
+) -> Iterator[bytes]:
+    """Yield the encoded receipt in pieces of about `chunk_chars` characters while consuming `products`.
+
+    Pieces default to STREAM_CHUNK_CHARS characters. Only the current piece is
+    held in memory, so with `products` read from a server-side cursor memory
+    use does not grow with the receipt. The pieces add up to the same bytes as
+    render_receipt.
+    """
+    layout = LAYOUTS[layout_name]
+    chunk_chars = chunk_chars or STREAM_CHUNK_CHARS
+    buffer, size = [], 0
+    for fragment in layout.fragments(username, receipt, products, line_length):
+        buffer.append(fragment)
+        size += len(fragment)
+        if size >= chunk_chars:
+            yield layout.encode("".join(buffer))
+            buffer, size = [], 0
+    if buffer:
+        yield layout.encode("".join(buffer))
+
+
+TEXT_TEMPLATE = {
+    "start": "",
+    "title": "{pad}{text}\n",
+    "rule": "{rule}\n",
+    "item": "{quantity:.2f} x {price:.2f}\n",
+    "name_line": "{name}{pad}\n",
+    "name_last": "{name}{pad}{total}\n",
+    "separator": "{separator}\n",
+    "field": "{label}{pad}{value}\n",
+    "footer": "{pad}{text}\n",
+    "end": "",
+}
+
+# ESC/POS: the text layout plus printer commands. ESC @ resets the printer, ESC t 0 selects
+# code page PC437, ESC a n aligns (1 = centre), ESC E n toggles bold and GS V B 0 feeds
+# the paper up to the cutter and cuts it.
+ESCPOS_TEMPLATE = dict(
+    TEXT_TEMPLATE,
+    start="\x1b@\x1bt\x00",
+    title="\x1ba\x01\x1bE\x01{text}\x1bE\x00\n\x1ba\x00",
+    footer="\x1ba\x01{text}\n\x1ba\x00",
+    end="\n\n\n\x1dVB\x00",
+)
+# Control characters in names would otherwise reach the printer as commands.
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x1f]")
+
+HTML_STYLE = (
+    "table{font-family:monospace;border-collapse:collapse}td,th{padding:2px 8px;text-align:left}"
+    ".amount{text-align:right}.center{text-align:center}"
+)
+HTML_TEMPLATE = {
+    "start": (
+        '<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>Receipt</title>'
+        '<style>' + HTML_STYLE.replace("{", "{{").replace("}", "}}") + '</style></head>\n'
+        '<body>\n<table class="receipt">\n'
+    ),
+    "title": '<caption>{text}</caption>\n',
+    "rule": "",
+    "item": '<tr><td>{name}<br>{quantity:.2f} x {price:.2f}</td><td class="amount">{total}</td></tr>\n',
+    "name_line": "",
+    "name_last": "",
+    "separator": "",
+    "field": '<tr><th>{label}</th><td class="amount">{value}</td></tr>\n',
+    "footer": '<tr><td colspan="2" class="center">{text}</td></tr>\n',
+    "end": "</table>\n</body>\n</html>\n",
+}
+
+# PDF: every line of the text layout becomes a "show text, next line" operation in Courier,
+# and pdf_document lays those operations out on pages.
+PDF_TEMPLATE = {
+    element: "".join(f"({line}) Tj T*\n" for line in fragment.split("\n")[:-1])
+    for element, fragment in TEXT_TEMPLATE.items()
+}
+# Line breaks and other control characters would split an operation over several lines.
+PDF_SPECIAL_CHARACTERS = re.compile(r"[\\()\x00-\x1f]")
+PDF_FONT_SIZE = 9
+PDF_LEADING = 11
+PDF_MARGIN = 18
+PDF_LINES_PER_PAGE = 70
+
+
+def encode_charmap(text: str, encoding: str) -> bytes:
+    """Encode for a single-byte code page, taking the much faster ASCII codec when it suffices."""
+    if text.isascii():
+        return text.encode("ascii")
+    return text.encode(encoding, errors="replace")
+
+
+def escape_pdf(text: str) -> str:
+    return PDF_SPECIAL_CHARACTERS.sub(lambda match: "\\" + match[0] if match[0] in "\\()" else "", text)
+
+
+def pdf_document(operations: str, line_length: int) -> bytes:
+    """A minimal PDF 1.4 file: Courier pages of up to PDF_LINES_PER_PAGE lines, as wide as the line length."""
+    lines = [line + "\n" for line in operations.split("\n")[:-1]]
+    pages = [lines[start:start + PDF_LINES_PER_PAGE] for start in range(0, len(lines), PDF_LINES_PER_PAGE)]
+    # Courier glyphs are 600/1000 of the font size wide.
+    width = line_length * PDF_FONT_SIZE * 0.6 + 2 * PDF_MARGIN
+
+    page_ids = [4 + 2 * index for index in range(len(pages))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] "
+        f"/Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>",
+    ]
+    for page_id, page in zip(page_ids, pages):
+        height = len(page) * PDF_LEADING + 2 * PDF_MARGIN
+        content = encode_charmap(
+            f"BT /F1 {PDF_FONT_SIZE} Tf {PDF_LEADING} TL {PDF_MARGIN} {height - PDF_MARGIN - PDF_FONT_SIZE} Td\n"
+            + "".join(page) + "ET\n",
+            "cp1252"
+        )
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:g} {height}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    document = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(document))
+        document += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(document)
+    document += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    document += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    document += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(document)
+
+
+# Compiled once, at import.
+LAYOUTS: Dict[str, Layout] = {
+    layout.name: layout for layout in [
+        compile_layout("text", "text/plain; charset=utf-8", TEXT_TEMPLATE),
+        compile_layout("escpos", "application/octet-stream", ESCPOS_TEMPLATE,
+                       escape=partial(CONTROL_CHARACTERS.sub, ""),
+                       finish=lambda text, _: encode_charmap(text, "cp437"),
+                       encode=partial(encode_charmap, encoding="cp437")),
+        compile_layout("html", "text/html; charset=utf-8", HTML_TEMPLATE, fixed_width=False, escape=html.escape),
+        compile_layout("pdf", "application/pdf", PDF_TEMPLATE,
+                       escape=escape_pdf, finish=pdf_document, encode=None),
+    ]
+}
+
+
+def render_receipt_text(username: str, receipt, products: Iterable, line_length: int) -> str:
+    """The fixed-width plain-text receipt."""
+    return LAYOUTS["text"].render(username, receipt, products, line_length)
+
+
+def render_receipts_text(
+    username: str, receipts: Sequence[Tuple[ReceiptFields, List[ProductFields]]], line_length: int
+) -> List[str]:
+    """Render several receipts of one owner; the unit of work handed to the render pool."""
+    return [render_receipt_text(username, receipt, products, line_length) for receipt, products in receipts]
@@ -0,0 +1,56 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from app.main.config import settings
+from app.main.render import ProductFields, ReceiptFields, render_receipts_text
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """The shared render process pool, started on first use.
+
+    Workers are spawned rather than forked, so they never inherit the
+    server's threads, locks or database connections; they only import
+    app.main.render.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.RENDER_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+def render_many(
+    username: str, receipts: Sequence[Tuple[ReceiptFields, List[ProductFields]]], line_length: int
+) -> Iterator[str]:
+    """Yield the rendered receipts in order.
+
+    Batches of at least RENDER_POOL_MIN_BATCH receipts are split into chunks
+    rendered in parallel by the process pool; smaller ones are rendered in
+    this process, where they finish before a chunk could be shipped out.
+    """
+    if len(receipts) < settings.RENDER_POOL_MIN_BATCH:
+        yield from render_receipts_text(username, receipts, line_length)
+        return
+
+    chunk_size = settings.RENDER_POOL_CHUNK_SIZE
+    chunks = [receipts[start:start + chunk_size] for start in range(0, len(receipts), chunk_size)]
+    for texts in get_executor().map(
+        render_receipts_text, [username] * len(chunks), chunks, [line_length] * len(chunks)
+    ):
+        yield from texts
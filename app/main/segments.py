@@ -0,0 +1,89 @@
+import fcntl
+import os
+import re
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+
+SEGMENT_NAME = re.compile(r"segment-(\d{6})\.seg")
+# Every record is a 4-byte big-endian length followed by that many bytes of zlib data.
+RECORD_HEADER = struct.Struct(">I")
+
+
+class SegmentStore:
+    """Append-only segment files of individually compressed records.
+
+    Records are compressed one by one, so reading one back is a single
+    positioned read of its own bytes plus one decompress, however large the
+    segment grows. A new segment is started once the current one reaches
+    `max_bytes`. Writers take an exclusive flock on the segment they append to.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def append(self, payloads: List[bytes]) -> List[Tuple[str, int, int]]:
+        """Append records and fsync them; returns (segment, offset, length) of each compressed record."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        locations = []
+        pending = list(payloads)
+
+        while pending:
+            segment = self._writable_segment()
+            with open(self.directory / segment, "ab") as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    offset = file.seek(0, os.SEEK_END)
+                    # Another writer may have filled the segment while we waited for the lock.
+                    if offset >= self.max_bytes:
+                        continue
+                    while pending and offset < self.max_bytes:
+                        data = zlib.compress(pending.pop(0))
+                        file.write(RECORD_HEADER.pack(len(data)) + data)
+                        locations.append((segment, offset + RECORD_HEADER.size, len(data)))
+                        offset += RECORD_HEADER.size + len(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+        return locations
+
+    def read(self, segment: str, offset: int, length: int) -> bytes:
+        if not SEGMENT_NAME.fullmatch(segment):
+            raise ValueError(f"Invalid segment name: {segment}")
+        fd = os.open(self.directory / segment, os.O_RDONLY)
+        try:
+            data = os.pread(fd, length, offset)
+        finally:
+            os.close(fd)
+        if len(data) != length:
+            raise ValueError(f"Truncated record in {segment} at offset {offset}")
+        return zlib.decompress(data)
+
+    def scan(self, segment: str) -> Iterator[Tuple[int, int, bytes]]:
+        """Yield (offset, length, payload) of every record in a segment, e.g. to rebuild an index."""
+        with open(self.directory / segment, "rb") as file:
+            while header := file.read(RECORD_HEADER.size):
+                (length,) = RECORD_HEADER.unpack(header)
+                offset = file.tell()
+                yield offset, length, zlib.decompress(file.read(length))
+
+    def segments(self) -> List[str]:
+        if not self.directory.exists():
+            return []
+        return sorted(path.name for path in self.directory.iterdir() if SEGMENT_NAME.fullmatch(path.name))
+
+    def _writable_segment(self) -> str:
+        segments = self.segments()
+        if segments:
+            last = segments[-1]
+            if (self.directory / last).stat().st_size < self.max_bytes:
+                return last
+            number = int(SEGMENT_NAME.fullmatch(last).group(1)) + 1
+        else:
+            number = 1
+        return f"segment-{number:06d}.seg"
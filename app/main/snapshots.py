@@ -0,0 +1,115 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class Snapshot(NamedTuple):
+    path: Path
+    stat: os.stat_result
+
+
+class SnapshotStore:
+    """Rendered documents kept as files on local disk, written once and served straight from the file.
+
+    A document's path is derived from the sha256 of its key, fanned out over
+    256 subdirectories. Files are written to a temporary name in the target
+    directory and renamed into place, so readers see a whole file or none.
+    Once the store grows past `max_bytes`, the least recently used files are
+    deleted until it is back under `LOW_WATER` of that. Recency is the mtime,
+    which a hit refreshes at most once per `TOUCH_INTERVAL` seconds to keep
+    hits to a single stat; files nobody asks for any more, e.g. those of an
+    older key version, go first. Every process keeps its own running total
+    and rescans the directory when it crosses the limit.
+    """
+    LOW_WATER = 0.9
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / digest[:2] / digest[2:]
+
+    def get(self, key: str) -> Optional[Snapshot]:
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.TOUCH_INTERVAL:
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        return Snapshot(path, stat)
+
+    def put(self, key: str, data: bytes) -> Optional[Snapshot]:
+        """Store `data` under `key`; returns None, storing nothing, when it alone would not fit after an eviction."""
+        if len(data) > self.max_bytes * self.LOW_WATER:
+            return None
+
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        with self._lock:
+            if self.size is None:
+                self.size = sum(size for _, _, size in self._files())
+            else:
+                self.size += len(data)
+            if self.size > self.max_bytes:
+                self.size = self._evict(int(self.max_bytes * self.LOW_WATER), keep=path)
+        try:
+            return Snapshot(path, os.stat(path))
+        except FileNotFoundError:
+            # Evicted by another process in the meantime.
+            return None
+
+    def _evict(self, target_bytes: int, keep: Path) -> int:
+        """Delete the least recently used files, never `keep`, until the store is at most `target_bytes`."""
+        files = sorted(self._files())
+        size = sum(file_size for _, _, file_size in files)
+        for _, file_path, file_size in files:
+            if size <= target_bytes:
+                break
+            if file_path == str(keep):
+                continue
+            try:
+                os.unlink(file_path)
+            except FileNotFoundError:
+                # Another process evicted it first.
+                pass
+            size -= file_size
+        return size
+
+    def _files(self) -> List[Tuple[float, str, int]]:
+        """(mtime, path, size) of every stored file, temporary files of writes in progress excluded."""
+        files = []
+        if not self.directory.exists():
+            return files
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        return files
@@ -1,10 +1,18 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Optional
+
 from app.schemas.receipt import ReceiptCreate
-from fastapi import Depends, HTTPException, status
+from fastapi import Cookie, Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.schemas.user import UserSchema
-from app.db.session import get_db
+from app.db.session import get_replica_router, ReplicaRouter, READ_AFTER_WRITE_COOKIE
 from app.main.security import decode_jwt
 from jwt.exceptions import InvalidTokenError
 
@@ -44,6 +52,82 @@ def validate_receipt_data(receipt_in: ReceiptCreate, rest: float):
             status_code=400, detail="Insufficient payment amount")
 
 
+def encode_cursor(order_by: str, value, last_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([order_by, value, last_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_order_by, value, last_id = json.loads(payload)
+        if cursor_order_by != order_by or not isinstance(last_id, int):
+            raise ValueError
+        if order_by == "created_at":
+            value = datetime.fromisoformat(value)
+        else:
+            value = float(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, last_id
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" if e["loc"] else e["msg"]
+        for e in error.errors()
+    )
+
+
+def dialect_insert(db: Session):
+    """Return the dialect-specific insert() construct, which supports ON CONFLICT upserts.
+
+    Other dialects are refused at startup by check_supported_dialect.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+def receipt_etag(receipt_id: int, created_at: datetime, variant: str = "") -> str:
+    """Strong ETag of an immutable receipt representation."""
+    digest = hashlib.sha1(f"{receipt_id}:{created_at.isoformat()}:{variant}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored.
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class StreamBuffer:
+    """Write-only file object whose contents are handed out in pieces, e.g. to stream a zip archive.
+
+    It has no tell() or seek(), so zipfile writes the archive strictly sequentially.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
 def wrap_text(text, max_length):
     wrapped_lines = []
     while len(text) > max_length:
@@ -78,13 +162,32 @@ def get_current_token_payload(
 
 def get_current_auth_user(
     payload: dict = Depends(get_current_token_payload),
-    db: Session = Depends(get_db)
+    router: ReplicaRouter = Depends(get_replica_router)
 ) -> UserSchema:
     username: str | None = payload.get("sub")
-    user = get_user_by_username(db, username)
+    with router.read_session() as db:
+        user = get_user_by_username(db, username)
+        from_replica = db.get_bind() is not router.primary
+    if user is None and from_replica:
+        # The replica may not have caught up with a user who just registered.
+        with router.write_session() as db:
+            user = get_user_by_username(db, username)
     if user:
         return user
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Token invalid (user not found)",
     )
+
+
+def get_user_read_db(
+    user: UserSchema = Depends(get_current_auth_user),
+    router: ReplicaRouter = Depends(get_replica_router),
+    read_after_write: Optional[str] = Cookie(None, alias=READ_AFTER_WRITE_COOKIE)
+):
+    """Read session for an authenticated user; pinned to the primary right after that user wrote."""
+    db = router.read_session(user.id, read_after_write)
+    try:
+        yield db
+    finally:
+        db.close()
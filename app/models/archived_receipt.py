@@ -0,0 +1,14 @@
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, String
+from app.db.base_class import Base
+
+
+class ArchivedReceipt(Base):
+    """Index of receipts moved to the cold-storage segment files (see CRUDArchive)."""
+    __tablename__ = "archived_receipts"
+
+    receipt_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(DateTime, nullable=False)
+    segment = Column(String, nullable=False)
+    offset = Column(BigInteger, nullable=False)
+    length = Column(Integer, nullable=False)
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint
+from app.db.base_class import Base
+from datetime import datetime
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    key = Column(String)
+    request_hash = Column(String)
+    # Not a foreign key: the partitioned receipts table is only unique on (id, created_at).
+    receipt_id = Column(Integer)
+    response = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,15 +1,31 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float
+from sqlalchemy import Column, DDL, DateTime, Integer, String, ForeignKey, Float, Index, event
 from app.db.base_class import Base
 
 
 class Product(Base):
+    """A receipt line; on Postgres partitioned like receipts, by its receipt's created_at month."""
     __tablename__ = "products"
+    __table_args__ = (
+        # Trigram index serving the ILIKE '%term%' product_name search; Postgres only.
+        Index(
+            "ix_products_name_trgm", "name",
+            postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     price = Column(Float)
     quantity = Column(Integer)
-    receipt_id = Column(Integer, ForeignKey("receipts.id"))
+    # The partitioned tables reference receipts by (receipt_id, receipt_created_at).
+    receipt_id = Column(Integer, ForeignKey("receipts.id"), index=True)
+    receipt_created_at = Column(DateTime, nullable=False)
 
     def total_price(self):
         return self.price * self.quantity
+
+
+event.listen(
+    Product.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Date, Float, Integer, String, ForeignKey
+from app.db.base_class import Base
+
+
+class ProductDailyTally(Base):
+    __tablename__ = "product_daily_tallies"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    # Normalized product name (see normalize_product_name); product_name keeps the first spelling seen.
+    product_key = Column(String, primary_key=True)
+    product_name = Column(String, nullable=False)
+    quantity = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
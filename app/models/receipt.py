@@ -1,19 +1,39 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 from datetime import datetime
 
 
 class Receipt(Base):
+    """A receipt; on Postgres the table is range-partitioned by created_at month.
+
+    The partitioned table's primary key is (id, created_at), as Postgres requires
+    the partition key in it, while `id` alone stays the ORM identity and unique
+    through its sequence. Ids are never reused, also on SQLite.
+    """
     __tablename__ = "receipts"
+    __table_args__ = (
+        # Composite indexes matching the filters and orderings of CRUDReceipt.get_receipts.
+        Index("ix_receipts_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_receipts_user_id_total", "user_id", "total", "id"),
+        Index("ix_receipts_user_id_payment_type", "user_id", "payment_type", "created_at", "id"),
+        # Archiving deletes the newest rows too; SQLite would hand their ids out again, and ids key
+        # the public renders, snapshots and ETags of the archived receipts.
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     total = Column(Float)
     payment_type = Column(String)
     payment_amount = Column(Float)
     rest = Column(Float)
 
-    products = relationship("Product", backref="receipts")
+    # Joining on the partition key as well lets Postgres prune the products partitions.
+    products = relationship(
+        "Product", backref="receipts",
+        primaryjoin="and_(Receipt.id == foreign(Product.receipt_id), "
+                    "Receipt.created_at == foreign(Product.receipt_created_at))"
+    )
     user = relationship("User", backref="receipts")
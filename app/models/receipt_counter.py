@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, String, ForeignKey
+from app.db.base_class import Base
+
+
+class ReceiptCounter(Base):
+    __tablename__ = "receipt_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    payment_type = Column(String, primary_key=True)
+    receipt_count = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Date, Float, Integer, String, ForeignKey
+from app.db.base_class import Base
+
+
+class ReceiptDailyStat(Base):
+    __tablename__ = "receipt_daily_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    payment_type = Column(String, primary_key=True)
+    receipt_count = Column(Integer, default=0, nullable=False)
+    total_sum = Column(Float, default=0.0, nullable=False)
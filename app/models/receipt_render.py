@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, LargeBinary
+from app.db.base_class import Base
+
+
+class ReceiptRender(Base):
+    """Default-width public receipt text, rendered once and stored zlib-compressed (see CRUDReceiptRender)."""
+    __tablename__ = "receipt_renders"
+
+    receipt_id = Column(Integer, primary_key=True)
+    compressed_text = Column(LargeBinary, nullable=False)
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List
+
+
+class IngestError(BaseModel):
+    line: int
+    error: str
+
+
+class IngestSummary(BaseModel):
+    job_id: str
+    lines_processed: int
+    lines_committed: int
+    receipts_inserted: int
+    receipts_failed: int
+    errors: List[IngestError]
+    elapsed_seconds: float
+    receipts_per_second: float
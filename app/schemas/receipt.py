@@ -2,9 +2,17 @@ from pydantic import BaseModel, ConfigDict, validator
 from typing import List, Optional
 from datetime import datetime
 from app.schemas.product import ProductSchema
+from app.main.render import DEFAULT_LINE_LENGTH
 from fastapi import HTTPException
 
 
+RECEIPT_FIELDS = ["id", "created_at", "total", "payment_type", "payment_amount", "rest"]
+RECEIPT_INCLUDES = ["products"]
+# Trigram indexes can only serve search terms of at least three characters.
+PRODUCT_SEARCH_MIN_LENGTH = 3
+PRODUCT_SEARCH_MAX_LENGTH = 100
+
+
 class ReceiptCreate(BaseModel):
     model_config = ConfigDict(strict=True)
 
@@ -23,6 +31,24 @@ class ReceiptCreatingResponse(BaseModel):
     created_at: datetime
 
 
+class ReceiptBatchItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class ReceiptRenderRequest(BaseModel):
+    receipt_ids: List[int]
+    line_length: int = DEFAULT_LINE_LENGTH
+    output: str = "text"
+
+    @validator('output')
+    def validate_output(cls, value):
+        if value not in ["text", "zip"]:
+            raise HTTPException(status_code=400, detail="'output' must be 'text' or 'zip'")
+        return value
+
+
 class ReceiptResponse(BaseModel):
     id: int
     created_at: datetime
@@ -36,12 +62,25 @@ class ReceiptResponse(BaseModel):
         orm_mode = True
 
 
+class ReceiptPartialResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    created_at: Optional[datetime] = None
+    total: Optional[float] = None
+    payment_type: Optional[str] = None
+    payment_amount: Optional[float] = None
+    rest: Optional[float] = None
+    products: Optional[List[ProductSchema]] = None
+
+
 class ReceiptFilterParams(BaseModel):
     created_from: Optional[datetime] = None
     created_to: Optional[datetime] = None
     min_total: Optional[float] = None
     max_total: Optional[float] = None
     payment_type: Optional[str] = None
+    product_name: Optional[str] = None
 
     @validator('min_total', 'max_total')
     def validate_positive_amount(cls, value):
@@ -73,10 +112,22 @@ class ReceiptFilterParams(BaseModel):
                 status_code=400, detail="Payment type must be 'cash' or 'cashless'")
         return value
 
+    @validator('product_name')
+    def validate_product_name(cls, value):
+        if value is not None:
+            value = value.strip()
+            if not (PRODUCT_SEARCH_MIN_LENGTH <= len(value) <= PRODUCT_SEARCH_MAX_LENGTH):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"'product_name' must be between {PRODUCT_SEARCH_MIN_LENGTH} "
+                           f"and {PRODUCT_SEARCH_MAX_LENGTH} characters")
+        return value
+
 
 class PaginationParams(BaseModel):
     page: int = 1
     page_size: int = 10
+    with_count: bool = False
 
     @validator('page', 'page_size')
     def validate_positive(cls, value):
@@ -84,3 +135,61 @@ class PaginationParams(BaseModel):
             raise HTTPException(
                 status_code=400, detail="'page' and 'page_size' must be greater than 0")
         return value
+
+
+class CursorParams(BaseModel):
+    cursor: Optional[str] = None
+    order_by: str = "created_at"
+
+    @validator('order_by')
+    def validate_order_by(cls, value):
+        if value not in ["created_at", "total", "relevance"]:
+            raise HTTPException(
+                status_code=400, detail="'order_by' must be 'created_at', 'total' or 'relevance'")
+        return value
+
+
+class ReceiptFieldsParams(BaseModel):
+    fields: Optional[str] = None
+    include: Optional[str] = None
+
+    @validator('fields')
+    def validate_fields(cls, value):
+        if value is not None:
+            for field in split_list_param(value):
+                if field not in RECEIPT_FIELDS:
+                    raise HTTPException(
+                        status_code=400, detail=f"Unknown field '{field}', allowed: {', '.join(RECEIPT_FIELDS)}")
+        return value
+
+    @validator('include')
+    def validate_include(cls, value):
+        if value is not None:
+            for include in split_list_param(value):
+                if include not in RECEIPT_INCLUDES:
+                    raise HTTPException(
+                        status_code=400, detail=f"Unknown include '{include}', allowed: {', '.join(RECEIPT_INCLUDES)}")
+        return value
+
+    @property
+    def columns(self) -> List[str]:
+        if self.fields is None:
+            return RECEIPT_FIELDS
+        requested = set(split_list_param(self.fields))
+        return [field for field in RECEIPT_FIELDS if field == "id" or field in requested]
+
+    @property
+    def with_products(self) -> bool:
+        # Without any sparse-fieldset parameter the full receipt, products included, is returned.
+        if self.include is None:
+            return self.fields is None
+        return "products" in split_list_param(self.include)
+
+    @property
+    def variant(self) -> str:
+        """Identifies the representation selected by these parameters, e.g. for ETags."""
+        return ",".join(self.columns) + ("+products" if self.with_products else "")
+
+
+def split_list_param(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
@@ -0,0 +1,82 @@
+from pydantic import BaseModel, validator
+from typing import Dict, Optional
+from datetime import date
+from fastapi import HTTPException
+
+
+STATS_BUCKETS = ["day", "week", "month"]
+TOP_PRODUCTS_ORDERINGS = ["quantity", "revenue"]
+TOP_PRODUCTS_MAX_LIMIT = 100
+
+
+class DateRangeParams(BaseModel):
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+    @validator('date_to')
+    def validate_date_range(cls, value, values):
+        date_from = values.get('date_from')
+        if date_from is not None and value is not None and value < date_from:
+            raise HTTPException(
+                status_code=400, detail="'date_to' must be greater than or equal to 'date_from'")
+        return value
+
+
+class ReceiptStatsParams(DateRangeParams):
+    bucket: str = "day"
+
+    @validator('bucket')
+    def validate_bucket(cls, value):
+        if value not in STATS_BUCKETS:
+            raise HTTPException(
+                status_code=400, detail=f"'bucket' must be one of: {', '.join(STATS_BUCKETS)}")
+        return value
+
+
+class PaymentTypeStats(BaseModel):
+    receipt_count: int
+    total_sum: float
+    average_basket: float
+
+
+class ReceiptStatsBucket(BaseModel):
+    period_start: date
+    receipt_count: int
+    total_sum: float
+    average_basket: float
+    payment_types: Dict[str, PaymentTypeStats]
+
+
+class TopProductsParams(DateRangeParams):
+    order_by: str = "quantity"
+    limit: int = 10
+
+    @validator('order_by')
+    def validate_order_by(cls, value):
+        if value not in TOP_PRODUCTS_ORDERINGS:
+            raise HTTPException(
+                status_code=400, detail="'order_by' must be 'quantity' or 'revenue'")
+        return value
+
+    @validator('limit')
+    def validate_limit(cls, value):
+        if not (1 <= value <= TOP_PRODUCTS_MAX_LIMIT):
+            raise HTTPException(
+                status_code=400, detail=f"'limit' must be between 1 and {TOP_PRODUCTS_MAX_LIMIT}")
+        return value
+
+
+class TopProduct(BaseModel):
+    name: str
+    quantity: int
+    revenue: float
+
+
+class ProductTallyMismatch(BaseModel):
+    user_id: int
+    day: date
+    product_key: str
+    expected_quantity: int
+    expected_revenue: float
+    actual_quantity: int
+    actual_revenue: float
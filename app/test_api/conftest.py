@@ -5,7 +5,8 @@ from sqlalchemy.orm import sessionmaker
 from app.main.main import app
 from app.db.base_class import Base
 from app.main.config import settings
-from app.db.session import get_db
+from app.db.session import get_db, get_replica_router, ReplicaRouter
+from app.main.cache import clear_all_caches
 
 
 engine = create_engine(settings.SQLALCHEMY_TEST_DATABASE_URL, pool_pre_ping=True)
@@ -20,12 +21,23 @@ def override_get_db():
         db.close()
 
 
+testing_replica_router = ReplicaRouter(engine, [], TestingSessionLocal)
+
+
+def override_get_replica_router():
+    return testing_replica_router
+
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_replica_router] = override_get_replica_router
 
 
 @pytest.fixture(scope="function")
 def test_db():
     Base.metadata.create_all(bind=engine)
+    clear_all_caches()
+    # Cookies such as the read-after-write pin must not leak from one test into the next.
+    client.cookies.clear()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -0,0 +1,232 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.crud.archive import crud_archive
+from app.crud.receipt_stats import crud_receipt_stats
+from app.main.cache import clear_all_caches
+from app.main.config import settings
+from app.main.security import hash_password
+from app.main.segments import SegmentStore
+from app.models.archived_receipt import ArchivedReceipt
+from app.models.product import Product
+from app.models.receipt import Receipt
+from app.models.user import User
+from app.test_api.conftest import client, test_db, db
+
+
+@pytest.fixture(scope="function")
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", tmp_path / "archive")
+    return tmp_path / "archive"
+
+
+def test_segment_store_rotates_and_reads_back(tmp_path):
+    store = SegmentStore(tmp_path, max_bytes=64)
+    payloads = [f"record {i} ".encode() * 5 for i in range(10)]
+
+    locations = store.append(payloads[:4]) + store.append(payloads[4:])
+
+    assert len(store.segments()) > 1
+    assert [store.read(*location) for location in locations] == payloads
+    assert [payload for segment in store.segments() for _, _, payload in store.scan(segment)] == payloads
+
+
+def test_archive_receipts_read_through(test_db, db, archive_dir):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    other_user = User(
+        id=2,
+        username="User 2",
+        name="Other User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add_all([user, other_user])
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    receipt_ids = []
+    for name in ["Old product with a long name", "New product"]:
+        response_post_create = client.post("/api/receipts/", json={
+            "products": [
+                {"name": name, "price": 2.5, "quantity": 2},
+                {"name": "Bag", "price": 0.1, "quantity": 1}
+            ],
+            "payment_type": "cash",
+            "payment_amount": 10.0
+        }, headers=headers)
+        receipt_ids.append(response_post_create.json()["id"])
+    old_id, new_id = receipt_ids
+
+    old_created_at = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS + 30)
+    db.execute(update(Receipt).where(Receipt.id == old_id).values(created_at=old_created_at))
+    db.execute(update(Product).where(Product.receipt_id == old_id).values(receipt_created_at=old_created_at))
+    db.commit()
+
+    detail_before = client.get(f"/api/receipts/{old_id}", headers=headers)
+    public_before = client.get(f"/api/receipts/public/{old_id}")
+
+    assert crud_archive.archive_receipts(db, crud_archive.cutoff(), batch_size=1) == 1
+
+    # The hot tables only keep the recent receipt.
+    assert db.execute(select(Receipt.id)).scalars().all() == [new_id]
+    assert db.execute(select(Product.receipt_id).distinct()).scalars().all() == [new_id]
+    assert db.execute(select(ArchivedReceipt.receipt_id)).scalars().all() == [old_id]
+    assert list(archive_dir.iterdir())
+
+    detail_after = client.get(f"/api/receipts/{old_id}", headers=headers)
+    assert detail_after.status_code == 200
+    assert detail_after.content == detail_before.content
+    assert detail_after.headers["ETag"] == detail_before.headers["ETag"]
+
+    response_get = client.get(f"/api/receipts/{old_id}?fields=total&include=products", headers=headers)
+    assert response_get.json() == {
+        "id": old_id,
+        "total": 5.1,
+        "products": [
+            {"name": "Old product with a long name", "price": 2.5, "quantity": 2},
+            {"name": "Bag", "price": 0.1, "quantity": 1}
+        ]
+    }
+
+    public_after = client.get(f"/api/receipts/public/{old_id}")
+    assert public_after.status_code == 200
+    assert public_after.text == public_before.text
+
+    clear_all_caches()
+    response_post = client.post("/api/receipts/render", json={"receipt_ids": [new_id, old_id]}, headers=headers)
+    assert response_post.text.split("\f")[1] == public_before.text
+
+    # Listings and their counts only cover the hot tables.
+    response_get = client.get("/api/receipts/?with_count=true", headers=headers)
+    assert [receipt["id"] for receipt in response_get.json()] == [new_id]
+    assert response_get.headers["X-Total-Count"] == "1"
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 2",
+        "password": "password"
+    })
+    other_headers = {"Authorization": f"Bearer {response_post_login.json()['access_token']}"}
+    response_get = client.get(f"/api/receipts/{old_id}", headers=other_headers)
+    assert response_get.status_code == 404
+    assert response_get.json()["detail"] == "Receipt not found"
+
+
+def test_archived_receipt_ids_are_not_reused(test_db, db, archive_dir):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    def create(name, price):
+        return client.post("/api/receipts/", json={
+            "products": [{"name": name, "price": price, "quantity": 1}],
+            "payment_type": "cash",
+            "payment_amount": 10.0
+        }, headers=headers).json()["id"]
+
+    old_id = create("OLD", 1.0)
+    old_created_at = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS + 30)
+    db.execute(update(Receipt).where(Receipt.id == old_id).values(created_at=old_created_at))
+    db.execute(update(Product).where(Product.receipt_id == old_id).values(receipt_created_at=old_created_at))
+    db.commit()
+    public_old = client.get(f"/api/receipts/public/{old_id}")
+
+    # Archiving empties the hot table; the next receipt must not take the archived one's id.
+    assert crud_archive.archive_receipts(db, crud_archive.cutoff()) == 1
+    new_id = create("NEW", 2.0)
+
+    assert new_id != old_id
+    public_new = client.get(f"/api/receipts/public/{new_id}")
+    assert "NEW" in public_new.text and "2.00" in public_new.text
+    assert public_new.headers["ETag"] != public_old.headers["ETag"]
+    assert client.get(f"/api/receipts/public/{old_id}").text == public_old.text
+
+
+def test_rebuild_rollups_keeps_archived_days(test_db, db, archive_dir):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+    headers = {"Authorization": f"Bearer {response_post_login.json()['access_token']}"}
+
+    receipt_ids = []
+    for name, quantity in [("Espresso", 1), ("Espresso", 2), ("Bagel", 3), ("Latte", 4)]:
+        response_post_create = client.post("/api/receipts/", json={
+            "products": [{"name": name, "price": 2.0, "quantity": quantity}],
+            "payment_type": "cash",
+            "payment_amount": 100.0
+        }, headers=headers)
+        receipt_ids.append(response_post_create.json()["id"])
+
+    # Two receipts on a long gone day, and two on a later day of which only the morning one is archived.
+    old_day = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS + 30)
+    boundary_day = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS + 10)
+    created_ats = [
+        old_day.replace(hour=9), old_day.replace(hour=10),
+        boundary_day.replace(hour=9), boundary_day.replace(hour=15)
+    ]
+    for receipt_id, created_at in zip(receipt_ids, created_ats):
+        db.execute(update(Receipt).where(Receipt.id == receipt_id).values(created_at=created_at))
+        db.execute(update(Product).where(Product.receipt_id == receipt_id).values(receipt_created_at=created_at))
+    db.commit()
+
+    # The rollups were counted at creation; move them to the days the receipts now have.
+    assert crud_receipt_stats.rebuild(db) == 2
+    assert crud_receipt_stats.rebuild_product_tallies(db) == 3
+
+    stats_before = client.get("/api/receipts/stats", headers=headers).json()
+    top_before = client.get("/api/receipts/top-products", headers=headers).json()
+    assert [bucket["receipt_count"] for bucket in stats_before] == [2, 2]
+
+    assert crud_archive.archive_receipts(db, boundary_day.replace(hour=12)) == 3
+    assert db.execute(select(Receipt.id)).scalars().all() == [receipt_ids[3]]
+
+    assert crud_receipt_stats.rebuild(db) == 1
+    assert crud_receipt_stats.rebuild_product_tallies(db) == 2
+    assert crud_receipt_stats.check_product_tallies(db) == []
+
+    assert client.get("/api/receipts/stats", headers=headers).json() == stats_before
+    assert client.get("/api/receipts/top-products", headers=headers).json() == top_before
+
+    # Once every receipt is archived, rebuilding leaves all rollups alone.
+    assert crud_archive.archive_receipts(db, datetime.utcnow()) == 1
+    assert crud_receipt_stats.rebuild(db, user.id) == 0
+    assert crud_receipt_stats.rebuild_product_tallies(db, user.id) == 0
+    assert client.get("/api/receipts/stats", headers=headers).json() == stats_before
+    assert client.get("/api/receipts/top-products", headers=headers).json() == top_before
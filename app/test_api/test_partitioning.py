@@ -0,0 +1,131 @@
+import json
+from datetime import date, datetime
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import event, text
+
+from app.crud.receipt import crud_receipt
+from app.db.base_class import Base
+from app.db.partitions import ensure_partitions, partition_name
+from app.main.config import BASE_DIR
+from app.main.security import hash_password
+from app.models.user import User
+from app.models.receipt import Receipt
+from app.models.product import Product
+from app.schemas.receipt import ReceiptFilterParams, PaginationParams
+from app.test_api.conftest import engine, TestingSessionLocal
+
+
+pytestmark = pytest.mark.skipif(
+    engine.dialect.name != "postgresql", reason="declarative partitioning needs Postgres"
+)
+
+MONTHS = [date(2026, month, 1) for month in range(1, 7)]
+
+
+@pytest.fixture(scope="function")
+def migrated_db():
+    """A test database built by the Alembic migrations, i.e. with the partitioned tables."""
+    Base.metadata.drop_all(bind=engine)
+
+    config = Config(str(BASE_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BASE_DIR / "alembic"))
+    with engine.connect() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+        connection.commit()
+
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        with engine.begin() as connection:
+            Base.metadata.drop_all(bind=connection)
+            connection.exec_driver_sql("DROP TABLE IF EXISTS alembic_version")
+
+
+def seed(db):
+    db.add(User(id=1, username="User 1", name="Test User", hashed_password=hash_password('password')))
+    db.commit()
+
+    for i, month in enumerate(MONTHS, start=1):
+        db.add(Receipt(
+            id=i,
+            user_id=1,
+            created_at=datetime(month.year, month.month, 15),
+            total=10.0,
+            payment_type="cash",
+            payment_amount=10.0,
+            rest=0.0
+        ))
+        db.commit()
+        db.add(Product(name=f"Product {i}", price=5.0, quantity=2, receipt_id=i,
+                       receipt_created_at=datetime(month.year, month.month, 15)))
+    db.commit()
+
+
+def scanned_partitions(db, func) -> set:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "pg_" not in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert statements
+
+    scanned = set()
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar_one()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes = [plan[0]["Plan"]]
+            while nodes:
+                node = nodes.pop()
+                if "Relation Name" in node:
+                    scanned.add(node["Relation Name"])
+                nodes.extend(node.get("Plans", []))
+    return scanned
+
+
+def test_ensure_partitions_creates_missing_months(migrated_db):
+    with engine.begin() as connection:
+        created = ensure_partitions(connection, MONTHS[0], MONTHS[-1])
+        assert partition_name("receipts", MONTHS[0]) in created
+        assert partition_name("products", MONTHS[0]) in created
+        # Existing partitions are left alone.
+        assert ensure_partitions(connection, MONTHS[0], MONTHS[-1]) == []
+
+    seed(migrated_db)
+
+    with engine.connect() as connection:
+        partitions = connection.execute(text(
+            "SELECT tableoid::regclass::text FROM products ORDER BY receipt_id"
+        )).scalars().all()
+    assert partitions == [partition_name("products", month) for month in MONTHS]
+
+
+def test_date_filters_prune_partitions(migrated_db):
+    with engine.begin() as connection:
+        ensure_partitions(connection, MONTHS[0], MONTHS[-1])
+    seed(migrated_db)
+
+    filters = ReceiptFilterParams(created_from=datetime(2026, 3, 1), created_to=datetime(2026, 4, 30))
+    scanned = scanned_partitions(
+        migrated_db,
+        lambda: crud_receipt.get_receipts(migrated_db, 1, filters, PaginationParams(page_size=10))
+    )
+
+    # The receipts query only touches March and April; the products query only the months of the page.
+    assert scanned == {
+        partition_name("receipts", date(2026, 3, 1)), partition_name("receipts", date(2026, 4, 1)),
+        partition_name("products", date(2026, 3, 1)), partition_name("products", date(2026, 4, 1)),
+    }
@@ -0,0 +1,155 @@
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.crud.receipt import crud_receipt
+from app.db.base_class import Base
+from app.main.security import hash_password
+from app.models.user import User
+from app.models.receipt import Receipt
+from app.models.product import Product
+from app.schemas.receipt import ReceiptFilterParams, PaginationParams, CursorParams
+from app.test_api.conftest import client, engine, test_db, db
+
+
+def seed(db):
+    now = datetime.utcnow()
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    for i in range(1, 21):
+        db.add(Receipt(
+            id=i,
+            user_id=user.id,
+            created_at=now - timedelta(days=i),
+            total=float(i),
+            payment_type="cash" if i % 2 else "cashless",
+            payment_amount=float(i),
+            rest=0.0
+        ))
+    db.commit()
+
+    for i in range(1, 21):
+        db.add(Product(name=f"Product {i}", price=1.0, quantity=i, receipt_id=i,
+                       receipt_created_at=now - timedelta(days=i)))
+    db.commit()
+
+
+def capture_selects(func):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def sequential_scans(statement, parameters):
+    tables = set(Base.metadata.tables)
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            # With seq scans priced out, a remaining "Seq Scan" means no usable index exists.
+            connection.exec_driver_sql("SET enable_seqscan = off")
+            plan = connection.exec_driver_sql("EXPLAIN " + statement, parameters).scalars().all()
+            return [line for line in plan if "Seq Scan" in line]
+
+        plan = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        return [
+            row[-1] for row in plan
+            if re.fullmatch(r"SCAN (\w+)", row[-1]) and row[-1].split()[1] in tables
+        ]
+
+
+def assert_no_sequential_scans(func):
+    statements = capture_selects(func)
+    assert statements
+
+    for statement, parameters in statements:
+        assert sequential_scans(statement, parameters) == [], statement
+
+
+def test_get_receipts_uses_indexes(test_db, db):
+    seed(db)
+    now = datetime.utcnow()
+
+    filter_cases = [
+        ReceiptFilterParams(),
+        ReceiptFilterParams(created_from=now - timedelta(days=10), created_to=now),
+        ReceiptFilterParams(min_total=5.0, max_total=15.0),
+        ReceiptFilterParams(payment_type="cash"),
+        ReceiptFilterParams(product_name="Product 1"),
+    ]
+
+    for filters in filter_cases:
+        for order_by in ["created_at", "total"]:
+            pagination = PaginationParams(page=1, page_size=5)
+            _, next_cursor = crud_receipt.get_receipts(db, 1, filters, pagination, CursorParams(order_by=order_by))
+            assert next_cursor is not None
+
+            assert_no_sequential_scans(
+                lambda: crud_receipt.get_receipts(db, 1, filters, pagination, CursorParams(order_by=order_by))
+            )
+            assert_no_sequential_scans(
+                lambda: crud_receipt.get_receipts(
+                    db, 1, filters, pagination, CursorParams(order_by=order_by, cursor=next_cursor)
+                )
+            )
+
+
+def test_get_receipt_by_id_uses_indexes(test_db, db):
+    seed(db)
+
+    assert_no_sequential_scans(lambda: crud_receipt.get_receipt_by_id(db, 3, 1))
+
+
+def test_get_public_receipt_uses_indexes(test_db, db):
+    seed(db)
+
+    def render():
+        db.expire_all()
+        crud_receipt.get_public_receipt(db, 3, 40)
+
+    assert_no_sequential_scans(render)
+
+
+def test_get_public_receipt_single_statement(test_db, db):
+    seed(db)
+
+    # The render alone; the route also looks up the version first (test_get_public_receipt_route_statements).
+    statements = capture_selects(lambda: crud_receipt.get_public_receipt(db, 3, 40))
+    assert len(statements) == 1
+
+    # Another width is another render, again in one statement; a repeated width is served from the cache.
+    assert len(capture_selects(lambda: crud_receipt.get_public_receipt(db, 3, 50))) == 1
+    assert capture_selects(lambda: crud_receipt.get_public_receipt(db, 3, 40)) == []
+
+
+def test_get_public_receipt_route_statements(test_db, db):
+    seed(db)
+
+    # Through the route a cold render is two statements: the version lookup behind the ETag runs
+    # first, so that a conditional request is answered without rendering, then the render.
+    responses = []
+    statements = capture_selects(lambda: responses.append(client.get("/api/receipts/public/3")))
+    assert responses[0].status_code == 200
+    assert len(statements) == 2
+    assert "products" not in statements[0][0] and "products" in statements[1][0]
+
+    # Both are cached: a repeated view or a revalidation does not touch the database.
+    assert capture_selects(lambda: client.get("/api/receipts/public/3")) == []
+    assert capture_selects(lambda: client.get(
+        "/api/receipts/public/3", headers={"If-None-Match": responses[0].headers["ETag"]}
+    )) == []
@@ -2,8 +2,35 @@ from app.main.security import hash_password
 from app.models.user import User
 from app.models.receipt import Receipt
 from app.models.product import Product
-from app.test_api.conftest import client, test_db, db
+from app.models.ingest_job import IngestJob
+from app.models.idempotency_key import IdempotencyKey
+from app.crud.idempotency import crud_idempotency
+from app.crud.ingest import LineSplitter
+from app.api.receipt import routes as receipt_routes
+from app.crud import receipt as crud_receipt_module
+from app.crud.receipt import crud_receipt
+from app.crud.receipt_render import crud_receipt_render
+from app.crud.receipt_stats import crud_receipt_stats
+from app.schemas.receipt_stats import TopProductsParams
+from app.main import render, render_pool
+from app.main.cache import clear_all_caches
+from app.main.config import settings
+from app.main.snapshots import SnapshotStore
+from app.models.receipt_render import ReceiptRender
+from app.test_api.conftest import client, engine, test_db, db, TestingSessionLocal
 from datetime import datetime, timedelta
+import io
+import json
+import os
+import time
+import zipfile
+from typing import List
+from sqlalchemy import event, select
+from sqlalchemy.exc import OperationalError
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from app.schemas.receipt import ReceiptPartialResponse, ReceiptCreatingResponse
 
 
 def test_create_receipt_not_authenticated(test_db, db):
@@ -280,7 +307,7 @@ def test_create_receipt_successful(test_db, db):
     assert response["rest"] == 0
 
 
-def test_get_receipt_not_authenticated(test_db, db):
+def test_create_receipt_stores_all_products(test_db, db):
     user = User(
         id=1,
         username="User 1",
@@ -291,25 +318,100 @@ def test_get_receipt_not_authenticated(test_db, db):
     db.add(user)
     db.commit()
 
-    receipt = Receipt(
+    receipt_valid_data = {
+        "products": [
+            {
+                "name": f"Product {i}",
+                "price": 2.5,
+                "quantity": 2
+            }
+            for i in range(50)
+        ],
+        "payment_type": "cashless",
+        "payment_amount": 300.0
+    }
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_post_create = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
+    response = response_post_create.json()
+
+    assert response["total"] == 250.0
+    assert response["rest"] == 50.0
+    assert response["created_at"] is not None
+    assert len(response["products"]) == 50
+
+    stored_products = db.query(Product).filter(Product.receipt_id == response["id"]).all()
+    assert len(stored_products) == 50
+    assert {product.name for product in stored_products} == {f"Product {i}" for i in range(50)}
+
+
+def test_create_receipts_batch_partial_failure(test_db, db):
+    user = User(
         id=1,
-        user_id=user.id,
-        total=10.0,
-        payment_type="cash",
-        payment_amount=10.0,
-        rest=0.0
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
     )
 
-    db.add(receipt)
+    db.add(user)
     db.commit()
 
-    response_get = client.get(f"/api/receipts/{receipt.id}/")
-    response = response_get.json()
+    receipts_data = [
+        {
+            "products": [{"name": "Product 1", "price": 5.0, "quantity": 2}],
+            "payment_type": "cash",
+            "payment_amount": 10.0
+        },
+        {
+            "products": [{"name": "Product 2", "price": 5.0, "quantity": 2}],
+            "payment_type": "cash",
+            "payment_amount": 5.0
+        },
+        {
+            "products": [{"name": "Product 3", "price": "free", "quantity": 1}],
+            "payment_type": "cash",
+            "payment_amount": 5.0
+        },
+        {
+            "products": [
+                {"name": "Product 4", "price": 1.0, "quantity": 3},
+                {"name": "Product 5", "price": 2.0, "quantity": 1}
+            ],
+            "payment_type": "cashless",
+            "payment_amount": 5.0
+        }
+    ]
 
-    assert response["detail"] == "Not authenticated"
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
 
+    response_post_batch = client.post("/api/receipts/batch", json=receipts_data, headers=headers)
+    response = response_post_batch.json()
 
-def test_get_receipt_authenticated_success(test_db, db):
+    assert response_post_batch.status_code == 200
+    assert [item["index"] for item in response] == [0, 1, 2, 3]
+    assert response[0]["id"] is not None and response[0]["error"] is None
+    assert response[1]["id"] is None and response[1]["error"] == "Insufficient payment amount"
+    assert response[2]["id"] is None and response[2]["error"].startswith("products.0.price")
+    assert response[3]["id"] is not None and response[3]["error"] is None
+
+    assert db.query(Receipt).count() == 2
+    assert db.query(Product).filter(Product.receipt_id == response[3]["id"]).count() == 2
+
+
+def test_create_receipts_batch_reports_failed_chunks(test_db, db, monkeypatch):
     user = User(
         id=1,
         username="User 1",
@@ -320,26 +422,57 @@ def test_get_receipt_authenticated_success(test_db, db):
     db.add(user)
     db.commit()
 
-    receipt = Receipt(
-        id=1,
-        user_id=user.id,
-        total=10.0,
-        payment_type="cash",
-        payment_amount=10.0,
-        rest=0.0
+    receipt_data = {
+        "products": [{"name": "Product 1", "price": 5.0, "quantity": 2}],
+        "payment_type": "cash",
+        "payment_amount": 10.0
+    }
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # Every receipt is its own chunk, and the database fails while storing the second one.
+    monkeypatch.setattr(crud_receipt, "BATCH_CHUNK_SIZE", 1)
+    insert_receipts = crud_receipt.insert_receipts
+    calls = []
+
+    def failing_insert_receipts(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise OperationalError("INSERT INTO receipts", {}, Exception("disk full"))
+        return insert_receipts(*args)
+
+    monkeypatch.setattr(crud_receipt, "insert_receipts", failing_insert_receipts)
+
+    response_post_batch = client.post(
+        "/api/receipts/batch", json=[receipt_data, receipt_data, "not a receipt", receipt_data], headers=headers
     )
+    response = response_post_batch.json()
 
-    db.add(receipt)
-    db.commit()
+    assert response_post_batch.status_code == 200
+    assert [item["index"] for item in response] == [0, 1, 2, 3]
+    assert response[0]["id"] is not None and response[0]["error"] is None
+    assert response[1]["id"] is None and response[1]["error"] == "Receipt could not be stored"
+    assert response[2]["id"] is None and response[2]["error"].startswith("Input should be a valid dictionary")
+    assert response[3]["id"] is not None and response[3]["error"] is None
 
-    product = Product(
-        name="Product 1",
-        price=5.0,
-        quantity=2,
-        receipt_id=receipt.id
+    assert sorted(db.execute(select(Receipt.id)).scalars().all()) == [response[0]["id"], response[3]["id"]]
+
+
+def test_create_receipts_batch_empty(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
     )
 
-    db.add(product)
+    db.add(user)
     db.commit()
 
     response_post_login = client.post("/api/auth/login", json={
@@ -350,62 +483,160 @@ def test_get_receipt_authenticated_success(test_db, db):
     access_token = response_post_login.json()["access_token"]
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    response_get = client.get(f"/api/receipts/{receipt.id}/", headers=headers)
-    response = response_get.json()
+    response_post_batch = client.post("/api/receipts/batch", json=[], headers=headers)
+    response = response_post_batch.json()
 
-    assert response["total"] == 10.0
-    assert response["payment_type"] == "cash"
-    assert response["rest"] == 0
+    assert response["detail"] == "Batch must contain between 1 and 5000 receipts"
 
 
-def test_get_receipt_for_different_user(test_db, db):
-    user1 = User(
+def test_ingest_receipts_ndjson(test_db, db):
+    user = User(
         id=1,
         username="User 1",
         name="Test User",
         hashed_password=hash_password('password'),
     )
 
-    db.add(user1)
+    db.add(user)
     db.commit()
 
-    user2 = User(
-        id=2,
-        username="User 2",
+    lines = [
+        json.dumps({
+            "products": [{"name": f"Product {i}", "price": 5.0, "quantity": 2}],
+            "payment_type": "cash",
+            "payment_amount": 10.0
+        })
+        for i in range(4)
+    ]
+    lines.insert(2, '{"products": [], "payment_type": "cash", "payment_amount": 10.0}')
+    body = "\n".join(lines) + "\n"
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/x-ndjson"}
+
+    response_post_ingest = client.post("/api/receipts/ingest", params={"chunk_size": 2}, content=body,
+                                       headers=headers)
+    response = response_post_ingest.json()
+
+    assert response["lines_processed"] == 5
+    assert response["lines_committed"] == 5
+    assert response["receipts_inserted"] == 4
+    assert response["receipts_failed"] == 1
+    assert response["errors"] == [{"line": 3, "error": "Product list must contain at least one item"}]
+    assert db.query(Receipt).count() == 4
+    assert db.query(Product).count() == 4
+
+    # Replaying the same upload for a finished job resumes after the last committed line.
+    response_post_resume = client.post("/api/receipts/ingest", params={"job_id": response["job_id"]},
+                                       content=body, headers=headers)
+    response = response_post_resume.json()
+
+    assert response["lines_processed"] == 0
+    assert response["receipts_inserted"] == 0
+    assert db.query(Receipt).count() == 4
+
+
+def test_ingest_receipts_drops_overlong_lines(test_db, db, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_MAX_LINE_BYTES", 200)
+    user = User(
+        id=1,
+        username="User 1",
         name="Test User",
         hashed_password=hash_password('password'),
     )
 
-    db.add(user2)
+    db.add(user)
     db.commit()
 
-    receipt = Receipt(
+    line = json.dumps({
+        "products": [{"name": "Coffee", "price": 5.0, "quantity": 2}],
+        "payment_type": "cash",
+        "payment_amount": 10.0
+    })
+    # The overlong line arrives over several body chunks, none of which holds a newline.
+    body = [f"{line}\n".encode(), b"[" + b"1," * 100, b"1," * 100, b"1]\n", line.encode()]
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/x-ndjson"}
+
+    response_post_ingest = client.post("/api/receipts/ingest", content=iter(body), headers=headers)
+    response = response_post_ingest.json()
+
+    assert response["lines_processed"] == 3
+    assert response["receipts_inserted"] == 2
+    assert response["errors"] == [{"line": 2, "error": "Line is longer than 200 bytes"}]
+    assert db.query(Receipt).count() == 2
+
+
+def test_line_splitter_bounds_partial_lines():
+    splitter = LineSplitter(max_line_bytes=4)
+
+    assert splitter.feed(b"ab") == []
+    assert splitter.feed(b"c\nd") == [b"abc"]
+    assert splitter.feed(b"efgh") == []
+    assert splitter._buffer == bytearray()
+    assert splitter.feed(b"ij\n\nk") == [None, b""]
+    assert splitter.close() == [b"k"]
+    assert splitter.close() == []
+
+
+def test_ingest_receipts_resume_interrupted_job(test_db, db):
+    user = User(
         id=1,
-        user_id=user1.id,
-        total=10.0,
-        payment_type="cash",
-        payment_amount=10.0,
-        rest=0.0
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
     )
 
-    db.add(receipt)
+    db.add(user)
+    db.commit()
+
+    job = IngestJob(id="job-1", user_id=user.id, lines_committed=2, receipts_inserted=2, receipts_failed=0)
+    db.add(job)
     db.commit()
 
+    body = "\n".join(
+        json.dumps({
+            "products": [{"name": f"Product {i}", "price": 1.0, "quantity": 1}],
+            "payment_type": "cashless",
+            "payment_amount": 1.0
+        })
+        for i in range(5)
+    )
+
     response_post_login = client.post("/api/auth/login", json={
-        "username": "User 2",
+        "username": "User 1",
         "password": "password"
     })
 
     access_token = response_post_login.json()["access_token"]
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    response_get = client.get(f"/api/receipts/{receipt.id}/", headers=headers)
-    response = response_get.json()
+    response_post_ingest = client.post("/api/receipts/ingest", params={"job_id": "job-1"}, content=body,
+                                       headers=headers)
+    response = response_post_ingest.json()
 
-    assert response["detail"] == "Receipt not found"
+    assert response["lines_processed"] == 3
+    assert response["lines_committed"] == 5
+    assert response["receipts_inserted"] == 3
+    assert {product.name for product in db.query(Product).all()} == {"Product 2", "Product 3", "Product 4"}
 
+    response_post_unknown = client.post("/api/receipts/ingest", params={"job_id": "missing"}, content=body,
+                                        headers=headers)
+    assert response_post_unknown.json()["detail"] == "Ingest job not found"
 
-def test_get_not_existing_receipt(test_db, db):
+
+def test_create_receipt_idempotency_key_replay(test_db, db):
     user = User(
         id=1,
         username="User 1",
@@ -416,17 +647,17 @@ def test_get_not_existing_receipt(test_db, db):
     db.add(user)
     db.commit()
 
-    receipt = Receipt(
-        id=1,
-        user_id=user.id,
-        total=10.0,
-        payment_type="cash",
-        payment_amount=10.0,
-        rest=0.0
-    )
-
-    db.add(receipt)
-    db.commit()
+    receipt_valid_data = {
+        "products": [
+            {
+                "name": "Product 1",
+                "price": 5.0,
+                "quantity": 2
+            }
+        ],
+        "payment_type": "cash",
+        "payment_amount": 10.0
+    }
 
     response_post_login = client.post("/api/auth/login", json={
         "username": "User 1",
@@ -434,100 +665,125 @@ def test_get_not_existing_receipt(test_db, db):
     })
 
     access_token = response_post_login.json()["access_token"]
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = {"Authorization": f"Bearer {access_token}", "Idempotency-Key": "terminal-7-0001"}
 
-    response_get = client.get(f"/api/receipts/2/", headers=headers)
-    response = response_get.json()
+    response_first = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
+    response_retry = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
 
-    assert response["detail"] == "Receipt not found"
+    assert response_retry.headers["Idempotent-Replayed"] == "true"
+    assert response_retry.json() == response_first.json()
+    assert db.query(Receipt).count() == 1
+    assert db.query(Product).count() == 1
 
+    # The stored key also answers retries once the in-process cache is cold.
+    crud_idempotency.cache.clear()
+    response_cold_retry = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
 
-def test_get_receipts_not_authenticated(test_db, db):
-    response_get = client.get("/api/receipts/")
-    response = response_get.json()
+    assert response_cold_retry.json() == response_first.json()
+    assert db.query(Receipt).count() == 1
 
-    assert response["detail"] == "Not authenticated"
+    receipt_valid_data["payment_amount"] = 20.0
+    response_conflict = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
 
+    assert response_conflict.json()["detail"] == "Idempotency-Key was already used with a different request payload"
 
-def test_get_receipts_authenticated_success(test_db, db):
+
+def test_idempotency_keys_expire(test_db, db):
     user = User(
         id=1,
         username="User 1",
         name="Test User",
         hashed_password=hash_password('password'),
     )
+
     db.add(user)
     db.commit()
 
-    receipt1 = Receipt(
-        id=1,
+    stale_key = IdempotencyKey(
         user_id=user.id,
-        total=10.0,
-        payment_type="cash",
-        payment_amount=10.0,
-        rest=0.0
+        key="stale",
+        request_hash="hash",
+        response="{}",
+        created_at=datetime.utcnow() - crud_idempotency.ttl - timedelta(minutes=1)
     )
-
-    receipt2 = Receipt(
-        id=2,
+    fresh_key = IdempotencyKey(
         user_id=user.id,
-        total=20.0,
-        payment_type="cashless",
-        payment_amount=20.0,
-        rest=0.0
+        key="fresh",
+        request_hash="hash",
+        response="{}",
+        created_at=datetime.utcnow()
     )
 
-    db.add_all([receipt1, receipt2])
+    db.add_all([stale_key, fresh_key])
     db.commit()
 
-    product1 = Product(
-        name="Product 1",
-        price=5.0,
-        quantity=2,
-        receipt_id=receipt1.id
-    )
+    assert crud_idempotency.lookup(db, user.id, "stale", "hash") is None
+    assert crud_idempotency.sweep_expired(db) == 1
+    assert [key.key for key in db.query(IdempotencyKey).all()] == ["fresh"]
 
-    product2 = Product(
-        name="Product 2",
-        price=10.0,
-        quantity=2,
-        receipt_id=receipt2.id
+
+def test_idempotency_key_reused_after_expiry_before_sweep(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
     )
 
-    db.add_all([product1, product2])
+    db.add(user)
     db.commit()
 
+    receipt_valid_data = {
+        "products": [
+            {
+                "name": "Product 1",
+                "price": 5.0,
+                "quantity": 2
+            }
+        ],
+        "payment_type": "cash",
+        "payment_amount": 10.0
+    }
+
     response_post_login = client.post("/api/auth/login", json={
         "username": "User 1",
         "password": "password"
     })
 
     access_token = response_post_login.json()["access_token"]
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = {"Authorization": f"Bearer {access_token}", "Idempotency-Key": "terminal-7-0001"}
 
-    response_get = client.get("/api/receipts/", headers=headers)
-    response = response_get.json()
+    response_first = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
+    assert response_first.status_code == 200
 
-    assert len(response) == 2
-    assert response[0]["total"] == 10.0
-    assert response[0]["payment_type"] == "cash"
-    assert response[0]["rest"] == 0
-    assert response[1]["total"] == 20.0
-    assert response[1]["payment_type"] == "cashless"
-    assert response[1]["rest"] == 0
+    # The key expires, but the sweep has not deleted it yet.
+    db.query(IdempotencyKey).update({
+        IdempotencyKey.created_at: datetime.utcnow() - crud_idempotency.ttl - timedelta(minutes=1)
+    })
+    db.commit()
+    crud_idempotency.cache.clear()
 
+    response_reused = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
 
-def test_get_receipts_filter_by_payment_type(test_db, db):
+    assert response_reused.status_code == 200
+    assert "Idempotent-Replayed" not in response_reused.headers
+    assert response_reused.json()["id"] != response_first.json()["id"]
+    assert db.query(Receipt).count() == 2
+    assert [key.receipt_id for key in db.query(IdempotencyKey).all()] == [response_reused.json()["id"]]
+
+
+def test_get_receipt_not_authenticated(test_db, db):
     user = User(
         id=1,
         username="User 1",
         name="Test User",
         hashed_password=hash_password('password'),
     )
+
     db.add(user)
     db.commit()
 
-    receipt1 = Receipt(
+    receipt = Receipt(
         id=1,
         user_id=user.id,
         total=10.0,
@@ -536,11 +792,250 @@ def test_get_receipts_filter_by_payment_type(test_db, db):
         rest=0.0
     )
 
-    db.add(receipt1)
+    db.add(receipt)
     db.commit()
 
-    receipt2 = Receipt(
-        id=2,
+    response_get = client.get(f"/api/receipts/{receipt.id}/")
+    response = response_get.json()
+
+    assert response["detail"] == "Not authenticated"
+
+
+def test_get_receipt_authenticated_success(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    receipt = Receipt(
+        id=1,
+        user_id=user.id,
+        total=10.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=0.0
+    )
+
+    db.add(receipt)
+    db.commit()
+
+    product = Product(
+        name="Product 1",
+        price=5.0,
+        quantity=2,
+        receipt_id=receipt.id,
+        receipt_created_at=receipt.created_at
+    )
+
+    db.add(product)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get = client.get(f"/api/receipts/{receipt.id}/", headers=headers)
+    response = response_get.json()
+
+    assert response["total"] == 10.0
+    assert response["payment_type"] == "cash"
+    assert response["rest"] == 0
+
+
+def test_get_receipt_for_different_user(test_db, db):
+    user1 = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user1)
+    db.commit()
+
+    user2 = User(
+        id=2,
+        username="User 2",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user2)
+    db.commit()
+
+    receipt = Receipt(
+        id=1,
+        user_id=user1.id,
+        total=10.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=0.0
+    )
+
+    db.add(receipt)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 2",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get = client.get(f"/api/receipts/{receipt.id}/", headers=headers)
+    response = response_get.json()
+
+    assert response["detail"] == "Receipt not found"
+
+
+def test_get_not_existing_receipt(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    receipt = Receipt(
+        id=1,
+        user_id=user.id,
+        total=10.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=0.0
+    )
+
+    db.add(receipt)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get = client.get(f"/api/receipts/2/", headers=headers)
+    response = response_get.json()
+
+    assert response["detail"] == "Receipt not found"
+
+
+def test_get_receipts_not_authenticated(test_db, db):
+    response_get = client.get("/api/receipts/")
+    response = response_get.json()
+
+    assert response["detail"] == "Not authenticated"
+
+
+def test_get_receipts_authenticated_success(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    receipt1 = Receipt(
+        id=1,
+        user_id=user.id,
+        total=10.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=0.0
+    )
+
+    receipt2 = Receipt(
+        id=2,
+        user_id=user.id,
+        total=20.0,
+        payment_type="cashless",
+        payment_amount=20.0,
+        rest=0.0
+    )
+
+    db.add_all([receipt1, receipt2])
+    db.commit()
+
+    product1 = Product(
+        name="Product 1",
+        price=5.0,
+        quantity=2,
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
+    )
+
+    product2 = Product(
+        name="Product 2",
+        price=10.0,
+        quantity=2,
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
+    )
+
+    db.add_all([product1, product2])
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get = client.get("/api/receipts/", headers=headers)
+    response = response_get.json()
+
+    assert len(response) == 2
+    assert response[0]["total"] == 10.0
+    assert response[0]["payment_type"] == "cash"
+    assert response[0]["rest"] == 0
+    assert response[1]["total"] == 20.0
+    assert response[1]["payment_type"] == "cashless"
+    assert response[1]["rest"] == 0
+
+
+def test_get_receipts_filter_by_payment_type(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    receipt1 = Receipt(
+        id=1,
+        user_id=user.id,
+        total=10.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=0.0
+    )
+
+    db.add(receipt1)
+    db.commit()
+
+    receipt2 = Receipt(
+        id=2,
         user_id=user.id,
         total=20.0,
         payment_type="cashless",
@@ -555,14 +1050,16 @@ def test_get_receipts_filter_by_payment_type(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt1.id
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
     )
 
     product2 = Product(
         name="Product 2",
         price=10.0,
         quantity=2,
-        receipt_id=receipt2.id
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
     )
 
     db.add_all([product1, product2])
@@ -622,14 +1119,16 @@ def test_get_receipts_invalid_filter_by_payment_type(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt1.id
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
     )
 
     product2 = Product(
         name="Product 2",
         price=10.0,
         quantity=2,
-        receipt_id=receipt2.id
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
     )
 
     db.add_all([product1, product2])
@@ -688,14 +1187,16 @@ def test_get_receipts_filter_by_min_total(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt1.id
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
     )
 
     product2 = Product(
         name="Product 2",
         price=10.0,
         quantity=2,
-        receipt_id=receipt2.id
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
     )
 
     db.add_all([product1, product2])
@@ -755,14 +1256,16 @@ def test_get_receipts_filter_by_max_total(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt1.id
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
     )
 
     product2 = Product(
         name="Product 2",
         price=10.0,
         quantity=2,
-        receipt_id=receipt2.id
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
     )
 
     db.add_all([product1, product2])
@@ -822,14 +1325,16 @@ def test_get_receipts_invalid_total_filter(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt1.id
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
     )
 
     product2 = Product(
         name="Product 2",
         price=10.0,
         quantity=2,
-        receipt_id=receipt2.id
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
     )
 
     db.add_all([product1, product2])
@@ -894,14 +1399,16 @@ def test_get_receipts_pagination(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt1.id
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
     )
 
     product2 = Product(
         name="Product 2",
         price=10.0,
         quantity=2,
-        receipt_id=receipt2.id
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
     )
 
     db.add_all([product1, product2])
@@ -960,14 +1467,16 @@ def test_get_receipts_invalid_pagination(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=3,
-        receipt_id=receipt1.id
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
     )
 
     product2 = Product(
         name="Product 2",
         price=10.0,
         quantity=2,
-        receipt_id=receipt2.id
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
     )
 
     db.add_all([product1, product2])
@@ -988,10 +1497,8 @@ def test_get_receipts_invalid_pagination(test_db, db):
     assert response["detail"] == "'page' and 'page_size' must be greater than 0"
 
 
-def test_get_receipts_filter_by_date(test_db, db):
+def test_get_receipts_cursor_pagination(test_db, db):
     now = datetime.utcnow()
-    two_days_ago = now - timedelta(days=2)
-    one_day_ago = now - timedelta(days=1)
 
     user = User(
         id=1,
@@ -1002,24 +1509,322 @@ def test_get_receipts_filter_by_date(test_db, db):
     db.add(user)
     db.commit()
 
-    receipt1 = Receipt(
-        id=1,
-        user_id=user.id,
-        created_at=two_days_ago,  # 2 days ago
-        total=15.0,
-        payment_type="cash",
-        payment_amount=15.0,
-        rest=0.0
-    )
+    receipts = [
+        Receipt(
+            id=i,
+            user_id=user.id,
+            created_at=now - timedelta(hours=10 - i),
+            total=10.0 if i % 2 else 20.0,
+            payment_type="cash" if i < 5 else "cashless",
+            payment_amount=20.0,
+            rest=0.0
+        )
+        for i in range(1, 8)
+    ]
+    db.add_all(receipts)
+    db.commit()
 
-    receipt2 = Receipt(
-        id=2,
-        user_id=user.id,
-        created_at=one_day_ago,  # 1 day ago
-        total=20.0,
-        payment_type="cashless",
-        payment_amount=20.0,
-        rest=0.0
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    def walk(params):
+        ids = []
+        response_get = client.get("/api/receipts/", params=params, headers=headers)
+        while True:
+            ids.extend(receipt["id"] for receipt in response_get.json())
+            next_cursor = response_get.headers.get("X-Next-Cursor")
+            if not next_cursor:
+                return ids
+            response_get = client.get("/api/receipts/", params={**params, "cursor": next_cursor}, headers=headers)
+
+    assert walk({"page_size": 2}) == [1, 2, 3, 4, 5, 6, 7]
+    assert walk({"page_size": 2, "order_by": "total"}) == [1, 3, 5, 7, 2, 4, 6]
+    assert walk({"page_size": 2, "order_by": "total", "payment_type": "cash"}) == [1, 3, 2, 4]
+    assert walk({"page_size": 7}) == [1, 2, 3, 4, 5, 6, 7]
+
+    response_get = client.get("/api/receipts/", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response_get.json()["detail"] == "Invalid cursor"
+
+    response_get = client.get("/api/receipts/", params={"page_size": 2}, headers=headers)
+    created_at_cursor = response_get.headers["X-Next-Cursor"]
+    response_get = client.get("/api/receipts/", params={"cursor": created_at_cursor, "order_by": "total"},
+                              headers=headers)
+    assert response_get.json()["detail"] == "Invalid cursor"
+
+
+def test_get_receipts_sparse_fields(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    receipt = Receipt(
+        id=1,
+        user_id=user.id,
+        total=10.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=0.0
+    )
+    db.add(receipt)
+    db.commit()
+
+    product = Product(
+        name="Product 1",
+        price=5.0,
+        quantity=2,
+        receipt_id=receipt.id,
+        receipt_created_at=receipt.created_at
+    )
+    db.add(product)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get = client.get("/api/receipts/", params={"fields": "created_at,total"}, headers=headers)
+    response = response_get.json()
+
+    assert set(response[0]) == {"id", "created_at", "total"}
+    assert response[0]["total"] == 10.0
+
+    response_get = client.get("/api/receipts/", params={"fields": "total", "include": "products"}, headers=headers)
+    response = response_get.json()
+
+    assert set(response[0]) == {"id", "total", "products"}
+    assert response[0]["products"] == [{"name": "Product 1", "price": 5.0, "quantity": 2}]
+
+    response_get = client.get(f"/api/receipts/{receipt.id}", params={"include": ""}, headers=headers)
+    response = response_get.json()
+
+    assert set(response) == {"id", "created_at", "total", "payment_type", "payment_amount", "rest"}
+
+    response_get = client.get("/api/receipts/", params={"fields": "total,secret"}, headers=headers)
+    response = response_get.json()
+
+    assert response["detail"] == "Unknown field 'secret', allowed: id, created_at, total, payment_type, payment_amount, rest"
+
+
+def test_get_receipts_with_count(test_db, db, monkeypatch):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    receipts_data = [
+        {
+            "products": [{"name": f"Product {i}", "price": float(i), "quantity": 1}],
+            "payment_type": "cash" if i % 2 else "cashless",
+            "payment_amount": 100.0
+        }
+        for i in range(1, 6)
+    ]
+    client.post("/api/receipts/batch", json=receipts_data, headers=headers)
+    client.post("/api/receipts/", json=receipts_data[0], headers=headers)
+
+    response_get = client.get("/api/receipts/", params={"page_size": 4, "with_count": True}, headers=headers)
+
+    assert response_get.headers["X-Total-Count"] == "6"
+    assert response_get.headers["X-Total-Count-Exact"] == "true"
+    assert response_get.headers["X-Has-More"] == "true"
+
+    response_get = client.get("/api/receipts/", params={"payment_type": "cash", "with_count": True},
+                              headers=headers)
+
+    assert response_get.headers["X-Total-Count"] == "4"
+    assert response_get.headers["X-Has-More"] == "false"
+
+    response_get = client.get("/api/receipts/", params={"min_total": 2.5, "with_count": True}, headers=headers)
+
+    assert response_get.headers["X-Total-Count"] == "3"
+    assert response_get.headers["X-Total-Count-Exact"] == "true"
+
+    # Above the threshold a filtered count is never computed exactly.
+    monkeypatch.setattr(settings, "RECEIPT_COUNT_EXACT_THRESHOLD", 2)
+    response_get = client.get("/api/receipts/", params={"min_total": 2.5, "with_count": True}, headers=headers)
+
+    assert response_get.headers["X-Total-Count-Exact"] == "false"
+
+    response_get = client.get("/api/receipts/", headers=headers)
+
+    assert "X-Total-Count" not in response_get.headers
+
+
+def test_export_receipts(test_db, db):
+    now = datetime.utcnow()
+
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    receipt1 = Receipt(
+        id=1,
+        user_id=user.id,
+        created_at=now - timedelta(days=1),
+        total=20.0,
+        payment_type="cash",
+        payment_amount=20.0,
+        rest=0.0
+    )
+    receipt2 = Receipt(
+        id=2,
+        user_id=user.id,
+        created_at=now,
+        total=5.0,
+        payment_type="cashless",
+        payment_amount=5.0,
+        rest=0.0
+    )
+    db.add_all([receipt1, receipt2])
+    db.commit()
+
+    db.add_all([
+        Product(name="Product 1", price=5.0, quantity=2, receipt_id=receipt1.id,
+                receipt_created_at=receipt1.created_at),
+        Product(name="Product, 2", price=10.0, quantity=1, receipt_id=receipt1.id,
+                receipt_created_at=receipt1.created_at),
+        Product(name="Product 3", price=5.0, quantity=1, receipt_id=receipt2.id,
+                receipt_created_at=receipt2.created_at),
+    ])
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get = client.get("/api/receipts/export", params={"format": "csv"}, headers=headers)
+    lines = response_get.text.splitlines()
+
+    assert response_get.headers["content-type"].startswith("text/csv")
+    assert lines[0] == "receipt_id,created_at,total,payment_type,payment_amount,rest,product_name,product_price,product_quantity"
+    assert len(lines) == 4
+    assert lines[2].startswith("1,") and lines[2].endswith(',"Product, 2",10.0,1')
+
+    response_get = client.get("/api/receipts/export", params={"format": "ndjson", "payment_type": "cash"},
+                              headers=headers)
+    exported = [json.loads(line) for line in response_get.text.splitlines()]
+
+    assert len(exported) == 1
+    assert exported[0]["id"] == 1
+    assert exported[0]["products"] == [
+        {"name": "Product 1", "price": 5.0, "quantity": 2},
+        {"name": "Product, 2", "price": 10.0, "quantity": 1}
+    ]
+
+    response_get = client.get("/api/receipts/export", params={"format": "xml"}, headers=headers)
+    assert response_get.json()["detail"] == "Export format must be 'csv' or 'ndjson'"
+
+
+def test_receipt_json_matches_response_models(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    receipt_valid_data = {
+        "products": [
+            {"name": "Кава", "price": 2.5, "quantity": 2},
+            {"name": "Product 2", "price": 0.1, "quantity": 3}
+        ],
+        "payment_type": "cash",
+        "payment_amount": 10.0
+    }
+
+    response_post_create = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
+    created = ReceiptCreatingResponse.model_validate_json(response_post_create.content)
+
+    assert response_post_create.content == JSONResponse(jsonable_encoder(created)).body
+
+    def legacy_body(data, adapter):
+        return JSONResponse(jsonable_encoder(adapter.validate_python(data), exclude_unset=True)).body
+
+    for params in [{}, {"fields": "total,created_at"}, {"fields": "rest", "include": "products"}]:
+        response_get = client.get("/api/receipts/", params=params, headers=headers)
+        assert response_get.content == legacy_body(response_get.json(), TypeAdapter(List[ReceiptPartialResponse]))
+
+        response_get = client.get(f"/api/receipts/{created.id}", params=params, headers=headers)
+        assert response_get.content == legacy_body(response_get.json(), TypeAdapter(ReceiptPartialResponse))
+
+
+def test_get_receipts_filter_by_date(test_db, db):
+    now = datetime.utcnow()
+    two_days_ago = now - timedelta(days=2)
+    one_day_ago = now - timedelta(days=1)
+
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    receipt1 = Receipt(
+        id=1,
+        user_id=user.id,
+        created_at=two_days_ago,  # 2 days ago
+        total=15.0,
+        payment_type="cash",
+        payment_amount=15.0,
+        rest=0.0
+    )
+
+    receipt2 = Receipt(
+        id=2,
+        user_id=user.id,
+        created_at=one_day_ago,  # 1 day ago
+        total=20.0,
+        payment_type="cashless",
+        payment_amount=20.0,
+        rest=0.0
     )
 
     receipt3 = Receipt(
@@ -1039,21 +1844,24 @@ def test_get_receipts_filter_by_date(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=3,
-        receipt_id=receipt1.id
+        receipt_id=receipt1.id,
+        receipt_created_at=receipt1.created_at
     )
 
     product2 = Product(
         name="Product 2",
         price=10.0,
         quantity=2,
-        receipt_id=receipt2.id
+        receipt_id=receipt2.id,
+        receipt_created_at=receipt2.created_at
     )
 
     product3 = Product(
         name="Product 3",
         price=15.0,
         quantity=3,
-        receipt_id=receipt3.id
+        receipt_id=receipt3.id,
+        receipt_created_at=receipt3.created_at
     )
 
     db.add_all([product1, product2, product3])
@@ -1108,7 +1916,8 @@ def test_get_public_receipt_without_auth(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt.id
+        receipt_id=receipt.id,
+        receipt_created_at=receipt.created_at
     )
     db.add(product)
     db.commit()
@@ -1151,7 +1960,8 @@ def test_get_public_receipt_by_different_user(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt.id
+        receipt_id=receipt.id,
+        receipt_created_at=receipt.created_at
     )
     db.add(product)
     db.commit()
@@ -1167,6 +1977,69 @@ def test_get_public_receipt_by_different_user(test_db, db):
     assert response_get.status_code == 200
 
 
+def test_get_receipt_conditional_requests(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    receipt = Receipt(
+        id=1,
+        user_id=user.id,
+        total=10.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=0.0
+    )
+    db.add(receipt)
+    db.commit()
+
+    product = Product(
+        name="Product 1",
+        price=5.0,
+        quantity=2,
+        receipt_id=receipt.id,
+        receipt_created_at=receipt.created_at
+    )
+    db.add(product)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get = client.get(f"/api/receipts/{receipt.id}", headers=headers)
+    etag = response_get.headers["ETag"]
+
+    response_get = client.get(f"/api/receipts/{receipt.id}", headers={**headers, "If-None-Match": etag})
+    assert response_get.status_code == 304
+    assert response_get.content == b""
+
+    response_get = client.get(f"/api/receipts/{receipt.id}", params={"fields": "total"},
+                              headers={**headers, "If-None-Match": etag})
+    assert response_get.status_code == 200
+    assert response_get.headers["ETag"] != etag
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}")
+    public_etag = response_get.headers["ETag"]
+    assert response_get.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", headers={"If-None-Match": f'W/{public_etag}'})
+    assert response_get.status_code == 304
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"line_length": 50},
+                              headers={"If-None-Match": public_etag})
+    assert response_get.status_code == 200
+
+
 def test_get_public_receipt_invalid_line_length(test_db, db):
     user = User(
         id=1,
@@ -1192,7 +2065,8 @@ def test_get_public_receipt_invalid_line_length(test_db, db):
         name="Product 1",
         price=5.0,
         quantity=2,
-        receipt_id=receipt.id
+        receipt_id=receipt.id,
+        receipt_created_at=receipt.created_at
     )
     db.add(product)
     db.commit()
@@ -1204,3 +2078,868 @@ def test_get_public_receipt_invalid_line_length(test_db, db):
     response_get = client.get(f"/api/receipts/public/{receipt.id}/", params=params)
     response = response_get.json()
     assert response["detail"] == "Line length should be at least 30 characters"
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"line_length": 10_000_000})
+    assert response_get.json()["detail"] == "Line length should be at most 200 characters"
+
+
+def test_get_receipt_stats(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    for price, payment_type in [(10.0, "cash"), (20.0, "cash"), (30.0, "cashless")]:
+        response_post_create = client.post("/api/receipts/", json={
+            "products": [{"name": "Product 1", "price": price, "quantity": 1}],
+            "payment_type": payment_type,
+            "payment_amount": 100.0
+        }, headers=headers)
+        assert response_post_create.status_code == 200
+
+    today = datetime.utcnow().date()
+    response_get_stats = client.get("/api/receipts/stats", headers=headers)
+    assert response_get_stats.status_code == 200
+    assert response_get_stats.json() == [{
+        "period_start": today.isoformat(),
+        "receipt_count": 3,
+        "total_sum": 60.0,
+        "average_basket": 20.0,
+        "payment_types": {
+            "cash": {"receipt_count": 2, "total_sum": 30.0, "average_basket": 15.0},
+            "cashless": {"receipt_count": 1, "total_sum": 30.0, "average_basket": 30.0},
+        }
+    }]
+
+    response_get_stats = client.get(
+        f"/api/receipts/stats?bucket=month&date_from={today - timedelta(days=1)}", headers=headers
+    )
+    assert [bucket["period_start"] for bucket in response_get_stats.json()] == [today.replace(day=1).isoformat()]
+
+    response_get_stats = client.get(f"/api/receipts/stats?date_from={today + timedelta(days=1)}", headers=headers)
+    assert response_get_stats.json() == []
+
+    response_get_stats = client.get("/api/receipts/stats?bucket=year", headers=headers)
+    assert response_get_stats.status_code == 400
+    assert response_get_stats.json()["detail"] == "'bucket' must be one of: day, week, month"
+
+    response_get_stats = client.get(
+        f"/api/receipts/stats?date_from={today}&date_to={today - timedelta(days=1)}", headers=headers
+    )
+    assert response_get_stats.status_code == 400
+    assert response_get_stats.json()["detail"] == "'date_to' must be greater than or equal to 'date_from'"
+
+
+def test_rebuild_receipt_stats(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    # Receipts written without going through CRUDReceipt, e.g. before the rollups existed.
+    monday = datetime(2026, 10, 12, 12, 0)
+    for days, total in [(0, 10.0), (2, 20.0), (7, 40.0)]:
+        db.add(Receipt(
+            user_id=user.id,
+            created_at=monday + timedelta(days=days),
+            total=total,
+            payment_type="cash",
+            payment_amount=total,
+            rest=0.0
+        ))
+    db.commit()
+
+    assert crud_receipt_stats.rebuild(db) == 3
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get_stats = client.get("/api/receipts/stats?bucket=week", headers=headers)
+    assert [(bucket["period_start"], bucket["receipt_count"], bucket["total_sum"])
+            for bucket in response_get_stats.json()] == [("2026-10-12", 2, 30.0), ("2026-10-19", 1, 40.0)]
+
+    # Rebuilding again replaces the rollups instead of adding to them.
+    assert crud_receipt_stats.rebuild(db, user.id) == 3
+    response_get_stats = client.get("/api/receipts/stats?bucket=week", headers=headers)
+    assert response_get_stats.json()[0]["average_basket"] == 15.0
+
+
+def test_get_receipts_search_by_product_name(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    now = datetime.utcnow()
+    product_names = [
+        ["Espresso", "Croissant"],
+        ["Double espresso with milk"],
+        ["Tea"],
+        ["100% juice"],
+        ["Espresso_Tonic"],
+    ]
+    for i, names in enumerate(product_names, start=1):
+        created_at = now - timedelta(days=10 - i)
+        db.add(Receipt(
+            id=i,
+            user_id=user.id,
+            created_at=created_at,
+            total=10.0,
+            payment_type="cash",
+            payment_amount=10.0,
+            rest=0.0
+        ))
+        db.commit()
+        for name in names:
+            db.add(Product(name=name, price=5.0, quantity=2, receipt_id=i, receipt_created_at=created_at))
+        db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_get = client.get("/api/receipts/?product_name=ESPRESSO&fields=id&with_count=true", headers=headers)
+    assert [receipt["id"] for receipt in response_get.json()] == [1, 2, 5]
+    assert response_get.headers["X-Total-Count"] == "3"
+
+    # LIKE wildcards in the search term are matched literally.
+    response_get = client.get("/api/receipts/?product_name=0%25 j&fields=id", headers=headers)
+    assert [receipt["id"] for receipt in response_get.json()] == [4]
+
+    response_get = client.get("/api/receipts/?product_name=so_t&fields=id", headers=headers)
+    assert [receipt["id"] for receipt in response_get.json()] == [5]
+
+    # Closest match first, paginated with the relevance cursor.
+    response_get = client.get(
+        "/api/receipts/?product_name=espresso&order_by=relevance&fields=id&page_size=2", headers=headers
+    )
+    assert [receipt["id"] for receipt in response_get.json()] == [1, 5]
+    assert response_get.headers["X-Has-More"] == "true"
+
+    response_get = client.get(
+        f"/api/receipts/?product_name=espresso&order_by=relevance&fields=id&page_size=2"
+        f"&cursor={response_get.headers['X-Next-Cursor']}", headers=headers
+    )
+    assert [receipt["id"] for receipt in response_get.json()] == [2]
+    assert response_get.headers["X-Has-More"] == "false"
+
+    response_get = client.get("/api/receipts/?order_by=relevance", headers=headers)
+    assert response_get.status_code == 400
+    assert response_get.json()["detail"] == "'order_by=relevance' requires 'product_name'"
+
+    response_get = client.get("/api/receipts/?product_name=es", headers=headers)
+    assert response_get.status_code == 400
+    assert response_get.json()["detail"] == "'product_name' must be between 3 and 100 characters"
+
+
+def test_get_receipts_relevance_cursor_with_ties(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    now = datetime.utcnow()
+    # Equally relevant receipts end up on different pages, so the cursor has to resume inside a tie.
+    product_names = ["Espresso tonic", "Espresso", "Iced espresso drink", "Espresso",
+                     "Espresso tonic", "Espresso", "Iced espresso drink"]
+    for i, name in enumerate(product_names, start=1):
+        created_at = now - timedelta(days=10 - i)
+        db.add(Receipt(
+            id=i,
+            user_id=user.id,
+            created_at=created_at,
+            total=10.0,
+            payment_type="cash",
+            payment_amount=10.0,
+            rest=0.0
+        ))
+        db.commit()
+        db.add(Product(name=name, price=5.0, quantity=2, receipt_id=i, receipt_created_at=created_at))
+        db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    pages = []
+    cursor = ""
+    while True:
+        response_get = client.get(
+            f"/api/receipts/?product_name=espresso&order_by=relevance&fields=id&page_size=2{cursor}", headers=headers
+        )
+        assert response_get.status_code == 200
+        pages.append([receipt["id"] for receipt in response_get.json()])
+        if response_get.headers["X-Has-More"] == "false":
+            break
+        cursor = f"&cursor={response_get.headers['X-Next-Cursor']}"
+
+    assert pages == [[2, 4], [6, 1], [5, 3], [7]]
+
+
+def test_get_top_products(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    receipts = [
+        [("Espresso", 2.0, 3), ("Croissant", 3.0, 1)],
+        [("espresso ", 2.0, 1), ("Cake", 10.0, 1)],
+        [("Croissant", 3.0, 2)],
+    ]
+    for products in receipts:
+        response_post_create = client.post("/api/receipts/", json={
+            "products": [{"name": name, "price": price, "quantity": quantity} for name, price, quantity in products],
+            "payment_type": "cash",
+            "payment_amount": 100.0
+        }, headers=headers)
+        assert response_post_create.status_code == 200
+
+    response_get = client.get("/api/receipts/top-products", headers=headers)
+    assert response_get.status_code == 200
+    assert response_get.json() == [
+        {"name": "Espresso", "quantity": 4, "revenue": 8.0},
+        {"name": "Croissant", "quantity": 3, "revenue": 9.0},
+        {"name": "Cake", "quantity": 1, "revenue": 10.0},
+    ]
+
+    response_get = client.get("/api/receipts/top-products?order_by=revenue&limit=2", headers=headers)
+    assert [product["name"] for product in response_get.json()] == ["Cake", "Croissant"]
+
+    tomorrow = datetime.utcnow().date() + timedelta(days=1)
+    response_get = client.get(f"/api/receipts/top-products?date_from={tomorrow}", headers=headers)
+    assert response_get.json() == []
+
+    response_get = client.get("/api/receipts/top-products?limit=0", headers=headers)
+    assert response_get.status_code == 400
+    assert response_get.json()["detail"] == "'limit' must be between 1 and 100"
+
+    response_get = client.get("/api/receipts/top-products?order_by=name", headers=headers)
+    assert response_get.status_code == 400
+    assert response_get.json()["detail"] == "'order_by' must be 'quantity' or 'revenue'"
+
+
+def test_rollup_upserts_lock_rows_in_key_order(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    upserted = {}
+
+    def listener(conn, clauseelement, multiparams, params, execution_options):
+        table = getattr(clauseelement, "table", None)
+        if table is not None and table.name in ("receipt_counters", "receipt_daily_stats", "product_daily_tallies"):
+            upserted[table.name] = multiparams
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # Concurrent requests listing the same rows in opposite orders must still lock them in one order.
+    event.listen(engine, "before_execute", listener)
+    try:
+        response_post = client.post("/api/receipts/batch", json=[
+            {"products": [{"name": "Tea", "price": 1.0, "quantity": 1}, {"name": "Bagel", "price": 2.0, "quantity": 1}],
+             "payment_type": "cashless", "payment_amount": 3.0},
+            {"products": [{"name": "Apple", "price": 1.0, "quantity": 1}], "payment_type": "cash",
+             "payment_amount": 1.0},
+        ], headers=headers)
+    finally:
+        event.remove(engine, "before_execute", listener)
+
+    assert response_post.status_code == 200
+    assert [row["payment_type"] for row in upserted["receipt_counters"]] == ["cash", "cashless"]
+    assert [row["payment_type"] for row in upserted["receipt_daily_stats"]] == ["cash", "cashless"]
+    assert [row["product_key"] for row in upserted["product_daily_tallies"]] == ["apple", "bagel", "tea"]
+
+
+def test_rebuild_and_check_product_tallies(test_db, db, monkeypatch):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+
+    db.add(user)
+    db.commit()
+
+    # Receipts written without going through CRUDReceipt, e.g. before the tallies existed.
+    created_at = datetime(2026, 10, 12, 12, 0)
+    for i, (name, quantity) in enumerate([("Latte", 2), ("LATTE", 1), ("Bagel", 5)], start=1):
+        db.add(Receipt(
+            id=i,
+            user_id=user.id,
+            created_at=created_at,
+            total=quantity * 2.0,
+            payment_type="cash",
+            payment_amount=quantity * 2.0,
+            rest=0.0
+        ))
+        db.commit()
+        db.add(Product(name=name, price=2.0, quantity=quantity, receipt_id=i, receipt_created_at=created_at))
+        db.commit()
+
+    mismatches = crud_receipt_stats.check_product_tallies(db)
+    assert sorted((mismatch.product_key, mismatch.expected_quantity, mismatch.actual_quantity)
+                  for mismatch in mismatches) == [("bagel", 5, 0), ("latte", 3, 0)]
+
+    assert crud_receipt_stats.rebuild_product_tallies(db) == 2
+    assert crud_receipt_stats.check_product_tallies(db) == []
+
+    # Rebuilding again replaces the tallies instead of adding to them.
+    assert crud_receipt_stats.rebuild_product_tallies(db, user.id) == 2
+    assert crud_receipt_stats.check_product_tallies(db, user.id) == []
+
+    # Days are streamed and upserted in chunks; a day is never split across two.
+    db.add(Receipt(id=4, user_id=user.id, created_at=created_at + timedelta(days=1), total=4.0,
+                   payment_type="cash", payment_amount=4.0, rest=0.0))
+    db.commit()
+    db.add(Product(name="latte", price=2.0, quantity=2, receipt_id=4, receipt_created_at=created_at + timedelta(days=1)))
+    db.commit()
+    monkeypatch.setattr(crud_receipt_stats, "REBUILD_CHUNK_SIZE", 1)
+    assert crud_receipt_stats.rebuild_product_tallies(db, user.id) == 3
+    assert crud_receipt_stats.check_product_tallies(db, user.id) == []
+
+    top = crud_receipt_stats.top_products(db, user.id, TopProductsParams())
+    assert [(product.quantity, product.revenue) for product in top] == [(5, 10.0), (5, 10.0)]
+
+
+def test_get_public_receipt_text(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    created_at = datetime(2024, 9, 1, 13, 12, 23)
+    receipt = Receipt(
+        id=1,
+        user_id=user.id,
+        created_at=created_at,
+        total=15.1,
+        payment_type="card",
+        payment_amount=15.1,
+        rest=0.0
+    )
+    db.add(receipt)
+    db.commit()
+
+    db.add_all([
+        Product(name="Product with a rather long name", price=2.5, quantity=2, receipt_id=receipt.id,
+                receipt_created_at=receipt.created_at),
+        Product(name="Unbreakablenamewithoutspaces", price=10.0, quantity=1, receipt_id=receipt.id,
+                receipt_created_at=receipt.created_at),
+        Product(name="Bag", price=0.1, quantity=1, receipt_id=receipt.id, receipt_created_at=receipt.created_at),
+    ])
+    db.commit()
+
+    expected = (
+        "               Test User\n"
+        "========================================\n"
+        "2.00 x 2.50\n"
+        "Product with a                          \n"
+        "rather long name                    5.00\n"
+        "----------------------------------------\n"
+        "1.00 x 10.00\n"
+        "Unbreakablenamewitho                    \n"
+        "utspaces                           10.00\n"
+        "----------------------------------------\n"
+        "1.00 x 0.10\n"
+        "Bag                                 0.10\n"
+        "========================================\n"
+        "Total:                             15.10\n"
+        "Payment type:                       card\n"
+        "Payment amount:                     15.1\n"
+        "Rest:                               0.00\n"
+        "========================================\n"
+        "            01.09.2024 13:12\n"
+        "      Thank you for your purchase!\n"
+    )
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}")
+    assert response_get.status_code == 200
+    assert response_get.text == expected
+
+    # Rendered receipts are cached per (receipt_id, line_length, format).
+    assert crud_receipt.render_cache.get((receipt.id, 40, "text")) == expected
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"line_length": 50})
+    assert response_get.text.splitlines()[1] == "=" * 50
+    assert crud_receipt.render_cache.get((receipt.id, 50, "text")) == response_get.text
+
+
+def test_get_public_receipt_prerendered(test_db, db, monkeypatch):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    receipt_data = {
+        "products": [
+            {"name": "Product with a rather long name", "price": 2.5, "quantity": 2},
+            {"name": "Bag", "price": 0.1, "quantity": 1}
+        ],
+        "payment_type": "cash",
+        "payment_amount": 10.0
+    }
+
+    # Created before pre-rendering was enabled, so only the backfill stores its text.
+    old_id = client.post("/api/receipts/", json=receipt_data, headers=headers).json()["id"]
+    old_text = client.get(f"/api/receipts/public/{old_id}").text
+
+    monkeypatch.setattr(settings, "RECEIPT_PRERENDER", True)
+    new_id = client.post("/api/receipts/", json=receipt_data, headers=headers).json()["id"]
+    assert db.execute(select(ReceiptRender.receipt_id)).scalars().all() == [new_id]
+
+    clear_all_caches()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response_get = client.get(f"/api/receipts/public/{new_id}")
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    assert response_get.status_code == 200
+    assert not any("products" in statement for statement in statements)
+    prerendered_text = response_get.text
+
+    # Other widths are rendered live, and so is everything with pre-rendering off.
+    response_get = client.get(f"/api/receipts/public/{new_id}", params={"line_length": 50})
+    assert response_get.text.splitlines()[1] == "=" * 50
+
+    monkeypatch.setattr(settings, "RECEIPT_PRERENDER", False)
+    clear_all_caches()
+    assert client.get(f"/api/receipts/public/{new_id}").text == prerendered_text
+
+    assert crud_receipt_render.backfill(db, batch_size=1) == 1
+    assert crud_receipt_render.get_text(db, old_id) == old_text
+    assert crud_receipt_render.backfill(db) == 0
+
+
+def test_render_receipts_batch(test_db, db, monkeypatch):
+    for user_id in [1, 2]:
+        db.add(User(
+            id=user_id,
+            username=f"User {user_id}",
+            name=f"Test User {user_id}",
+            hashed_password=hash_password('password'),
+        ))
+    db.commit()
+
+    headers = {}
+    for user_id in [1, 2]:
+        response_post_login = client.post("/api/auth/login", json={
+            "username": f"User {user_id}",
+            "password": "password"
+        })
+        headers[user_id] = {"Authorization": f"Bearer {response_post_login.json()['access_token']}"}
+
+    receipt_ids = [
+        client.post("/api/receipts/", json={
+            "products": [
+                {"name": f"Product {i} with a rather long name", "price": 2.5, "quantity": 2},
+                {"name": "Bag", "price": 0.1, "quantity": 1}
+            ],
+            "payment_type": "cash",
+            "payment_amount": 10.0
+        }, headers=headers[1]).json()["id"]
+        for i in range(6)
+    ]
+    other_id = client.post("/api/receipts/", json={
+        "products": [{"name": "Bag", "price": 0.1, "quantity": 1}],
+        "payment_type": "cash",
+        "payment_amount": 1.0
+    }, headers=headers[2]).json()["id"]
+
+    expected = {
+        receipt_id: client.get(f"/api/receipts/public/{receipt_id}", params={"line_length": 50}).text
+        for receipt_id in receipt_ids
+    }
+    requested = [receipt_ids[3], receipt_ids[0], receipt_ids[5]]
+
+    clear_all_caches()
+    response_post = client.post("/api/receipts/render", json={
+        "receipt_ids": requested,
+        "line_length": 50
+    }, headers=headers[1])
+    assert response_post.status_code == 200
+    assert response_post.headers["Content-Type"] == "text/plain; charset=utf-8"
+    assert response_post.text.split("\f") == [expected[receipt_id] for receipt_id in requested]
+
+    response_post = client.post("/api/receipts/render", json={
+        "receipt_ids": requested,
+        "line_length": 50,
+        "output": "zip"
+    }, headers=headers[1])
+    assert response_post.status_code == 200
+    assert response_post.headers["Content-Type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response_post.content)) as archive:
+        assert archive.namelist() == [f"receipt-{receipt_id}.txt" for receipt_id in requested]
+        assert [archive.read(name).decode() for name in archive.namelist()] == \
+            [expected[receipt_id] for receipt_id in requested]
+
+    # The number of statements does not grow with the batch.
+    def count_selects(ids):
+        clear_all_caches()
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            client.post("/api/receipts/render", json={"receipt_ids": ids}, headers=headers[1])
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        return len(statements)
+
+    assert count_selects(receipt_ids[:2]) == count_selects(receipt_ids)
+
+    # Large batches are rendered by the process pool, with the same result.
+    monkeypatch.setattr(settings, "RENDER_POOL_MIN_BATCH", 2)
+    monkeypatch.setattr(settings, "RENDER_POOL_CHUNK_SIZE", 2)
+    clear_all_caches()
+    try:
+        response_post = client.post("/api/receipts/render", json={
+            "receipt_ids": receipt_ids,
+            "line_length": 50
+        }, headers=headers[1])
+    finally:
+        render_pool.shutdown()
+    assert response_post.text.split("\f") == [expected[receipt_id] for receipt_id in receipt_ids]
+
+    response_post = client.post("/api/receipts/render", json={
+        "receipt_ids": [receipt_ids[0], other_id, 999]
+    }, headers=headers[1])
+    assert response_post.status_code == 404
+    assert response_post.json()["detail"] == f"Receipts not found: {other_id}, 999"
+
+    response_post = client.post("/api/receipts/render", json={
+        "receipt_ids": list(range(1, crud_receipt.MAX_RENDER_BATCH_SIZE + 2))
+    }, headers=headers[1])
+    assert response_post.status_code == 400
+
+    response_post = client.post("/api/receipts/render", json={
+        "receipt_ids": receipt_ids,
+        "output": "pdf"
+    }, headers=headers[1])
+    assert response_post.status_code == 400
+    assert response_post.json()["detail"] == "'output' must be 'text' or 'zip'"
+
+
+def test_get_public_receipt_formats(test_db, db):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test <User>",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    receipt = Receipt(
+        id=1,
+        user_id=user.id,
+        created_at=datetime(2024, 9, 1, 13, 12, 23),
+        total=5.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=5.0
+    )
+    db.add(receipt)
+    db.commit()
+
+    db.add(Product(name="Fish & (chips)\x1b@", price=2.5, quantity=2, receipt_id=receipt.id,
+                   receipt_created_at=receipt.created_at))
+    db.commit()
+
+    response_text = client.get(f"/api/receipts/public/{receipt.id}")
+    assert response_text.headers["Content-Type"] == "text/plain; charset=utf-8"
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"format": "html"})
+    assert response_get.status_code == 200
+    assert response_get.headers["Content-Type"] == "text/html; charset=utf-8"
+    assert "<caption>Test &lt;User&gt;</caption>" in response_get.text
+    assert "Fish &amp; (chips)\x1b@<br>2.00 x 2.50" in response_get.text
+    assert response_get.headers["ETag"] != response_text.headers["ETag"]
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"format": "escpos"})
+    assert response_get.headers["Content-Type"] == "application/octet-stream"
+    assert response_get.content.startswith(b"\x1b@\x1bt\x00\x1ba\x01\x1bE\x01Test <User>\x1bE\x00\n")
+    assert response_get.content.endswith(b"\x1dVB\x00")
+    # Control characters in names cannot reach the printer as commands.
+    assert b"Fish & (chips)@" in response_get.content
+    # Between the title and the footer, the body is the text layout.
+    body = "\n".join(response_text.text.split("\n")[1:-3]).replace("\x1b", "")
+    assert body.encode() in response_get.content
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"format": "pdf", "line_length": 50})
+    assert response_get.headers["Content-Type"] == "application/pdf"
+    assert response_get.content.startswith(b"%PDF-1.4\n")
+    assert response_get.content.endswith(b"%%EOF\n")
+    assert b"(Fish & \\(chips\\)@" in response_get.content
+    assert b"/MediaBox [0 0 306 " in response_get.content
+
+    etag = response_get.headers["ETag"]
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"format": "pdf", "line_length": 50},
+                              headers={"If-None-Match": etag})
+    assert response_get.status_code == 304
+    assert crud_receipt.render_cache.get((receipt.id, 50, "pdf")).startswith(b"%PDF")
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"format": "docx"})
+    assert response_get.status_code == 400
+    assert response_get.json()["detail"] == "Format must be one of: text, escpos, html, pdf"
+
+
+def test_get_public_receipt_stream(test_db, db, monkeypatch):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+    headers = {"Authorization": f"Bearer {response_post_login.json()['access_token']}"}
+
+    products = [
+        {"name": f"Product {i} with a rather long name", "price": 1.5, "quantity": 1 + i % 3}
+        for i in range(3000)
+    ]
+    receipt_id = client.post("/api/receipts/", json={
+        "products": products,
+        "payment_type": "cash",
+        "payment_amount": 10000.0
+    }, headers=headers).json()["id"]
+
+    monkeypatch.setattr(render, "STREAM_CHUNK_CHARS", 4096)
+    for output_format in ["text", "escpos", "html"]:
+        params = {"format": output_format, "line_length": 50}
+        expected = client.get(f"/api/receipts/public/{receipt_id}", params=params)
+
+        clear_all_caches()
+        with client.stream("GET", f"/api/receipts/public/{receipt_id}", params={**params, "stream": True}) as response:
+            assert response.status_code == 200
+            assert response.headers["Content-Type"] == expected.headers["Content-Type"]
+            assert response.headers["ETag"] == expected.headers["ETag"]
+            assert "Content-Length" not in response.headers
+            assert response.read() == expected.content
+
+        # The body is produced piece by piece while the products are read.
+        chunks = list(crud_receipt.stream_public_receipt(db, TestingSessionLocal, receipt_id, 50, output_format))
+        assert len(chunks) > 1
+        assert b"".join(chunks) == expected.content
+
+    response_get = client.get(f"/api/receipts/public/{receipt_id}", params={"format": "pdf", "stream": True})
+    assert response_get.status_code == 400
+    assert response_get.json()["detail"] == "Format 'pdf' cannot be streamed"
+
+    response_get = client.get("/api/receipts/public/999", params={"stream": True})
+    assert response_get.status_code == 404
+
+
+def test_get_public_receipt_snapshot(test_db, db, monkeypatch, tmp_path):
+    user = User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    )
+    db.add(user)
+    db.commit()
+
+    receipt = Receipt(
+        id=1,
+        user_id=user.id,
+        created_at=datetime(2024, 9, 1, 13, 12, 23),
+        total=5.0,
+        payment_type="cash",
+        payment_amount=10.0,
+        rest=5.0
+    )
+    db.add(receipt)
+    db.commit()
+
+    db.add(Product(name="Grüner Tee", price=2.5, quantity=2, receipt_id=receipt.id,
+                   receipt_created_at=receipt.created_at))
+    db.commit()
+
+    response_rendered = client.get(f"/api/receipts/public/{receipt.id}")
+    response_pdf = client.get(f"/api/receipts/public/{receipt.id}", params={"format": "pdf"})
+
+    clear_all_caches()
+    monkeypatch.setattr(settings, "RECEIPT_SNAPSHOT_DIR", tmp_path / "snapshots")
+    response_get = client.get(f"/api/receipts/public/{receipt.id}")
+    assert response_get.status_code == 200
+    assert response_get.content == response_rendered.content
+    assert response_get.headers["Content-Type"] == "text/plain; charset=utf-8"
+    assert response_get.headers["ETag"] == response_rendered.headers["ETag"]
+
+    snapshot = crud_receipt.snapshot_store.get(f"{render.RENDER_VERSION}:{receipt.id}:40:text")
+    assert snapshot.path.read_bytes() == response_rendered.content
+
+    # A hit is served from the file without rendering.
+    def fail(*args, **kwargs):
+        raise AssertionError("rendered despite a snapshot")
+
+    monkeypatch.setattr(crud_receipt, "get_public_receipt", fail)
+    response_get = client.get(f"/api/receipts/public/{receipt.id}")
+    assert response_get.content == response_rendered.content
+
+    response_get = client.get(f"/api/receipts/public/{receipt.id}",
+                              headers={"If-None-Match": response_rendered.headers["ETag"]})
+    assert response_get.status_code == 304
+
+    monkeypatch.undo()
+    monkeypatch.setattr(settings, "RECEIPT_SNAPSHOT_DIR", tmp_path / "snapshots")
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"format": "pdf"})
+    assert response_get.content == response_pdf.content
+    assert response_get.headers["Content-Type"] == "application/pdf"
+
+    # Only allow-listed widths are stored, so arbitrary widths cannot churn the store.
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"line_length": 60})
+    assert response_get.status_code == 200
+    assert crud_receipt.snapshot_store.get(f"{render.RENDER_VERSION}:{receipt.id}:60:text") is None
+
+    # Receipts larger than the whole store are rendered as usual.
+    monkeypatch.setattr(settings, "RECEIPT_SNAPSHOT_MAX_BYTES", 16)
+    response_get = client.get(f"/api/receipts/public/{receipt.id}", params={"format": "html"})
+    assert response_get.status_code == 200
+    assert "Grüner Tee" in response_get.text
+    assert crud_receipt.snapshot_store.get(f"{render.RENDER_VERSION}:{receipt.id}:40:html") is None
+
+    # A renderer change invalidates both the stored files and the ETags clients hold.
+    monkeypatch.setattr(settings, "RECEIPT_SNAPSHOT_MAX_BYTES", 1024 * 1024)
+    changed = render.RENDER_VERSION + 1
+    monkeypatch.setattr(receipt_routes, "RENDER_VERSION", changed)
+    monkeypatch.setattr(crud_receipt_module, "RENDER_VERSION", changed)
+    response_get = client.get(f"/api/receipts/public/{receipt.id}")
+    assert response_get.headers["ETag"] != response_rendered.headers["ETag"]
+    assert crud_receipt.snapshot_store.get(f"{changed}:{receipt.id}:40:text") is not None
+
+
+def test_snapshot_store_evicts_least_recently_used(tmp_path):
+    store = SnapshotStore(tmp_path, max_bytes=100)
+
+    for i in range(5):
+        store.put(f"receipt {i}", bytes([i]) * 30)
+        os.utime(store.path(f"receipt {i}"), (i, i))
+
+    assert [store.path(f"receipt {i}").exists() for i in range(5)] == [False, False, True, True, True]
+    assert store.size == 90
+
+    # A hit marks the file as recently used, so the next eviction spares it.
+    assert store.get("receipt 2").path.read_bytes() == b"\x02" * 30
+    store.put("receipt 5", b"\x05" * 30)
+    assert [store.path(f"receipt {i}").exists() for i in range(2, 6)] == [True, False, True, True]
+
+    # Writes go through temporary files that never stay behind.
+    assert not [path for path in tmp_path.rglob(".tmp-*")]
+    assert store.put("too large", b"x" * 101) is None
+
+
+def test_snapshot_store_never_evicts_the_file_it_writes(tmp_path):
+    store = SnapshotStore(tmp_path, max_bytes=1000)
+
+    # Anything that would not fit under the low-water mark on its own is not stored.
+    assert store.put("large", b"x" * 950) is None
+    assert not store.path("large").exists()
+
+    store.put("receipt 1", b"1" * 900)
+    future = time.time() + 3600
+    os.utime(store.path("receipt 1"), (future, future))
+
+    # The new file is the least recently used by mtime here, yet eviction spares it.
+    snapshot = store.put("receipt 2", b"2" * 150)
+    assert snapshot.path.read_bytes() == b"2" * 150
+    assert not store.path("receipt 1").exists()
+    assert store.size == 150
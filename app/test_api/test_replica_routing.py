@@ -0,0 +1,207 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base_class import Base
+from fastapi import Response
+
+from app.db.session import ReplicaRouter, get_replica_router, READ_AFTER_WRITE_COOKIE, check_supported_dialect
+from app.main.config import settings
+from app.main.main import app
+from app.main.security import hash_password
+from app.models.user import User
+from app.test_api.conftest import client, engine, test_db, db, override_get_replica_router
+
+
+def make_user(session):
+    session.add(User(
+        id=1,
+        username="User 1",
+        name="Test User",
+        hashed_password=hash_password('password'),
+    ))
+    session.commit()
+
+
+@pytest.fixture(scope="function")
+def replica_engine(tmp_path):
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(bind=replica)
+    yield replica
+    replica.dispose()
+
+
+@pytest.fixture(scope="function")
+def broken_engine(tmp_path):
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    yield broken
+    broken.dispose()
+
+
+@pytest.fixture(scope="function")
+def replica_router(replica_engine):
+    router = ReplicaRouter(engine, [replica_engine], sessionmaker(autocommit=False, autoflush=False))
+    app.dependency_overrides[get_replica_router] = lambda: router
+    yield router
+    app.dependency_overrides[get_replica_router] = override_get_replica_router
+
+
+def test_replica_router_round_robin(replica_engine, tmp_path):
+    second_engine = create_engine(f"sqlite:///{tmp_path / 'replica_2.db'}")
+    router = ReplicaRouter(engine, [replica_engine, second_engine])
+
+    binds = []
+    for _ in range(4):
+        session = router.read_session()
+        binds.append(session.get_bind())
+        session.close()
+
+    assert binds == [replica_engine, second_engine, replica_engine, second_engine]
+    second_engine.dispose()
+
+
+def test_replica_router_ejects_unreachable_replica(replica_engine, broken_engine):
+    router = ReplicaRouter(engine, [broken_engine, replica_engine])
+
+    for _ in range(3):
+        session = router.read_session()
+        assert session.get_bind() is replica_engine
+        session.close()
+
+    assert router.healthy_replicas() == [replica_engine]
+
+
+def test_replica_router_falls_back_to_primary(broken_engine):
+    router = ReplicaRouter(engine, [broken_engine])
+
+    session = router.read_session()
+    assert session.get_bind() is engine
+    session.close()
+
+
+def test_replica_router_pins_after_write(replica_engine, monkeypatch):
+    router = ReplicaRouter(engine, [replica_engine])
+    router.record_write(1)
+
+    session = router.read_session(1)
+    assert session.get_bind() is engine
+    session.close()
+
+    session = router.read_session(2)
+    assert session.get_bind() is replica_engine
+    session.close()
+
+    monkeypatch.setattr(settings, "REPLICA_READ_AFTER_WRITE_SECONDS", 0)
+    session = router.read_session(1)
+    assert session.get_bind() is replica_engine
+    session.close()
+
+
+def test_replica_router_pins_through_cookie(replica_engine):
+    response = Response()
+    ReplicaRouter(engine, [replica_engine]).record_write(1, response)
+    pin = response.headers["set-cookie"].split(";")[0].removeprefix(f"{READ_AFTER_WRITE_COOKIE}=")
+
+    # Another worker has no record of the write, but the client sends the pin back.
+    other_worker = ReplicaRouter(engine, [replica_engine])
+    session = other_worker.read_session(1, pin)
+    assert session.get_bind() is engine
+    session.close()
+
+    # Pins are unsigned, so forged write times far in the future or non-finite ones are ignored.
+    forged = [(1, "1:1e20"), (1, "1:inf"), (1, "1:nan"), (1, f"1:{time.time() + 3600}")]
+    for key, other_pin in [(2, pin), (1, None), (1, "1:not-a-time")] + forged:
+        session = other_worker.read_session(key, other_pin)
+        assert session.get_bind() is replica_engine
+        session.close()
+
+
+def test_get_receipts_reads_from_replica_unless_pinned(test_db, db, replica_router, replica_engine, monkeypatch):
+    make_user(db)
+    with sessionmaker(bind=replica_engine)() as replica_db:
+        make_user(replica_db)
+
+    receipt_valid_data = {
+        "products": [
+            {
+                "name": "Product 1",
+                "price": 5.0,
+                "quantity": 2
+            }
+        ],
+        "payment_type": "cash",
+        "payment_amount": 10.0
+    }
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response_post_create = client.post("/api/receipts/", json=receipt_valid_data, headers=headers)
+    assert response_post_create.status_code == 200
+    receipt_id = response_post_create.json()["id"]
+
+    # Pinned to the primary right after the write, so the new receipt is visible.
+    response_get = client.get("/api/receipts/", headers=headers)
+    assert [receipt["id"] for receipt in response_get.json()] == [receipt_id]
+
+    # The client's cookie keeps the pin on a worker that did not take the write.
+    assert READ_AFTER_WRITE_COOKIE in response_post_create.cookies
+    replica_router._written_at.clear()
+    response_get = client.get("/api/receipts/", headers=headers)
+    assert [receipt["id"] for receipt in response_get.json()] == [receipt_id]
+
+    # Once the pin expires the (never replicated) stand-in replica serves the read.
+    monkeypatch.setattr(settings, "REPLICA_READ_AFTER_WRITE_SECONDS", 0)
+    response_get = client.get("/api/receipts/", headers=headers)
+    assert response_get.json() == []
+
+    # The public receipt falls back to the primary when the replica lags behind.
+    response_public = client.get(f"/api/receipts/public/{receipt_id}")
+    assert response_public.status_code == 200
+    assert "Product 1" in response_public.text
+
+
+def test_authenticated_reads_resolve_user_on_replica(test_db, db, replica_router, replica_engine, monkeypatch):
+    make_user(db)
+
+    response_post_login = client.post("/api/auth/login", json={
+        "username": "User 1",
+        "password": "password"
+    })
+
+    access_token = response_post_login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    primary_statements = []
+    listener = lambda conn, cursor, statement, *args: primary_statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        # The replica has not caught up with the new user yet: the lookup falls back to the primary.
+        response_get = client.get("/api/users/me/", headers=headers)
+        assert response_get.status_code == 200
+        assert len(primary_statements) == 1
+
+        with sessionmaker(bind=replica_engine)() as replica_db:
+            make_user(replica_db)
+
+        primary_statements.clear()
+        response_get = client.get("/api/receipts/", headers=headers)
+        assert response_get.status_code == 200
+        assert primary_statements == []
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+def test_check_supported_dialect():
+    check_supported_dialect("sqlite:///receipts.db")
+    check_supported_dialect("postgresql+psycopg2://user@localhost/receipts")
+
+    with pytest.raises(RuntimeError, match="Unsupported database 'mysql': use one of postgresql, sqlite"):
+        check_supported_dialect("mysql+pymysql://user@localhost/receipts")
@@ -0,0 +1,72 @@
+"""Compare the legacy ORM receipt creation with the bulk INSERT ... RETURNING path.
+
+Usage:
+    python -m benchmarks.bench_create_receipt
+"""
+from app.crud.receipt import crud_receipt
+from app.models.product import Product
+from app.models.receipt import Receipt
+from app.schemas.product import ProductSchema
+from app.schemas.receipt import ReceiptCreate
+from benchmarks.common import BenchSessionLocal, reset_database, timeit, print_table
+
+
+PRODUCT_COUNTS = [1, 50, 5000]
+
+
+def legacy_create_receipt(db, receipt_in: ReceiptCreate, user_id: int) -> Receipt:
+    total = sum(product.price * product.quantity for product in receipt_in.products)
+    db_receipt = Receipt(
+        user_id=user_id,
+        total=total,
+        payment_type=receipt_in.payment_type,
+        payment_amount=receipt_in.payment_amount,
+        rest=receipt_in.payment_amount - total
+    )
+    db.add(db_receipt)
+    db.commit()
+    db.refresh(db_receipt)
+
+    for product_data in receipt_in.products:
+        db.add(Product(
+            name=product_data.name,
+            price=product_data.price,
+            quantity=product_data.quantity,
+            receipt_id=db_receipt.id,
+            receipt_created_at=db_receipt.created_at
+        ))
+
+    db.commit()
+    db.refresh(db_receipt)
+    return db_receipt
+
+
+def make_receipt(product_count: int) -> ReceiptCreate:
+    products = [ProductSchema(name=f"Product {i}", price=1.5, quantity=2) for i in range(product_count)]
+    return ReceiptCreate(products=products, payment_type="cash", payment_amount=3.0 * product_count)
+
+
+def main():
+    user = reset_database()
+    rows = []
+
+    for product_count in PRODUCT_COUNTS:
+        receipt_in = make_receipt(product_count)
+        repeat = 20 if product_count < 1000 else 3
+
+        with BenchSessionLocal() as db:
+            legacy_ms = timeit(lambda: legacy_create_receipt(db, receipt_in, user.id), repeat)
+        with BenchSessionLocal() as db:
+            bulk_ms = timeit(lambda: crud_receipt.create_receipt(db, receipt_in, user.id), repeat)
+
+        rows.append([product_count, legacy_ms, bulk_ms, legacy_ms / bulk_ms])
+
+    print_table(
+        "create_receipt (best of N, ms)",
+        ["products", "legacy", "bulk", "speedup"],
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare the cost of a public receipt view that renders, hits the render cache, or hits the snapshot store.
+
+Only the work behind the route is timed: the receipt version lookup, which is
+cached in every case, and producing the body; a snapshot hit includes reading
+the file back, which FileResponse does when it sends it.
+
+Usage:
+    python -m benchmarks.bench_public_receipt_snapshot [products_per_receipt]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.crud.receipt import crud_receipt
+from app.main.cache import clear_all_caches
+from app.main.config import settings
+from app.models.product import Product
+from app.models.receipt import Receipt
+from benchmarks.common import BenchSessionLocal, reset_database, print_table
+
+
+VIEWS = 5000
+
+
+def seed(user_id: int, products_per_receipt: int) -> int:
+    with BenchSessionLocal() as db:
+        receipt = Receipt(user_id=user_id, total=2.5 * products_per_receipt, payment_type="card",
+                          payment_amount=2.5 * products_per_receipt, rest=0.0)
+        db.add(receipt)
+        db.flush()
+        db.add_all([
+            Product(name=f"Product {i} with a rather long descriptive name", price=1.25, quantity=2,
+                    receipt_id=receipt.id, receipt_created_at=receipt.created_at)
+            for i in range(products_per_receipt)
+        ])
+        db.commit()
+        return receipt.id
+
+
+def views_per_second(view, before_each=None) -> float:
+    elapsed = 0.0
+    for _ in range(VIEWS):
+        if before_each is not None:
+            before_each()
+        start = time.perf_counter()
+        view()
+        elapsed += time.perf_counter() - start
+    return VIEWS / elapsed
+
+
+def main():
+    products_per_receipt = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    user = reset_database()
+    receipt_id = seed(user.id, products_per_receipt)
+    clear_all_caches()
+
+    with BenchSessionLocal() as db, tempfile.TemporaryDirectory() as directory:
+        def rendered_view():
+            crud_receipt.get_receipt_version(db, receipt_id)
+            return crud_receipt.get_public_receipt(db, receipt_id, 40).encode()
+
+        def snapshot_view():
+            crud_receipt.get_receipt_version(db, receipt_id)
+            return crud_receipt.get_public_snapshot(db, receipt_id, 40).path.read_bytes()
+
+        settings.RECEIPT_SNAPSHOT_DIR = Path(directory)
+        expected = rendered_view()
+        assert snapshot_view() == expected
+
+        rows = [
+            ["rendered", views_per_second(rendered_view, crud_receipt.render_cache.clear)],
+            ["render cache", views_per_second(rendered_view)],
+            ["snapshot", views_per_second(snapshot_view, crud_receipt.render_cache.clear)],
+        ]
+
+    print_table(
+        f"public receipt views of {products_per_receipt} products, one thread (views/s)",
+        ["served from", "views/s"],
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare rendering a print batch in-process with the render process pool.
+
+Usage:
+    python -m benchmarks.bench_receipt_batch_render [receipts] [products_per_receipt]
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+from app.main import render_pool
+from app.main.config import settings
+from app.main.render import ProductFields, ReceiptFields, render_receipts_text
+from benchmarks.common import timeit, print_table
+
+
+LINE_LENGTH = 40
+
+
+def make_batch(count: int, products_per_receipt: int):
+    now = datetime(2024, 9, 1, 13, 12, 23)
+    batch = []
+    for i in range(count):
+        products = [
+            ProductFields(f"Product {j} with a rather long descriptive name", 1.25 + j % 10, 1 + j % 4)
+            for j in range(products_per_receipt)
+        ]
+        total = sum(product.price * product.quantity for product in products)
+        batch.append((ReceiptFields(total, "card", total, 0.0, now + timedelta(minutes=i)), products))
+    return batch
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    products_per_receipt = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    batch = make_batch(count, products_per_receipt)
+
+    expected = render_receipts_text("Bench User", batch, LINE_LENGTH)
+    inline_ms = timeit(lambda: render_receipts_text("Bench User", batch, LINE_LENGTH), 5)
+    rows = [["inline", inline_ms, 1.0]]
+
+    settings.RENDER_POOL_MIN_BATCH = 1
+    workers = 1
+    while True:
+        settings.RENDER_POOL_WORKERS = workers
+        try:
+            # The first run starts the workers; only warm runs are timed.
+            assert list(render_pool.render_many("Bench User", batch, LINE_LENGTH)) == expected
+            pool_ms = timeit(lambda: list(render_pool.render_many("Bench User", batch, LINE_LENGTH)), 5)
+        finally:
+            render_pool.shutdown()
+        rows.append([f"pool x{workers}", pool_ms, inline_ms / pool_ms])
+        if workers >= (os.cpu_count() or 1):
+            break
+        workers = min(workers * 2, os.cpu_count() or 1)
+
+    print_table(
+        f"rendering {count} receipts of {products_per_receipt} products (best of N, ms)",
+        ["renderer", "ms", "speedup"],
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
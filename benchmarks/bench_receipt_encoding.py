@@ -0,0 +1,70 @@
+"""Compare FastAPI's response_model serialization with FastJSONResponse.
+
+Usage:
+    python -m benchmarks.bench_receipt_encoding
+"""
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.main.encoders import FastJSONResponse
+from app.schemas.receipt import ReceiptPartialResponse
+from benchmarks.common import timeit, print_table
+
+
+RECEIPT_COUNTS = [10, 100, 1000]
+PRODUCTS_PER_RECEIPT = 5
+
+receipts_adapter = TypeAdapter(List[ReceiptPartialResponse])
+
+
+def make_receipts(count: int) -> List[dict]:
+    now = datetime(2024, 9, 1, 13, 12, 23, 560801)
+    return [
+        {
+            "id": i,
+            "created_at": now + timedelta(minutes=i),
+            "total": 12.5 * PRODUCTS_PER_RECEIPT,
+            "payment_type": "cash",
+            "payment_amount": 100.0,
+            "rest": 100.0 - 12.5 * PRODUCTS_PER_RECEIPT,
+            "products": [
+                {"name": f"Product {j}", "price": 6.25, "quantity": 2} for j in range(PRODUCTS_PER_RECEIPT)
+            ]
+        }
+        for i in range(count)
+    ]
+
+
+def response_model_path(receipts: List[dict]) -> bytes:
+    validated = receipts_adapter.validate_python(receipts)
+    return JSONResponse(jsonable_encoder(validated, exclude_unset=True)).body
+
+
+def fast_path(receipts: List[dict]) -> bytes:
+    return FastJSONResponse(receipts).body
+
+
+def main():
+    rows = []
+    for count in RECEIPT_COUNTS:
+        receipts = make_receipts(count)
+        assert response_model_path(receipts) == fast_path(receipts)
+
+        repeat = 200 if count < 1000 else 30
+        legacy_ms = timeit(lambda: response_model_path(receipts), repeat)
+        fast_ms = timeit(lambda: fast_path(receipts), repeat)
+        rows.append([count, legacy_ms, fast_ms, legacy_ms / fast_ms])
+
+    print_table(
+        f"receipt list encoding, {PRODUCTS_PER_RECEIPT} products each (best of N, ms)",
+        ["receipts", "response_model", "fast", "speedup"],
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare ORM hydration with the Core/ReceiptRow read path on large listings.
+
+Usage:
+    python -m benchmarks.bench_receipt_read_memory
+"""
+import gc
+import time
+import tracemalloc
+
+from sqlalchemy.orm import joinedload
+
+from app.crud.receipt import crud_receipt
+from app.models.product import Product
+from app.models.receipt import Receipt
+from app.schemas.receipt import ReceiptFilterParams, PaginationParams
+from benchmarks.common import BenchSessionLocal, reset_database, print_table
+
+
+RECEIPT_COUNT = 5000
+PRODUCTS_PER_RECEIPT = 5
+PAGE_SIZES = [100, 1000, 5000]
+
+
+def seed(user_id: int):
+    with BenchSessionLocal() as db:
+        receipts = db.execute(
+            Receipt.__table__.insert().returning(Receipt.id, Receipt.created_at, sort_by_parameter_order=True),
+            [
+                {"user_id": user_id, "total": 10.0, "payment_type": "cash", "payment_amount": 10.0, "rest": 0.0}
+                for _ in range(RECEIPT_COUNT)
+            ]
+        ).all()
+        db.execute(
+            Product.__table__.insert(),
+            [
+                {"name": f"Product {j}", "price": 1.0, "quantity": 2,
+                 "receipt_id": receipt.id, "receipt_created_at": receipt.created_at}
+                for receipt in receipts
+                for j in range(PRODUCTS_PER_RECEIPT)
+            ]
+        )
+        db.commit()
+
+
+def orm_read(db, user_id: int, page_size: int):
+    return db.query(Receipt).filter(Receipt.user_id == user_id) \
+        .options(joinedload(Receipt.products)) \
+        .order_by(Receipt.created_at, Receipt.id) \
+        .limit(page_size) \
+        .all()
+
+
+def row_read(db, user_id: int, page_size: int):
+    return crud_receipt.get_receipts(db, user_id, ReceiptFilterParams(), PaginationParams(page_size=page_size))[0]
+
+
+def measure(read, user_id: int, page_size: int):
+    with BenchSessionLocal() as db:
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = read(db, user_id, page_size)
+        elapsed = time.perf_counter() - start
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(result) == page_size
+    return elapsed * 1000, retained / 1024, peak / 1024
+
+
+def main():
+    user = reset_database()
+    seed(user.id)
+
+    rows = []
+    for page_size in PAGE_SIZES:
+        orm_ms, orm_kib, orm_peak = measure(orm_read, user.id, page_size)
+        row_ms, row_kib, row_peak = measure(row_read, user.id, page_size)
+        rows.append([page_size, orm_ms, row_ms, orm_kib, row_kib, orm_peak, row_peak])
+
+    print_table(
+        f"receipt listing with {PRODUCTS_PER_RECEIPT} products each (ms, KiB retained, KiB peak)",
+        ["page_size", "orm ms", "rows ms", "orm KiB", "rows KiB", "orm peak", "rows peak"],
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compare the legacy concatenating receipt renderer with app.main.render, and time every layout.
+
+Usage:
+    python -m benchmarks.bench_receipt_render
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List
+
+from app.crud.receipt import ProductRow
+from app.main.render import LAYOUTS, render_receipt, render_receipt_text
+from app.main.utils import wrap_text
+from benchmarks.common import timeit, print_table
+
+
+PRODUCT_COUNTS = [10, 1000, 100000]
+LINE_LENGTH = 40
+
+
+def legacy_render(username: str, receipt, receipts_products: List, line_length: int) -> str:
+    """The renderer as it was in CRUDReceipt.get_public_receipt."""
+    username_padding = (line_length - len(username)) // 2
+    receipt_text = " " * username_padding + username + "\n"
+    receipt_text += "=" * line_length + "\n"
+
+    for i, product in enumerate(receipts_products):
+        total = product.quantity * product.price
+        name = product.name
+
+        receipt_text += f"{product.quantity:.2f} x {product.price:.2f}\n"
+
+        if len(name) > line_length // 2:
+            name_lines = wrap_text(name, line_length // 2)
+        else:
+            name_lines = [name]
+
+        for j, name_line in enumerate(name_lines):
+            if j == len(name_lines) - 1:
+                line = f"{name_line}" + " " * (line_length - len(name_line) - len(f"{total:.2f}")) + f"{total:.2f}"
+            else:
+                line = f"{name_line}" + " " * (line_length - len(name_line))
+
+            receipt_text += line + "\n"
+
+        if i != len(receipts_products) - 1:
+            receipt_text += "-" * line_length + "\n"
+    receipt_text += "=" * line_length + "\n"
+    receipt_text += "Total:" + (line_length - 6 - len(f"{receipt.total:.2f}")) * " " + f"{receipt.total:.2f}\n"
+    receipt_text += "Payment type:" + (line_length - 13 - len(f"{receipt.payment_type}")) * " " + f"{receipt.payment_type}\n"
+    receipt_text += "Payment amount:" + (line_length - 15 - len(f"{receipt.payment_amount}")) * " " + f"{receipt.payment_amount}\n"
+    receipt_text += "Rest:" + (line_length - 5 - len(f"{receipt.rest:.2f}")) * " " + f"{receipt.rest:.2f}\n"
+    receipt_text += "=" * line_length + "\n"
+
+    date_str = receipt.created_at.strftime('%d.%m.%Y %H:%M')
+    date_padding = (line_length - len(date_str)) // 2
+    receipt_text += " " * date_padding + date_str + "\n"
+
+    thank_you_message = "Thank you for your purchase!"
+    thank_you_padding = (line_length - len(thank_you_message)) // 2
+    receipt_text += " " * thank_you_padding + thank_you_message + "\n"
+
+    return receipt_text
+
+
+def make_receipt(count: int):
+    # Every third name is long enough to wrap, and every seventh has no space to wrap at.
+    products = [
+        ProductRow(
+            f"Product {i} with a rather long descriptive name" if i % 3 == 0
+            else f"Unbreakable{'x' * 30}{i}" if i % 7 == 0
+            else f"Product {i}",
+            1.25 + i % 10, 1 + i % 4
+        )
+        for i in range(count)
+    ]
+    total = sum(product.price * product.quantity for product in products)
+    receipt = SimpleNamespace(
+        total=total, payment_type="card", payment_amount=round(total, 2), rest=0.0,
+        created_at=datetime(2024, 9, 1, 13, 12, 23)
+    )
+    return receipt, products
+
+
+def main():
+    rows = []
+    for count in PRODUCT_COUNTS:
+        receipt, products = make_receipt(count)
+        assert legacy_render("Bench User", receipt, products, LINE_LENGTH) == \
+            render_receipt_text("Bench User", receipt, products, LINE_LENGTH)
+
+        repeat = 200 if count < 1000 else 20 if count < 100000 else 3
+        legacy_ms = timeit(lambda: legacy_render("Bench User", receipt, products, LINE_LENGTH), repeat)
+        engine_ms = timeit(lambda: render_receipt_text("Bench User", receipt, products, LINE_LENGTH), repeat)
+        rows.append([count, legacy_ms, engine_ms, legacy_ms / engine_ms])
+
+    print_table(
+        f"public receipt rendering, line_length={LINE_LENGTH} (best of N, ms)",
+        ["products", "legacy", "engine", "speedup"],
+        rows
+    )
+
+    rows = []
+    for count in PRODUCT_COUNTS:
+        receipt, products = make_receipt(count)
+        repeat = 200 if count < 1000 else 20 if count < 100000 else 3
+        rows.append([count] + [
+            timeit(lambda: render_receipt(output_format, "Bench User", receipt, products, LINE_LENGTH), repeat)
+            for output_format in LAYOUTS
+        ])
+
+    print_table(f"rendering per format, line_length={LINE_LENGTH} (best of N, ms)", ["products", *LAYOUTS], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Measure product_name search latency on a large products table.
+
+On Postgres the search should be served by the pg_trgm GIN index
+(ix_products_name_trgm); on SQLite it falls back to scanning each of the
+user's receipts through the receipt_id index.
+
+Usage:
+    python -m benchmarks.bench_receipt_search [product_count]
+"""
+import random
+import sys
+
+from app.crud.receipt import crud_receipt
+from app.models.product import Product
+from app.models.receipt import Receipt
+from app.schemas.receipt import ReceiptFilterParams, PaginationParams, CursorParams
+from benchmarks.common import BenchSessionLocal, engine, reset_database, timeit, print_table
+
+
+PRODUCT_COUNT = 200_000
+PRODUCTS_PER_RECEIPT = 5
+INSERT_CHUNK_SIZE = 10_000
+WORDS = ["latte", "croissant", "bagel", "sandwich", "water", "juice", "muffin", "salad", "soup", "cookie"]
+RARE_NAME = "Single origin espresso"
+SEARCHES = [
+    ("common", "latte"),
+    ("rare", "espresso"),
+    ("missing", "kombucha"),
+]
+
+
+def seed(user_id: int, product_count: int):
+    rng = random.Random(42)
+    receipt_count = product_count // PRODUCTS_PER_RECEIPT
+
+    with BenchSessionLocal() as db:
+        for start in range(0, receipt_count, INSERT_CHUNK_SIZE):
+            size = min(INSERT_CHUNK_SIZE, receipt_count - start)
+            receipts = db.execute(
+                Receipt.__table__.insert().returning(Receipt.id, Receipt.created_at, sort_by_parameter_order=True),
+                [
+                    {"user_id": user_id, "total": 10.0, "payment_type": "cash", "payment_amount": 10.0, "rest": 0.0}
+                    for _ in range(size)
+                ]
+            ).all()
+            db.execute(
+                Product.__table__.insert(),
+                [
+                    {
+                        # Roughly one receipt in a thousand contains the rare product.
+                        "name": RARE_NAME if rng.random() < 0.001 / PRODUCTS_PER_RECEIPT
+                        else f"{rng.choice(WORDS).title()} {rng.choice(WORDS)}",
+                        "price": 2.0,
+                        "quantity": 1,
+                        "receipt_id": receipt.id,
+                        "receipt_created_at": receipt.created_at
+                    }
+                    for receipt in receipts
+                    for _ in range(PRODUCTS_PER_RECEIPT)
+                ]
+            )
+            db.commit()
+
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            connection.exec_driver_sql("ANALYZE receipts")
+            connection.exec_driver_sql("ANALYZE products")
+
+
+def main():
+    product_count = int(sys.argv[1]) if len(sys.argv) > 1 else PRODUCT_COUNT
+
+    user = reset_database()
+    seed(user.id, product_count)
+
+    rows = []
+    with BenchSessionLocal() as db:
+        for label, term in SEARCHES:
+            filters = ReceiptFilterParams(product_name=term)
+            pagination = PaginationParams(page_size=20)
+            row = [label]
+            for order_by in ["created_at", "relevance"]:
+                cursor_params = CursorParams(order_by=order_by)
+                row.append(timeit(
+                    lambda: crud_receipt.get_receipts(db, user.id, filters, pagination, cursor_params), repeat=5
+                ))
+            rows.append(row)
+
+    print_table(
+        f"product_name search, first page of 20 ({product_count} products, {engine.dialect.name}, best of 5 ms)",
+        ["term", "created_at ms", "relevance ms"],
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base_class import Base
+from app.main.config import settings
+from app.main.security import hash_password
+from app.models.receipt import Receipt
+from app.models.user import User
+from app.models.product import Product
+
+
+engine = create_engine(settings.SQLALCHEMY_TEST_DATABASE_URL, pool_pre_ping=True)
+BenchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def reset_database() -> User:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    with BenchSessionLocal() as db:
+        user = User(username="bench", name="Bench User", hashed_password=hash_password("password"))
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+    return user
+
+
+def timeit(func, repeat: int) -> float:
+    """Best wall-clock time of `repeat` calls, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def print_table(title: str, header: list, rows: list):
+    print(title)
+    print(" | ".join(f"{column:>14}" for column in header))
+    for row in rows:
+        print(" | ".join(f"{value:>14.3f}" if isinstance(value, float) else f"{value:>14}" for value in row))
+    print()